@@ -4,10 +4,11 @@ from django.utils.http import urlsafe_base64_encode
 from django.contrib import auth
 from django.template import loader
 from django.conf import settings
+from django.db import transaction
 
 
 from biostar.emailer.tasks import send_email
-from .models import User, Profile
+from .models import User, Profile, Message, Broadcast
 from .tokens import account_verification_token
 
 logger = logging.getLogger('engine')
@@ -60,3 +61,34 @@ def send_verification_email(user):
 
     return True
 
+
+
+def deliver_broadcasts(user):
+    """
+    Creates the messages of the broadcasts sent to the user since the last delivery.
+    Returns the number of messages created.
+    """
+    mark = Profile.objects.filter(user=user).values_list('broadcast_mark', flat=True).first() or 0
+    last = Broadcast.objects.filter(pk__gt=mark).order_by('-pk').values_list('pk', flat=True).first()
+    if not last:
+        return 0
+
+    # The mark moves only with the messages, a failure leaves both unchanged.
+    with transaction.atomic():
+        # Concurrent requests deliver each broadcast once, the mark moves only for one of them.
+        if not Profile.objects.filter(user=user, broadcast_mark=mark).update(broadcast_mark=last):
+            return 0
+
+        broadcasts = Broadcast.objects.filter(pk__gt=mark, pk__lte=last).order_by('pk')
+        broadcasts = [b for b in broadcasts if user.pk in b.recipients]
+        if not broadcasts:
+            return 0
+
+        # Broadcasts already delivered are skipped.
+        delivered = set(Message.objects.filter(recipient=user, body__in=[b.body_id for b in broadcasts])
+                        .values_list('body_id', flat=True))
+        msgs = [Message(sender_id=b.sender_id, recipient=user, body_id=b.body_id, sent_date=b.sent_date)
+                for b in broadcasts if b.body_id not in delivered]
+        Message.objects.bulk_create(msgs)
+
+    return len(msgs)
@@ -13,6 +13,7 @@ from snowpenguin.django.recaptcha2.fields import ReCaptchaField
 from snowpenguin.django.recaptcha2.widgets import ReCaptchaWidget
 
 from .models import Profile, UserImage
+from .signals import profile_edited
 
 logger = logging.getLogger("engine")
 
@@ -268,7 +269,10 @@ class EditProfile(forms.Form):
             message_prefs=self.cleaned_data["message_prefs"],
             digest_prefs=self.cleaned_data['digest_prefs'])
         # Recompute watched tags
-        Profile.objects.filter(user=self.user).first().add_watched()
+        profile = Profile.objects.filter(user=self.user).first()
+        profile.add_watched()
+
+        profile_edited.send(sender=Profile, profile=profile)
 
 
 class LoginForm(forms.Form):
@@ -0,0 +1,70 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from biostar.accounts import util
+from biostar.accounts.models import TaskStat
+from biostar.utils import taskstats
+
+logger = logging.getLogger("engine")
+
+
+def collect(days):
+    """
+    Returns the statistics of the tasks run in the last days, keyed by name.
+    """
+    since = util.now() - timedelta(days=days)
+    stats = {}
+    for stat in TaskStat.objects.filter(date__gte=since).iterator():
+        item = stats.setdefault(stat.name, dict(name=stat.name, count=0, failed=0, total=0, longest=0, wait=0,
+                                                hist=[0] * (len(taskstats.BUCKETS) + 1)))
+        item['count'] += stat.count
+        item['failed'] += stat.failed
+        item['total'] += stat.total
+        item['longest'] = max(item['longest'], stat.longest)
+        item['wait'] += stat.wait
+        hist = json.loads(stat.hist) if stat.hist else []
+        item['hist'] = [a + b for a, b in zip(item['hist'], hist)] if hist else item['hist']
+
+    return list(stats.values())
+
+
+class Command(BaseCommand):
+    help = "Prints the slowest or most failing tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="Include the runs of the last days.")
+        parser.add_argument('--top', type=int, default=10, help="How many tasks to print.")
+        parser.add_argument('--sort', type=str, default='slow', choices=['slow', 'failed', 'count'],
+                            help="Sort by average duration, failures or number of runs.")
+        parser.add_argument('--prune', action='store_true', default=False,
+                            help="Delete the statistics older than --days.")
+
+    def handle(self, *args, **options):
+        days = options['days']
+
+        # Write the statistics of this process first.
+        taskstats.flush()
+
+        if options['prune']:
+            count, _ = TaskStat.objects.filter(date__lt=util.now() - timedelta(days=days)).delete()
+            logger.info(f"deleted {count} task statistics")
+            return
+
+        keys = dict(
+            slow=lambda item: item['total'] / item['count'],
+            failed=lambda item: (item['failed'], item['failed'] / item['count']),
+            count=lambda item: item['count'],
+        )
+
+        stats = collect(days=days)
+        stats = sorted(stats, key=keys[options['sort']], reverse=True)[:options['top']]
+
+        print(f"{'task':50} {'runs':>8} {'failed':>8} {'avg':>8} {'p95':>8} {'max':>8} {'wait':>8}")
+        for item in stats:
+            count = item['count']
+            p95 = taskstats.percentile(item['hist'], 0.95)
+            print(f"{item['name'][-50:]:50} {count:>8} {item['failed']:>8} {item['total'] / count:>7.2f}s "
+                  f"{'<' + str(p95) + 's':>8} {item['longest']:>7.2f}s {item['wait'] / count:>7.2f}s")
@@ -0,0 +1,102 @@
+import logging
+import signal
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from biostar.utils import dbqueue, taskstats
+
+logger = logging.getLogger("engine")
+
+
+def run(task):
+    try:
+        dbqueue.process(task)
+        taskstats.flush_due()
+    except Exception as exc:
+        logger.error(f"worker error for task {task.name}: {exc}")
+    finally:
+        # Each worker thread has its own connection.
+        connections.close_all()
+
+
+def run_once(limit):
+    """
+    Runs the due tasks in the current thread until none are left.
+    """
+    total = 0
+    while True:
+        tasks = dbqueue.claim(limit=limit)
+        if not tasks:
+            break
+        for task in tasks:
+            dbqueue.process(task)
+        taskstats.flush_due()
+        total += len(tasks)
+    return total
+
+
+def run_forever(concurrency, poll):
+    """
+    Claims the due tasks as worker threads become free, stops on SIGINT or SIGTERM.
+    """
+    stop = threading.Event()
+
+    def shutdown(signum, frame):
+        logger.info("worker stopping, waiting for the running tasks")
+        stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    pool = futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="worker")
+    running = set()
+
+    while not stop.is_set():
+        running = {job for job in running if not job.done()}
+        free = concurrency - len(running)
+
+        tasks = dbqueue.claim(limit=free) if free else []
+        for task in tasks:
+            running.add(pool.submit(run, task))
+
+        if len(running) >= concurrency:
+            # Wait for a worker to become free.
+            futures.wait(running, timeout=poll, return_when=futures.FIRST_COMPLETED)
+        elif not tasks:
+            # Nothing is due yet.
+            stop.wait(poll)
+
+    pool.shutdown(wait=True)
+
+
+class Command(BaseCommand):
+    help = "Runs the tasks stored in the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Number of tasks to run at the same time.")
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Run the tasks that are due then exit.")
+        parser.add_argument('--requeue', action='store_true', default=False, help="Put the dead tasks back in the queue.")
+
+    def handle(self, *args, **options):
+
+        concurrency = max(1, options['concurrency'])
+
+        if options['requeue']:
+            count = dbqueue.requeue()
+            logger.info(f"requeued {count} dead tasks")
+            return
+
+        if options['once']:
+            start = time.time()
+            count = run_once(limit=concurrency)
+            logger.info(f"ran {count} tasks in {time.time() - start:.1f} seconds")
+            return
+
+        logger.info(f"worker started with concurrency={concurrency}")
+        run_forever(concurrency=concurrency, poll=settings.TASK_QUEUE_POLL)
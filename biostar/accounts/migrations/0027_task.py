@@ -0,0 +1,29 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0026_userlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.IntegerField(choices=[(0, 'Queued'), (1, 'Running'), (2, 'Dead')], db_index=True, default=0)),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('data', models.TextField(default='')),
+                ('run_at', models.DateTimeField(db_index=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('timeout', models.IntegerField(default=0)),
+                ('owner', models.CharField(blank=True, default='', max_length=255)),
+                ('lease', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField()),
+            ],
+        ),
+    ]
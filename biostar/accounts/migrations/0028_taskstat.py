@@ -0,0 +1,27 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0027_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('count', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('longest', models.FloatField(default=0)),
+                ('wait', models.FloatField(default=0)),
+                ('hist', models.CharField(default='', max_length=255)),
+                ('date', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
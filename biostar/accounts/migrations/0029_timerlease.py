@@ -0,0 +1,27 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0028_taskstat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimerLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('owner', models.CharField(blank=True, default='', max_length=255)),
+                ('lease', models.DateTimeField(blank=True, null=True)),
+                ('last_start', models.DateTimeField(blank=True, null=True)),
+                ('last_end', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('runs', models.IntegerField(default=0)),
+                ('failures', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_watchers(apps, schema_editor):
+
+    Profile = apps.get_model('accounts', 'Profile')
+    WatchedTag = apps.get_model('accounts', 'WatchedTag')
+    profiles = Profile.objects.exclude(watched_tags='').select_related('user')
+
+    rows = []
+    for pro in profiles.iterator():
+        # Build the index from the watched tags of each profile.
+        names = {tag.strip().lower() for tag in pro.watched_tags.split(",") if tag.strip()}
+        rows.extend(WatchedTag(name=name, user=pro.user, email=pro.user.email, message_prefs=pro.message_prefs)
+                    for name in names)
+
+    WatchedTag.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0029_timerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchedTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('email', models.CharField(default='', max_length=255)),
+                ('message_prefs', models.IntegerField(choices=[(3, 'Default'), (1, 'Email'), (0, 'Local Messages'), (2, 'No messages')], default=3)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('name', 'user')},
+            },
+        ),
+        migrations.RunPython(index_watchers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0030_watchedtag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField(default=b'')),
+                ('count', models.IntegerField(default=0)),
+                ('sent_date', models.DateTimeField(db_index=True)),
+                ('body', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.messagebody')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
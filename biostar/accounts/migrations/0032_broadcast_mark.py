@@ -0,0 +1,27 @@
+# Generated by Django 3.2.15 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+def set_marks(apps, schema_editor):
+    # Broadcasts sent before were delivered by the last login.
+    Broadcast = apps.get_model('accounts', 'Broadcast')
+    Profile = apps.get_model('accounts', 'Profile')
+    mark = Broadcast.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    Profile.objects.update(broadcast_mark=mark)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0031_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='broadcast_mark',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(set_marks, migrations.RunPython.noop),
+    ]
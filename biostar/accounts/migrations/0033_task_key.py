@@ -0,0 +1,22 @@
+# Generated by Django 3.2.15 on 2026-10-19 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0032_broadcast_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 0), models.Q(('key', ''), _negated=True)), fields=('name', 'key'), name='unique_queued_key'),
+        ),
+    ]
@@ -1,14 +1,17 @@
 import os
+import zlib
+import hashlib
 import logging
 import mistune
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.shortcuts import reverse
 from taggit.managers import TaggableManager
-from taggit.models import Tag
 
 from biostar.accounts import util
+from biostar.utils.tags import set_tags
 
 logger = logging.getLogger("engine")
 
@@ -165,6 +168,9 @@ class Profile(models.Model):
     ]
     user_icon = models.CharField(default=DEFAULT_ICON, choices=USER_ICON_CHOICES, max_length=100)
 
+    # The last broadcast delivered to the user.
+    broadcast_mark = models.IntegerField(default=0)
+
     objects = ProfileManager()
 
     def __str__(self):
@@ -202,9 +208,8 @@ class Profile(models.Model):
 
     def add_watched(self):
         try:
-            tags = [Tag.objects.get_or_create(name=name)[0] for name in self.parse_tags()]
-            self.watched.clear()
-            self.watched.add(*tags)
+            set_tags(self, self.parse_tags(), field="watched")
+            index_watchers(self)
         except Exception as exc:
             logger.error(f"recomputing watched tags={exc}")
 
@@ -421,3 +426,201 @@ class Message(models.Model):
     @property
     def uid(self):
         return self.pk
+
+
+class Task(models.Model):
+    """
+    A task call waiting in the database queue.
+    """
+    QUEUED, RUNNING, DEAD = range(3)
+    STATE_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DEAD, "Dead")]
+    state = models.IntegerField(choices=STATE_CHOICES, default=QUEUED, db_index=True)
+
+    # The dotted path to the task function.
+    name = models.CharField(max_length=MAX_NAME_LEN, db_index=True)
+
+    # The JSON encoded arguments.
+    data = models.TextField(default='')
+
+    # The task is not run before this date.
+    run_at = models.DateTimeField(db_index=True)
+
+    # How many times the task has been tried.
+    attempts = models.IntegerField(default=0)
+
+    # Seconds the task may run, zero runs without a limit.
+    timeout = models.IntegerField(default=0)
+
+    # The worker that claimed the task and the date the claim expires.
+    owner = models.CharField(max_length=MAX_NAME_LEN, default='', blank=True)
+    lease = models.DateTimeField(null=True, blank=True)
+
+    # The last error raised by the task.
+    error = models.TextField(default='', blank=True)
+
+    # Calls with the same key wait in a single row until it runs.
+    key = models.CharField(max_length=MAX_NAME_LEN, default='', blank=True)
+
+    # Date the task was queued.
+    created = models.DateTimeField()
+
+    class Meta:
+        # One queued row per key, state 0 is QUEUED.
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'key'], condition=models.Q(state=0) & ~models.Q(key=''),
+                                    name='unique_queued_key'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.created = self.created or util.now()
+        self.run_at = self.run_at or self.created
+        super(Task, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Task {self.name}, {self.get_state_display()}"
+
+
+class TaskStat(models.Model):
+    """
+    Task run statistics collected by a process since its last flush.
+    """
+    # The dotted path to the task function.
+    name = models.CharField(max_length=MAX_NAME_LEN, db_index=True)
+
+    # Number of runs and failed runs.
+    count = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+
+    # Total and longest run time, in seconds.
+    total = models.FloatField(default=0)
+    longest = models.FloatField(default=0)
+
+    # Total time the runs waited to start, in seconds.
+    wait = models.FloatField(default=0)
+
+    # The JSON encoded counts of runs per duration bucket.
+    hist = models.CharField(max_length=MAX_NAME_LEN, default='')
+
+    # Date the statistics were flushed.
+    date = models.DateTimeField(db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.date = self.date or util.now()
+        super(TaskStat, self).save(*args, **kwargs)
+
+
+class TimerLease(models.Model):
+    """
+    Ensures that a periodic timer runs in one process at a time across the deployment.
+    """
+    # The dotted path to the timer function.
+    name = models.CharField(max_length=MAX_NAME_LEN, unique=True)
+
+    # The process running the timer and the date its claim expires.
+    owner = models.CharField(max_length=MAX_NAME_LEN, default='', blank=True)
+    lease = models.DateTimeField(null=True, blank=True)
+
+    # Bookkeeping for the last run.
+    last_start = models.DateTimeField(null=True, blank=True)
+    last_end = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(default='', blank=True)
+
+    # Number of runs and failed runs.
+    runs = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Timer {self.name}"
+
+
+class WatchedTag(models.Model):
+    """
+    Inverted index of the watched tags, one row per tag and user.
+    """
+    # The lowercase tag name.
+    name = models.CharField(max_length=MAX_NAME_LEN)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    # Copied from the user and the profile, the watchers are selected without joins.
+    email = models.CharField(max_length=MAX_NAME_LEN, default='')
+    message_prefs = models.IntegerField(choices=Profile.MESSAGING_TYPE_CHOICES, default=Profile.DEFAULT_MESSAGES)
+
+    class Meta:
+        unique_together = (("name", "user"),)
+
+
+def watcher_key(name):
+    # Tag names may not be valid cache keys.
+    return f"watchers-{hashlib.md5(name.encode('utf-8')).hexdigest()}"
+
+
+def index_watchers(profile):
+    """
+    Rebuilds the watched tag index of a profile.
+    """
+    user = profile.user
+    names = {name.strip() for name in profile.parse_tags() if name.strip()}
+    rows = WatchedTag.objects.filter(user=user)
+    old = set(rows.values_list("name", flat=True))
+
+    with transaction.atomic():
+        rows.delete()
+        WatchedTag.objects.bulk_create([WatchedTag(name=name, user=user, email=user.email,
+                                                   message_prefs=profile.message_prefs) for name in names])
+
+    # Drop the cached watchers of the tags that changed.
+    cache.delete_many([watcher_key(name) for name in old | names])
+
+
+def get_watchers(names):
+    """
+    Returns a dictionary keyed by lowercase tag name with the (user_id, email, message_prefs) of the watchers.
+    """
+    names = {name.strip().lower() for name in names if name.strip()}
+    keys = {watcher_key(name): name for name in names}
+
+    found = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    missing = names - set(found)
+
+    if missing:
+        fetched = {name: [] for name in missing}
+        rows = WatchedTag.objects.filter(name__in=missing)
+        for name, user_id, email, prefs in rows.values_list("name", "user_id", "email", "message_prefs"):
+            fetched[name].append((user_id, email, prefs))
+        cache.set_many({watcher_key(name): value for name, value in fetched.items()},
+                       timeout=settings.WATCHER_CACHE_TTL)
+        found.update(fetched)
+
+    return found
+
+
+class Broadcast(models.Model):
+    """
+    A message to many recipients stored once, each recipient gets a Message on the next visit.
+    """
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    body = models.ForeignKey(MessageBody, on_delete=models.CASCADE)
+
+    # The compressed, comma separated recipient ids.
+    data = models.BinaryField(default=b'')
+
+    # The number of recipients.
+    count = models.IntegerField(default=0)
+
+    sent_date = models.DateTimeField(db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.sent_date = self.sent_date or util.now()
+        super(Broadcast, self).save(*args, **kwargs)
+
+    @property
+    def recipients(self):
+        text = zlib.decompress(self.data).decode() if self.data else ''
+        return {int(uid) for uid in text.split(",") if uid}
+
+    @recipients.setter
+    def recipients(self, ids):
+        ids = sorted(set(ids))
+        self.count = len(ids)
+        self.data = zlib.compress(",".join(map(str, ids)).encode())
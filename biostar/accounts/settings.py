@@ -61,6 +61,12 @@ ADMIN_UPLOAD_SIZE = 1000
 
 MESSAGES_PER_PAGE = 5
 
+# Number of messages inserted per query.
+MESSAGE_BATCH_SIZE = 1000
+
+# Messages to more recipients are stored as one broadcast, delivered on the next visit of each recipient.
+MESSAGE_BROADCAST_SIZE = 5000
+
 
 # Additional middleware.
 MIDDLEWARE += [
@@ -122,6 +128,9 @@ ACCOUNTS_APPS = [
 # Should the server look up locations in a task.
 LOCATION_LOOKUP = True
 
+# Seconds to cache the watchers of a tag.
+WATCHER_CACHE_TTL = 300
+
 INSTALLED_APPS = DEFAULT_APPS + ACCOUNTS_APPS + EMAILER_APP + PAGEDOWN_APP
 
 AUTHENTICATION_BACKENDS += ["allauth.account.auth_backends.AuthenticationBackend"]
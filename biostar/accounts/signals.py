@@ -1,13 +1,16 @@
 import logging
 
 from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
 
-from biostar.accounts.models import Profile, User
+from biostar.accounts.models import Profile, User, Broadcast
 from biostar.accounts import util, tasks
 
 logger = logging.getLogger("engine")
 
+# Sent with the profile when it is edited, the edits are saved with updates.
+profile_edited = Signal()
+
 @receiver(pre_save, sender=User)
 def create_uuid(sender, instance, *args, **kwargs):
     # Generate a unique username if it does not exist.
@@ -34,9 +37,12 @@ def create_profile(sender, instance, created, raw, using, **kwargs):
             else Profile.READER
         )
 
+        # Broadcasts sent before the user joined are not for the user.
+        mark = Broadcast.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
         # Create a user profile associate with the user.
         Profile.objects.create(
-            user=instance, uid=username, name=instance.first_name, role=role
+            user=instance, uid=username, name=instance.first_name, role=role, broadcast_mark=mark
         )
 
         try:
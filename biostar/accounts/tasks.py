@@ -8,6 +8,7 @@ import mistune
 from django.conf import settings
 from django.template import loader
 from biostar.utils.decorators import task
+from biostar.accounts import util
 
 
 #
@@ -90,13 +91,13 @@ def verification_email(user_id):
 
 
 @task
-def create_messages(template, user_ids, sender=None, extra_context={}):
+def create_messages(template, user_ids, sender=None, extra_context={}, broadcast=False):
     """
-    Create batch message from sender to a given recipient_list
+    Create batch message from sender to a given recipient_list.
+    With broadcast=True the recipients are stored in a single row.
     """
-    from biostar.accounts.models import User, Message, MessageBody
+    from biostar.accounts.models import User, Message, MessageBody, Broadcast
 
-    rec_list = User.objects.filter(id__in=user_ids)
     # Get the sender
     name, email = settings.ADMINS[0]
     sender = sender or User.objects.filter(email=email).first() or User.objects.filter(is_superuser=True).first()
@@ -111,5 +112,17 @@ def create_messages(template, user_ids, sender=None, extra_context={}):
     html = mistune.markdown(body, escape=False)
     body = MessageBody.objects.create(body=body, html=html)
 
-    for rec in rec_list:
-        Message.objects.create(sender=sender, recipient=rec, body=body)
+    user_ids = list(user_ids)
+    size = settings.MESSAGE_BATCH_SIZE
+
+    # Large broadcasts are stored once.
+    if broadcast or (settings.MESSAGE_BROADCAST_SIZE and len(user_ids) >= settings.MESSAGE_BROADCAST_SIZE):
+        Broadcast.objects.create(sender=sender, body=body, recipients=user_ids)
+        return
+
+    # Insert the messages in chunks, only for users that exist.
+    sent_date = util.now()
+    for start in range(0, len(user_ids), size):
+        chunk = User.objects.filter(id__in=user_ids[start:start + size]).values_list('id', flat=True)
+        msgs = [Message(sender=sender, recipient_id=uid, body=body, sent_date=sent_date) for uid in chunk.iterator()]
+        Message.objects.bulk_create(msgs, batch_size=size)
@@ -210,3 +210,71 @@ class ProfileTest(TestCase):
         print(message, valid)
 
         self.assertTrue(not valid)
+
+
+class MessageTest(TestCase):
+
+    def setUp(self):
+        self.users = [models.User.objects.create(username=f"user{n}", email=f"user{n}@l.com") for n in range(5)]
+        self.ids = [user.pk for user in self.users]
+
+    @override_settings(MESSAGE_BATCH_SIZE=2)
+    def test_create_messages(self):
+        "Test messages are inserted in chunks"
+        from biostar.accounts import tasks
+
+        with self.assertNumQueries(8):
+            tasks.create_messages(template="messages/welcome.md", user_ids=self.ids + [0])
+
+        body = models.MessageBody.objects.order_by('pk').last()
+        self.assertEqual(set(models.Message.objects.filter(body=body).values_list('recipient', flat=True)),
+                         set(self.ids))
+
+    def test_broadcast(self):
+        "Test broadcasts are stored once and delivered on the next visit"
+        from biostar.accounts import tasks
+
+        tasks.create_messages(template="messages/welcome.md", user_ids=self.ids[:3], broadcast=True)
+
+        broadcast = models.Broadcast.objects.get()
+        self.assertEqual((broadcast.count, broadcast.recipients), (3, set(self.ids[:3])))
+        self.assertFalse(models.Message.objects.filter(body=broadcast.body).exists())
+
+        # Delivered once to each recipient.
+        self.assertEqual(auth.deliver_broadcasts(self.users[0]), 1)
+        self.assertEqual(auth.deliver_broadcasts(self.users[0]), 0)
+        self.assertEqual(auth.deliver_broadcasts(self.users[4]), 0)
+
+        # New users start after the broadcasts already sent.
+        user = models.User.objects.create(username="late", email="late@l.com")
+        self.assertEqual(user.profile.broadcast_mark, broadcast.pk)
+
+    def test_broadcast_failure(self):
+        "Test the mark does not move when the messages are not created"
+        from unittest import mock
+        from biostar.accounts import tasks
+
+        tasks.create_messages(template="messages/welcome.md", user_ids=self.ids[:3], broadcast=True)
+
+        with mock.patch.object(models.Message.objects, 'bulk_create', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                auth.deliver_broadcasts(self.users[0])
+
+        self.assertEqual(models.Profile.objects.get(user=self.users[0]).broadcast_mark, 0)
+        self.assertEqual(auth.deliver_broadcasts(self.users[0]), 1)
+
+    def test_broadcast_login(self):
+        "Test broadcasts sent while a user was away are delivered after a new login"
+        from biostar.accounts import tasks, util
+        from biostar.forum.auth import get_counts
+
+        user = self.users[1]
+        tasks.create_messages(template="messages/welcome.md", user_ids=self.ids[:3], broadcast=True)
+        body = models.Broadcast.objects.get().body
+
+        # Logging in sets the last login after the broadcast was sent.
+        models.Profile.objects.filter(user=user).update(last_login=util.now())
+        user = models.User.objects.get(pk=user.pk)
+        get_counts(user)
+
+        self.assertTrue(models.Message.objects.filter(recipient=user, body=body).exists())
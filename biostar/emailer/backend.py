@@ -21,7 +21,7 @@ class SSLEmailBackend(smtp.EmailBackend):
             return False
         try:
             logger.info("sending email via %s" % self.host)
-            self.connection = smtplib.SMTP_SSL(self.host, self.port,
+            self.connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
                                                local_hostname=DNS_NAME.get_fqdn())
             if self.username and self.password:
                 self.connection.login(self.username, self.password)
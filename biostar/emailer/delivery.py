@@ -0,0 +1,297 @@
+"""
+Delivers emails over a pool of persistent SMTP connections.
+
+Worker threads take the messages from a shared queue and send them over
+connections borrowed from the pool, a connection stays open between
+messages. A token bucket caps the recipients per second across all workers
+to stay within the limits of the email provider. A connection is replaced
+after EMAIL_CONNECTION_LIMIT recipients and reopened when it fails.
+"""
+import atexit
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger("engine")
+
+
+class TokenBucket(object):
+    """
+    Hands out rate tokens per second with bursts of up to capacity tokens.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, count=1):
+        """
+        Takes the tokens and returns zero, otherwise returns the seconds to wait for them.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= count:
+                self.tokens -= count
+                return 0
+            return (count - self.tokens) / self.rate
+
+    def acquire(self, count=1):
+        """
+        Blocks until the tokens are available, a zero rate does not limit.
+        """
+        if not self.rate:
+            return
+
+        # Larger requests would never fit.
+        count = min(count, self.capacity)
+        wait = self.take(count)
+        while wait:
+            time.sleep(wait)
+            wait = self.take(count)
+
+
+class Connection(object):
+    """
+    An open email backend and the recipients sent through it.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.count = 0
+        self.used = time.monotonic()
+
+    def send(self, msg):
+        sent = self.backend.send_messages([msg])
+        self.count += len(msg.recipients())
+        self.used = time.monotonic()
+        return sent
+
+    def close(self):
+        try:
+            self.backend.close()
+        except Exception as exc:
+            logger.debug(f"error closing email connection: {exc}")
+        finally:
+            self.backend.connection = None
+
+
+class ConnectionPool(object):
+    """
+    Keeps the open email connections between sends.
+    """
+
+    def __init__(self, limit=None, idle=None, **kwargs):
+        self.limit = limit or settings.EMAIL_CONNECTION_LIMIT
+        self.idle = settings.EMAIL_CONNECTION_IDLE if idle is None else idle
+        self.kwargs = kwargs
+        self.free = []
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def get(self):
+        """
+        Returns a free connection, opens a new one when none is left.
+        """
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self.lock:
+            while self.free and not conn:
+                conn = self.free.pop()
+                # The server may have dropped connections idle for too long.
+                if now - conn.used > self.idle:
+                    stale.append(conn)
+                    conn = None
+
+        for item in stale:
+            item.close()
+
+        if not conn:
+            backend = get_connection(fail_silently=False, **self.kwargs)
+            backend.open()
+            conn = Connection(backend)
+            with self.lock:
+                self.opened += 1
+
+        return conn
+
+    def put(self, conn):
+        """
+        Returns the connection to the pool, used up connections are closed.
+        """
+        if conn.count >= self.limit:
+            conn.close()
+            return
+        with self.lock:
+            self.free.append(conn)
+
+    def discard(self, conn):
+        if conn:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            free, self.free = self.free, []
+        for conn in free:
+            conn.close()
+
+
+class Report(object):
+    """
+    Counts the outcome of a delivery.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.start = time.monotonic()
+        self.end = None
+        self.lock = threading.Lock()
+
+        # The (message, error) of the failed messages.
+        self.failures = []
+
+    def add(self, sent=0, failed=0, retries=0):
+        with self.lock:
+            self.sent += sent
+            self.failed += failed
+            self.retries += retries
+
+    def fail(self, msg, exc):
+        with self.lock:
+            self.failed += 1
+            self.failures.append((msg, exc))
+
+    @property
+    def elapsed(self):
+        return (self.end or time.monotonic()) - self.start
+
+    @property
+    def rate(self):
+        return self.sent / self.elapsed if self.elapsed else 0
+
+    def __str__(self):
+        return f"sent={self.sent} failed={self.failed} retries={self.retries} " \
+               f"in {self.elapsed:.1f}s ({self.rate:.1f}/s)"
+
+
+# Connection pools for each email backend.
+POOLS = {}
+
+# Limits the sending rate of the process.
+BUCKET = None
+
+LOCK = threading.Lock()
+
+
+def get_pool():
+    key = (settings.EMAIL_BACKEND, getattr(settings, "EMAIL_HOST", ""), getattr(settings, "EMAIL_PORT", ""))
+    with LOCK:
+        if key not in POOLS:
+            POOLS[key] = ConnectionPool()
+        return POOLS[key]
+
+
+def get_bucket():
+    global BUCKET
+    with LOCK:
+        if BUCKET is None or BUCKET.rate != settings.EMAIL_RATE:
+            BUCKET = TokenBucket(rate=settings.EMAIL_RATE)
+        return BUCKET
+
+
+@atexit.register
+def close_pools():
+    for pool in list(POOLS.values()):
+        pool.close()
+
+
+def transient(exc):
+    """
+    Errors that may go away on a new connection or a later attempt.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(exc, smtplib.SMTPResponseException):
+        # Permanent failures have 5xx codes.
+        return exc.smtp_code < 500
+    return isinstance(exc, OSError)
+
+
+def send(msg, pool, bucket, report, retries):
+    """
+    Sends one message, reconnects and retries on transient errors.
+    """
+    bucket.acquire(len(msg.recipients()))
+
+    for attempt in range(retries + 1):
+        conn = None
+        try:
+            conn = pool.get()
+            conn.send(msg)
+            pool.put(conn)
+            report.add(sent=1)
+            return
+        except Exception as exc:
+            pool.discard(conn)
+            if not transient(exc) or attempt == retries:
+                logger.error(f"email to {msg.to} failed: {exc}")
+                report.fail(msg, exc)
+                return
+            logger.warning(f"email to {msg.to} failed, attempt {attempt + 1}: {exc}")
+            report.add(retries=1)
+            time.sleep(settings.EMAIL_RETRY_DELAY * 2 ** attempt)
+
+
+def deliver(messages, workers=None, rate=None, retries=None, pool=None):
+    """
+    Sends the email messages in parallel, returns a Report.
+    The messages may be a generator, it is consumed as the workers need them.
+    """
+    workers = settings.EMAIL_WORKERS if workers is None else workers
+    retries = settings.EMAIL_RETRIES if retries is None else retries
+    bucket = get_bucket() if rate is None else TokenBucket(rate=rate)
+    pool = pool or get_pool()
+    report = Report()
+
+    if workers <= 1:
+        for msg in messages:
+            send(msg, pool=pool, bucket=bucket, report=report, retries=retries)
+    else:
+        # Bounded, messages are not built far ahead of the workers.
+        items = queue.Queue(maxsize=workers * 2)
+
+        def work():
+            while True:
+                msg = items.get()
+                if msg is None:
+                    return
+                send(msg, pool=pool, bucket=bucket, report=report, retries=retries)
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for msg in messages:
+                items.put(msg)
+        finally:
+            for thread in threads:
+                items.put(None)
+            for thread in threads:
+                thread.join()
+
+    report.end = time.monotonic()
+    logger.info(f"email delivery {report}")
+
+    return report
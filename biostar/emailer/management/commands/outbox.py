@@ -0,0 +1,68 @@
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from biostar.emailer import outbox
+
+logger = logging.getLogger("engine")
+
+
+def run_forever(batch, poll):
+    """
+    Drains the outbox as emails become due, stops on SIGINT or SIGTERM.
+    """
+    stop = threading.Event()
+
+    def shutdown(signum, frame):
+        logger.info("outbox stopping after the current batch")
+        stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while not stop.is_set():
+        rows = outbox.claim(limit=batch)
+        if rows:
+            outbox.send(rows)
+        else:
+            stop.wait(poll)
+
+
+class Command(BaseCommand):
+    help = "Sends the emails stored in the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=settings.EMAIL_OUTBOX_BATCH,
+                            help="Emails sent per batch (default=%(default)s).")
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Send the emails that are due then exit.")
+        parser.add_argument('--retry', action='store_true', default=False,
+                            help="Put the failed emails back in the outbox.")
+        parser.add_argument('--prune', action='store_true', default=False,
+                            help=f"Delete the emails sent more than {settings.EMAIL_OUTBOX_DAYS} days ago.")
+
+    def handle(self, *args, **options):
+        batch = max(1, options['batch'])
+
+        if options['retry']:
+            count = outbox.retry()
+            logger.info(f"requeued {count} failed emails")
+            return
+
+        if options['prune']:
+            count = outbox.prune()
+            logger.info(f"deleted {count} sent emails")
+            return
+
+        if options['once']:
+            start = time.time()
+            sent, failed = outbox.drain(limit=batch)
+            logger.info(f"sent {sent} emails, {failed} failed in {time.time() - start:.1f} seconds")
+            return
+
+        logger.info(f"outbox started with batch={batch}")
+        run_forever(batch=batch, poll=settings.EMAIL_OUTBOX_POLL)
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emailer', '0002_remove'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=256, unique=True)),
+                ('last', models.IntegerField(default=0)),
+                ('done', models.BooleanField(default=False)),
+                ('date', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
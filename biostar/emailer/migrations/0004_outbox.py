@@ -0,0 +1,42 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emailer', '0003_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailContent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=32, unique=True)),
+                ('template', models.CharField(max_length=256)),
+                ('sender', models.CharField(max_length=256)),
+                ('subject', models.CharField(max_length=1024)),
+                ('text', models.TextField(blank=True, default='')),
+                ('html', models.TextField(blank=True, default='')),
+                ('date', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Outbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.IntegerField(choices=[(0, 'Queued'), (1, 'Sending'), (2, 'Sent'), (3, 'Failed')], db_index=True, default=0)),
+                ('recipient', models.CharField(db_index=True, max_length=256)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_try', models.DateTimeField(db_index=True)),
+                ('owner', models.CharField(blank=True, default='', max_length=256)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(db_index=True)),
+                ('sent', models.DateTimeField(blank=True, null=True)),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='emailer.emailcontent')),
+            ],
+        ),
+    ]
@@ -50,3 +50,70 @@ class EmailSubscription(models.Model):
 
     def active(self):
         return self.state == self.ACTIVE
+
+
+class Checkpoint(models.Model):
+    """
+    Progress of a send in batches, the recipients are walked by primary key.
+    """
+    name = models.CharField(max_length=MAX_NAME_LEN, unique=True)
+
+    # The primary key of the last recipient sent to.
+    last = models.IntegerField(default=0)
+
+    # The send went through all recipients.
+    done = models.BooleanField(default=False)
+
+    date = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.name} | {self.last}"
+
+
+class EmailContent(models.Model):
+    """
+    A rendered email, shared by the outbox rows that send it.
+    """
+    # Hash of the sender and the rendered parts.
+    hash = models.CharField(max_length=32, unique=True)
+
+    template = models.CharField(max_length=MAX_NAME_LEN)
+    sender = models.CharField(max_length=MAX_NAME_LEN)
+    subject = models.CharField(max_length=MAX_FIELD_LEN)
+    text = models.TextField(default='', blank=True)
+    html = models.TextField(default='', blank=True)
+
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.template} | {self.subject}"
+
+
+class Outbox(models.Model):
+    """
+    An email waiting to be sent to one recipient.
+    """
+    QUEUED, SENDING, SENT, FAILED = range(4)
+    STATE_CHOICES = [(QUEUED, "Queued"), (SENDING, "Sending"), (SENT, "Sent"), (FAILED, "Failed")]
+    state = models.IntegerField(choices=STATE_CHOICES, default=QUEUED, db_index=True)
+
+    content = models.ForeignKey(EmailContent, on_delete=models.CASCADE)
+    recipient = models.CharField(max_length=MAX_NAME_LEN, db_index=True)
+
+    # How many times the email has been tried.
+    attempts = models.IntegerField(default=0)
+
+    # Queued emails are not sent before this date, for emails being sent it is the end of the claim.
+    next_try = models.DateTimeField(db_index=True)
+
+    # The drain that claimed the email.
+    owner = models.CharField(max_length=MAX_NAME_LEN, default='', blank=True)
+
+    # The last delivery error.
+    error = models.TextField(default='', blank=True)
+
+    created = models.DateTimeField(db_index=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.recipient} | {self.get_state_display()}"
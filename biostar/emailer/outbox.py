@@ -0,0 +1,173 @@
+"""
+Durable queue of outgoing emails.
+
+The senders store the rendered emails in the outbox and return right away,
+the drain sends the due emails through the delivery engine in batches. An
+email with the same content queued to the same recipient within
+EMAIL_OUTBOX_WINDOW seconds is dropped as a duplicate. Transient failures
+are tried again with a doubling delay, permanent failures and emails out of
+attempts are marked as failed.
+"""
+import hashlib
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q, F
+from django.utils import timezone
+
+from biostar.emailer import delivery, sender
+from biostar.emailer.models import EmailContent, Outbox
+
+logger = logging.getLogger("engine")
+
+
+def get_hash(*parts):
+    text = "\0".join(parts)
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def enqueue(email, context, from_email, recipient_list, shared=None):
+    """
+    Stores the email to each recipient in the outbox, returns the number of emails queued.
+    """
+    now = timezone.now()
+    shared = shared or email.render_shared(context)
+
+    # Each distinct content is stored once.
+    contents, rows, seen = {}, [], set()
+    for rec in recipient_list:
+        subject, text, html = email.render_recipient(context, shared=shared, recipient=rec)
+        key = get_hash(from_email, subject, text, html)
+        if (rec, key) in seen:
+            continue
+        seen.add((rec, key))
+        contents.setdefault(key, dict(template=email.name, sender=from_email, subject=subject, text=text, html=html))
+        rows.append((rec, key))
+
+    if not rows:
+        return 0
+
+    new = [EmailContent(hash=key, **fields) for key, fields in contents.items()]
+    EmailContent.objects.bulk_create(new, ignore_conflicts=True)
+    ids = dict(EmailContent.objects.filter(hash__in=contents).values_list('hash', 'pk'))
+
+    since = now - timedelta(seconds=settings.EMAIL_OUTBOX_WINDOW)
+    count = 0
+    for chunk in chunks(rows, settings.EMAIL_CHUNK_SIZE):
+        # Drop the emails already queued to the recipient within the window.
+        recent = Outbox.objects.filter(content__in=ids.values(), recipient__in=[rec for rec, key in chunk],
+                                       created__gt=since)
+        recent = set(recent.values_list('recipient', 'content_id'))
+        objs = [Outbox(content_id=ids[key], recipient=rec, next_try=now, created=now)
+                for rec, key in chunk if (rec, ids[key]) not in recent]
+        Outbox.objects.bulk_create(objs)
+        count += len(objs)
+
+    logger.info(f"queued {count} emails template={email.name}, {len(rows) - count} duplicates")
+
+    return count
+
+
+def ready(now):
+    """
+    Emails that are due, including the ones whose drain went away.
+    """
+    cond = Q(state=Outbox.QUEUED) | Q(state=Outbox.SENDING)
+    return Outbox.objects.filter(cond, next_try__lte=now).order_by('next_try', 'pk')
+
+
+def claim(limit=None):
+    """
+    Claims up to limit emails that are due and returns them.
+    """
+    limit = limit or settings.EMAIL_OUTBOX_BATCH
+    now = timezone.now()
+    owner = uuid.uuid4().hex
+    lease = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+
+    # Rows claimed by another drain meanwhile are not due anymore.
+    ids = list(ready(now).values_list('pk', flat=True)[:limit])
+    Outbox.objects.filter(pk__in=ids, next_try__lte=now).update(state=Outbox.SENDING, owner=owner, next_try=lease)
+
+    return list(Outbox.objects.filter(owner=owner, state=Outbox.SENDING).select_related('content'))
+
+
+def send(rows):
+    """
+    Sends the claimed emails and stores the outcome, returns the delivery report.
+    """
+
+    def make_email(row):
+        content = row.content
+        msg = sender.build_email(subject=content.subject, text=content.text, html=content.html,
+                                 from_email=content.sender, recipient=row.recipient)
+        msg.outbox = row
+        return msg
+
+    report = delivery.deliver(map(make_email, rows))
+
+    now = timezone.now()
+    failures = {msg.outbox.pk: exc for msg, exc in report.failures}
+
+    sent = [row.pk for row in rows if row.pk not in failures]
+    Outbox.objects.filter(pk__in=sent).update(state=Outbox.SENT, sent=now, error='', attempts=F('attempts') + 1)
+
+    failed = []
+    for row in rows:
+        if row.pk not in failures:
+            continue
+        exc = failures[row.pk]
+        row.attempts += 1
+        row.error = str(exc)
+        if delivery.transient(exc) and row.attempts < settings.EMAIL_OUTBOX_RETRIES:
+            row.state = Outbox.QUEUED
+            row.next_try = now + timedelta(seconds=settings.EMAIL_OUTBOX_BACKOFF * 2 ** (row.attempts - 1))
+        else:
+            row.state = Outbox.FAILED
+        failed.append(row)
+
+    Outbox.objects.bulk_update(failed, ['state', 'attempts', 'error', 'next_try'])
+
+    return report
+
+
+def drain(limit=None):
+    """
+    Sends the due emails in batches until none are left, returns the number sent and failed.
+    """
+    sent = failed = 0
+    while True:
+        rows = claim(limit=limit)
+        if not rows:
+            break
+        report = send(rows)
+        sent += report.sent
+        failed += report.failed
+
+    return sent, failed
+
+
+def retry():
+    """
+    Puts the failed emails back in the outbox, returns their number.
+    """
+    failed = Outbox.objects.filter(state=Outbox.FAILED)
+    return failed.update(state=Outbox.QUEUED, attempts=0, next_try=timezone.now())
+
+
+def prune(days=None):
+    """
+    Deletes the sent emails older than the given days and the contents no longer used.
+    """
+    days = settings.EMAIL_OUTBOX_DAYS if days is None else days
+    since = timezone.now() - timedelta(days=days)
+    count, _ = Outbox.objects.filter(state=Outbox.SENT, created__lt=since).delete()
+    EmailContent.objects.filter(outbox__isnull=True, date__lt=since).delete()
+    return count
@@ -0,0 +1,103 @@
+"""
+Streams email recipients from the database in batches.
+
+The recipients are read by primary key cursor, each query starts after the
+last key seen so that large tables are not scanned with LIMIT/OFFSET. The
+progress of a named send is stored after each batch, an interrupted send
+resumes after the last batch that went out.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from biostar.emailer.models import Checkpoint
+
+logger = logging.getLogger("engine")
+
+
+def stream(query, field='email', start=0, chunk=None):
+    """
+    Yields the (pk, value) of the query walking the primary key in chunks.
+    The value is a tuple when the field is a list of fields.
+    """
+    chunk = chunk or settings.EMAIL_CHUNK_SIZE
+    fields = [field] if isinstance(field, str) else list(field)
+    last = start
+    while True:
+        rows = query.filter(pk__gt=last).order_by('pk').values_list('pk', *fields)[:chunk]
+        count = 0
+        for pk, *values in rows.iterator():
+            count += 1
+            last = pk
+            yield pk, values[0] if isinstance(field, str) else tuple(values)
+
+        if count < chunk:
+            return
+
+
+def batches(query, field='email', start=0, size=None, chunk=None):
+    """
+    Yields (last pk, values) with batches of non empty values.
+    """
+    rows = stream(query, field=field, start=start, chunk=chunk)
+    return group(rows, start=start, size=size)
+
+
+def group(rows, start=0, size=None):
+    """
+    Yields (last pk, values) with batches of the non empty values of the (pk, value) rows.
+    """
+    size = size or settings.EMAIL_BATCH_SIZE
+    batch, last = [], start
+    for pk, value in rows:
+        last = pk
+        if value:
+            batch.append(value)
+        if len(batch) >= size:
+            yield last, batch
+            batch = []
+
+    if batch:
+        yield last, batch
+
+
+def send_batches(name, query=None, send=None, field='email', size=None, rows=None):
+    """
+    Calls send with each batch of recipients, the progress is stored under the name.
+    The recipients come from the query or from (pk, value) rows sorted by pk.
+    A send that returns False stops, the batch is tried again next time.
+    Returns the number of recipients sent to.
+    """
+    check, created = Checkpoint.objects.get_or_create(name=name)
+
+    if check.done:
+        logger.info(f"skipped {name}, already sent")
+        return 0
+
+    if check.last:
+        logger.info(f"resuming {name} after pk={check.last}")
+
+    if rows is None:
+        items = batches(query, field=field, start=check.last, size=size)
+    else:
+        items = group((row for row in rows if row[0] > check.last), start=check.last, size=size)
+
+    total = 0
+    for last, emails in items:
+        if send(emails) is False:
+            logger.error(f"stopped {name} at pk={check.last}")
+            return total
+
+        total += len(emails)
+        Checkpoint.objects.filter(pk=check.pk).update(last=last)
+        check.last = last
+
+    Checkpoint.objects.filter(pk=check.pk).update(done=True)
+
+    # Remove the progress of old sends.
+    since = timezone.now() - timedelta(days=settings.EMAIL_CHECKPOINT_DAYS)
+    Checkpoint.objects.filter(date__lt=since).delete()
+
+    return total
@@ -1,13 +1,16 @@
 import logging
+import os
 import re
 import textwrap
 
-from django.core.mail import EmailMultiAlternatives
-from django.core.mail import send_mail, send_mass_mail, get_connection
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.mail import send_mail
 from django.template import Context, Template
 from django.template.loader import get_template
 from django.conf import settings
 
+from biostar.emailer import delivery
+
 logger = logging.getLogger("engine")
 
 # Pattern to extract named blocks from a django template.
@@ -50,18 +53,47 @@ def first_line(text):
     return first
 
 
+# The parsed email templates by name.
+TEMPLATES = {}
+
+
+def get_email_template(name):
+    """
+    Returns the parsed email template, parses it again when the file changes.
+    """
+    email = TEMPLATES.get(name)
+    try:
+        fresh = email and os.path.getmtime(email.path) == email.mtime
+    except OSError:
+        fresh = False
+
+    if not fresh:
+        email = EmailTemplate(name)
+        TEMPLATES[name] = email
+
+    return email
+
+
 class EmailTemplate(object):
     """
     Generates a subject, text and html based email from a single template.
     """
 
     def __init__(self, name):
+        self.name = name
         self.template = get_template(name)
-        self.content = open(self.template.origin.name).read()
+        self.path = self.template.origin.name
+        self.mtime = os.path.getmtime(self.path)
+        with open(self.path) as fp:
+            self.content = fp.read()
         self.subj = get_block(self.content, "subject")
         self.text = get_block(self.content, "text")
         self.html = get_block(self.content, 'html')
 
+        # Blocks that use the recipient are rendered for each recipient of a mass email.
+        blocks = dict(subject=self.subj, text=self.text, html=self.html)
+        self.personal = {key for key, templ in blocks.items() if "recipient" in templ.source}
+
     def render(self, context):
         subj = safe_render(self.subj, context)
         text = safe_render(self.text, context)
@@ -69,6 +101,35 @@ class EmailTemplate(object):
         subj = first_line(subj)
         return subj, text, html
 
+    def render_shared(self, context):
+        """
+        Renders the parts shared by all recipients of a mass email.
+        """
+        subject, text, html = self.render(context)
+
+        # Text may be indented in template.
+        text = textwrap.dedent(text)
+
+        return subject, text, html
+
+    def render_recipient(self, context, shared, recipient):
+        """
+        Renders the blocks that use the recipient, the others are taken from the shared render.
+        """
+        if not self.personal:
+            return shared
+
+        subj, text, html = shared
+        context = dict(context, recipient=recipient)
+        if "subject" in self.personal:
+            subj = first_line(safe_render(self.subj, context))
+        if "text" in self.personal:
+            text = textwrap.dedent(safe_render(self.text, context))
+        if "html" in self.personal:
+            html = safe_render(self.html, context)
+
+        return subj, text, html
+
     def send(self, context, from_email, recipient_list):
 
         recipients = ", ".join(recipient_list)
@@ -99,47 +160,50 @@ class EmailTemplate(object):
                 recipient_list=recipient_list,
                 html_message=html)
 
-    def send_mass(self, context, from_email, recipient_list):
+    def send_mass(self, context, from_email, recipient_list, shared=None):
         """
-        Send mass individual mail to list of recipients
+        Send mass individual mail to list of recipients, returns the delivery report.
+        The shared parts may be rendered ahead when the context is reused over many sends.
         """
-        subject, text, html = self.render(context)
+        shared = shared or self.render_shared(context)
 
-        # Text may be indented in template.
-        text = textwrap.dedent(text)
+        def make_email(rec):
+            subject, text, html = self.render_recipient(context, shared=shared, recipient=rec)
+            return build_email(subject=subject, text=text, html=html, from_email=from_email, recipient=rec)
 
-        # Send mass html email
-        if len(html) < 10:
-            # Format mass mail
-            datatuple = ((subject, text, from_email, [rec]) for rec in recipient_list)
-            send_mass_mail(datatuple=datatuple, fail_silently=False)
-        else:
-            send_mass_html_mail(subject=subject,
-                                message=text,
-                                message_html=html,
-                                from_email=from_email,
-                                recipient_list=recipient_list)
+        # The messages are built as the workers send them.
+        return delivery.deliver(map(make_email, recipient_list))
 
 
-def send_mass_html_mail(subject, message, message_html, from_email, recipient_list):
+def build_email(subject, text, html, from_email, recipient):
+    """
+    Returns the email message to one recipient, with an html part when there is one.
     """
+    if len(html) < 10:
+        return EmailMessage(subject, text, from_email, [recipient])
 
+    msg = EmailMultiAlternatives(subject=subject, body=text, from_email=from_email, to=[recipient])
+    msg.attach_alternative(html, "text/html")
+    return msg
+
+
+def send_mass_html_mail(subject, message, message_html, from_email, recipient_list):
+    """
+    Sends an HTML email to each recipient over the pooled connections, returns the delivery report.
     """
-    connection = get_connection(fail_silently=False)
 
     def make_email(rec):
         msg = EmailMultiAlternatives(subject=subject,
                                      body=message,
                                      from_email=from_email,
-                                     to=[rec],
-                                     connection=connection)
+                                     to=[rec])
         msg.attach_alternative(message_html, "text/html")
         return msg
 
-    # Format mass mail
-    messages = list(map(make_email, recipient_list))
+    # The messages are built as the workers send them.
+    messages = map(make_email, recipient_list)
 
-    return connection.send_messages(messages)
+    return delivery.deliver(messages)
 
 
 def send_html_mail(subject, message, message_html, from_email, recipient_list):
@@ -16,3 +16,52 @@ ROOT_URLCONF = 'biostar.emailer.urls'
 DATA_MIGRATION = False
 
 SEND_MAIL = True
+
+# Recipients per batch, Amazon SES allows 50 per connection.
+EMAIL_BATCH_SIZE = 40
+
+# Recipients read from the database per query.
+EMAIL_CHUNK_SIZE = 1000
+
+# Days to keep the progress of finished sends.
+EMAIL_CHECKPOINT_DAYS = 30
+
+# Threads sending the emails of a mass mailing.
+EMAIL_WORKERS = 4
+
+# Recipients per second over all workers, the Amazon SES sending rate.
+EMAIL_RATE = 14
+
+# Recipients sent over a connection before it is replaced.
+EMAIL_CONNECTION_LIMIT = 1000
+
+# Seconds an unused connection is kept open.
+EMAIL_CONNECTION_IDLE = 30
+
+# Attempts after a transient failure, and the seconds before the first, doubled each time.
+EMAIL_RETRIES = 3
+EMAIL_RETRY_DELAY = 1
+
+# Send the emails through the outbox table, drained by: python manage.py outbox
+EMAIL_OUTBOX = False
+
+# Outbox emails sent per batch.
+EMAIL_OUTBOX_BATCH = 100
+
+# Seconds within which an identical email to the same recipient is dropped.
+EMAIL_OUTBOX_WINDOW = 24 * 3600
+
+# Attempts before an outbox email is marked as failed.
+EMAIL_OUTBOX_RETRIES = 5
+
+# Seconds before the first new attempt, doubled on every attempt.
+EMAIL_OUTBOX_BACKOFF = 60
+
+# Seconds a drain may take to send a batch before another drain claims it.
+EMAIL_OUTBOX_LEASE = 600
+
+# Seconds the drain waits before checking the outbox again.
+EMAIL_OUTBOX_POLL = 5
+
+# Days to keep the sent outbox emails.
+EMAIL_OUTBOX_DAYS = 30
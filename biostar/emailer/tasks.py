@@ -27,6 +27,87 @@ def send_all():
             logger.error(f"send_all() error: {exc}")
 
 
+def get_sender(name="", from_email=None):
+    """
+    Returns the sender of an email.
+    """
+    # The sender pattern email.
+    patt = settings.FROM_EMAIL_PATTERN
+
+    # Final sender email
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    return patt % (name, from_email)
+
+
+def get_context(subject="Subject", extra_context={}):
+    """
+    Returns the context of an email template.
+    """
+    # Default context added to each template.
+    port = f":{settings.HTTP_PORT}"if settings.HTTP_PORT else ""
+
+    context = dict(domain=settings.SITE_DOMAIN, protocol=settings.PROTOCOL,
+                   port=port, name=settings.SITE_NAME, subject=subject)
+
+    # Additional context added to the template.
+    context.update(extra_context)
+
+    return context
+
+
+def send_mass(email, context, from_email, recipient_list, shared=None):
+    """
+    Sends the email to each recipient, stores them in the outbox when enabled.
+    Returns False when no recipient could be reached.
+    """
+    if settings.EMAIL_OUTBOX:
+        from biostar.emailer import outbox
+
+        # Do not queue emails during data migration.
+        if settings.DATA_MIGRATION:
+            logger.info(f"skip outbox DATA_MIGRATION={settings.DATA_MIGRATION}")
+            return True
+
+        outbox.enqueue(email, context=context, from_email=from_email, recipient_list=recipient_list, shared=shared)
+        return True
+
+    report = email.send_mass(context=context, from_email=from_email, recipient_list=recipient_list, shared=shared)
+
+    # Nothing went out, the caller may try again later.
+    if report.failed and not report.sent:
+        logger.error(f"send_email failed for all {report.failed} recipients")
+        return False
+
+    return True
+
+
+def mass_sender(template_name, extra_context={}, name="", from_email=None, subject="Subject"):
+    """
+    Returns a function that sends the email to a list of recipients.
+    The parts shared by all recipients are rendered once, on the first call.
+    """
+    email = sender.get_email_template(template_name)
+    from_email = get_sender(name=name, from_email=from_email)
+    context = get_context(subject=subject, extra_context=extra_context)
+    shared = []
+
+    def send(recipient_list):
+        if not settings.SEND_MAIL:
+            return
+
+        try:
+            if not shared:
+                shared.append(email.render_shared(context))
+            logger.info(f"sending email from={from_email} to {len(recipient_list)} recipients template={template_name}")
+            return send_mass(email, context=context, from_email=from_email, recipient_list=recipient_list,
+                             shared=shared[0])
+        except Exception as exc:
+            logger.error(f"send_email error: {exc}")
+            return False
+
+    return send
+
+
 def send_email(template_name, recipient_list, extra_context={}, name="", from_email=None, subject="Subject",
                mass=False):
     """
@@ -36,12 +117,7 @@ def send_email(template_name, recipient_list, extra_context={}, name="", from_em
     if not settings.SEND_MAIL:
         return
 
-    # The sender pattern email.
-    patt = settings.FROM_EMAIL_PATTERN
-
-    # Final sender email
-    from_email = from_email or settings.DEFAULT_FROM_EMAIL
-    from_email = patt % (name, from_email)
+    from_email = get_sender(name=name, from_email=from_email)
 
     # Test the templates exists
     if os.path.isfile(template_name):
@@ -51,21 +127,15 @@ def send_email(template_name, recipient_list, extra_context={}, name="", from_em
         # Generate emails.
         logger.info(f"sending email from={from_email} recipient_list={recipient_list} template={template_name}")
 
-        # The email template instance
-        email = sender.EmailTemplate(template_name)
-
-        # Default context added to each template.
-        port = f":{settings.HTTP_PORT}"if settings.HTTP_PORT else ""
-
-        context = dict(domain=settings.SITE_DOMAIN, protocol=settings.PROTOCOL,
-                       port=port, name=settings.SITE_NAME, subject=subject)
+        # The parsed email template, shared by the sends.
+        email = sender.get_email_template(template_name)
 
-        # Additional context added to the template.
-        context.update(extra_context)
+        context = get_context(subject=subject, extra_context=extra_context)
 
-        # Generate and send the email.
-        if mass:
-            email.send_mass(context=context, from_email=from_email, recipient_list=recipient_list)
+        # Generate and send the email, the outbox sends to each recipient separately.
+        if mass or settings.EMAIL_OUTBOX:
+            if not send_mass(email, context=context, from_email=from_email, recipient_list=recipient_list):
+                return False
         else:
             email.send(context=context, from_email=from_email, recipient_list=recipient_list)
 
@@ -1,5 +1,12 @@
 import logging
-from django.core import management
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+from django.conf import settings
+from django.core import mail, management
 from biostar.emailer import tasks, auth
 from django.test import TestCase, override_settings
 from biostar.emailer import models
@@ -53,3 +60,268 @@ class ModelTests(TestCase):
 
         print(test)
 
+
+
+class RecipientTest(TestCase):
+
+    def setUp(self):
+        logger.setLevel(logging.WARNING)
+        self.group = models.EmailGroup.objects.create(name="test")
+        for n in range(7):
+            models.EmailSubscription.objects.create(email=f"{n}@lvh.me", group=self.group)
+        self.subs = models.EmailSubscription.objects.filter(group=self.group)
+
+    def test_batches(self):
+        "Test recipients are streamed in batches by primary key"
+        from biostar.emailer import recipients
+
+        emails = [batch for last, batch in recipients.batches(self.subs, size=3, chunk=2)]
+        self.assertEqual([len(batch) for batch in emails], [3, 3, 1])
+        self.assertEqual(sum(emails, []), [f"{n}@lvh.me" for n in range(7)])
+
+    def test_resume(self):
+        "Test an interrupted send resumes without sending twice"
+        from biostar.emailer import recipients
+
+        sent = []
+
+        def send(emails):
+            if len(sent) == 2:
+                return False
+            sent.append(emails)
+
+        self.assertEqual(recipients.send_batches("test", self.subs, send=send, size=2), 4)
+
+        sent.clear()
+        self.assertEqual(recipients.send_batches("test", self.subs, send=sent.append, size=2), 3)
+        self.assertEqual(sum(sent, []), [f"{n}@lvh.me" for n in range(4, 7)])
+
+        # Finished sends are not repeated.
+        self.assertEqual(recipients.send_batches("test", self.subs, send=sent.append, size=2), 0)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP to receive messages.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        count = 0
+        self.reply("220 localhost")
+        for line in self.rfile:
+            cmd = line.decode().strip().upper()
+            if cmd.startswith("MAIL") and server.drop and count >= server.drop:
+                # Hang up on the client.
+                return
+            if cmd.startswith("DATA"):
+                self.reply("354 go ahead")
+                data = []
+                for line in self.rfile:
+                    if line.rstrip(b"\r\n") == b".":
+                        break
+                    data.append(line)
+                with server.lock:
+                    server.messages.append(b"".join(data))
+                count += 1
+                self.reply("250 OK")
+            elif cmd.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, drop=0):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.drop = drop
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+class DeliveryTest(TestCase):
+
+    def setUp(self):
+        logger.setLevel(logging.WARNING)
+        self.server = SMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.settings = override_settings(EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                                          EMAIL_HOST="127.0.0.1", EMAIL_PORT=self.server.server_address[1],
+                                          EMAIL_USE_TLS=False, EMAIL_RETRY_DELAY=0)
+        self.settings.enable()
+
+    def tearDown(self):
+        from biostar.emailer import delivery
+        delivery.close_pools()
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def messages(self, count):
+        from django.core.mail import EmailMessage
+        return (EmailMessage("Test", "Test", "mailer@lvh.me", [f"{n}@lvh.me"]) for n in range(count))
+
+    def test_bucket(self):
+        "Test the rate limiter"
+        from biostar.emailer.delivery import TokenBucket
+
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual((bucket.take(), bucket.take()), (0, 0))
+        self.assertGreater(bucket.take(), 0)
+
+    def test_deliver(self):
+        "Test parallel delivery over persistent connections"
+        from biostar.emailer import delivery
+
+        report = delivery.deliver(self.messages(20), workers=3, rate=0)
+        self.assertEqual((report.sent, report.failed), (20, 0))
+        self.assertEqual(len(self.server.messages), 20)
+        self.assertLessEqual(self.server.connections, 3)
+
+        # Connections are replaced after the limit.
+        pool = delivery.ConnectionPool(limit=4)
+        delivery.deliver(self.messages(8), workers=1, rate=0, pool=pool)
+        self.assertEqual(pool.opened, 2)
+
+    def test_reconnect(self):
+        "Test delivery reconnects when the server hangs up"
+        from biostar.emailer import delivery
+
+        self.server.drop = 3
+        report = delivery.deliver(self.messages(10), workers=2, rate=0, retries=2)
+        self.assertEqual((report.sent, report.failed), (10, 0))
+        self.assertGreater(report.retries, 0)
+        self.assertEqual(len(self.server.messages), 10)
+
+    @override_settings(SEND_MAIL=True)
+    def test_send_mass(self):
+        "Test mass mailing through the delivery engine"
+
+        recipients = [f"{n}@lvh.me" for n in range(5)]
+        self.assertTrue(tasks.send_email(template_name="test_email.html", recipient_list=recipients,
+                                         from_email="mailer@lvh.me",
+                                         extra_context=dict(target_email="test@lvh.me"), mass=True))
+        self.assertEqual(len(self.server.messages), 5)
+
+
+class TemplateTest(TestCase):
+
+    def setUp(self):
+        logger.setLevel(logging.WARNING)
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "cached_email.html")
+        self.write("Hello")
+
+        templates = [dict(conf, DIRS=[self.root] + list(conf.get('DIRS', []))) for conf in settings.TEMPLATES]
+        self.settings = override_settings(TEMPLATES=templates)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.root)
+
+    def write(self, text, mtime=None):
+        with open(self.path, 'w') as fp:
+            fp.write("{% block subject %}Test{% endblock %}"
+                     "{% block text %}" + text + "{% endblock %}"
+                     "{% block html %}<p>Hello</p>{% endblock %}")
+        if mtime:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_cache(self):
+        "Test parsed templates are reused until the file changes"
+        from biostar.emailer import sender
+
+        email = sender.get_email_template("cached_email.html")
+        self.assertIs(sender.get_email_template("cached_email.html"), email)
+
+        self.write("Hello {{ recipient }}", mtime=email.mtime + 10)
+        email = sender.get_email_template("cached_email.html")
+        self.assertEqual(email.personal, {"text"})
+
+        # Only the blocks using the recipient differ.
+        email.send_mass(context={}, from_email="mailer@lvh.me", recipient_list=["1@lvh.me", "2@lvh.me"])
+        bodies = sorted(msg.body for msg in mail.outbox)
+        self.assertEqual(bodies, ["Hello 1@lvh.me", "Hello 2@lvh.me"])
+
+    @override_settings(SEND_MAIL=True, EMAIL_OUTBOX=False)
+    def test_mass_sender(self):
+        "Test the shared parts are rendered once for all the batches"
+        from unittest import mock
+        from biostar.emailer import sender, tasks
+
+        send = tasks.mass_sender("cached_email.html", from_email="mailer@lvh.me")
+        render = sender.EmailTemplate.render_shared
+        with mock.patch.object(sender.EmailTemplate, 'render_shared', autospec=True, side_effect=render) as shared:
+            self.assertTrue(send(["1@lvh.me", "2@lvh.me"]))
+            self.assertTrue(send(["3@lvh.me"]))
+
+        self.assertEqual(shared.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+
+@override_settings(SEND_MAIL=True, EMAIL_OUTBOX=True, EMAIL_RETRY_DELAY=0)
+class OutboxTest(TestCase):
+
+    def setUp(self):
+        logger.setLevel(logging.WARNING)
+        self.recipients = [f"{n}@lvh.me" for n in range(3)]
+
+    def send(self, recipients):
+        return tasks.send_email(template_name="test_email.html", recipient_list=recipients,
+                                from_email="mailer@lvh.me", mass=True)
+
+    def test_outbox(self):
+        "Test emails are queued once and sent by the drain"
+        from biostar.emailer import outbox
+
+        self.assertTrue(self.send(self.recipients))
+        self.assertTrue(self.send(self.recipients + ["3@lvh.me"]))
+        self.assertEqual(models.Outbox.objects.count(), 4)
+        self.assertEqual(models.EmailContent.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(outbox.drain(limit=3), (4, 0))
+        self.assertEqual(sorted(msg.to[0] for msg in mail.outbox), self.recipients + ["3@lvh.me"])
+        self.assertEqual(models.Outbox.objects.filter(state=models.Outbox.SENT).count(), 4)
+
+        # Nothing is left to send.
+        self.assertEqual(outbox.drain(), (0, 0))
+
+    def test_retry(self):
+        "Test failed emails are tried again later"
+        from biostar.emailer import outbox
+
+        # A port nobody listens on.
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        self.send(self.recipients[:1])
+        with override_settings(EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                               EMAIL_HOST="127.0.0.1", EMAIL_PORT=port, EMAIL_USE_TLS=False,
+                               EMAIL_RETRIES=0, EMAIL_OUTBOX_RETRIES=2):
+            self.assertEqual(outbox.drain(), (0, 1))
+            row = models.Outbox.objects.get()
+            self.assertEqual((row.state, row.attempts), (models.Outbox.QUEUED, 1))
+
+            # Not due yet.
+            self.assertEqual(outbox.drain(), (0, 0))
+
+            models.Outbox.objects.update(next_try=row.created)
+            self.assertEqual(outbox.drain(), (0, 1))
+            self.assertEqual(models.Outbox.objects.get().state, models.Outbox.FAILED)
+
+        self.assertEqual(outbox.retry(), 1)
+        self.assertEqual(outbox.drain(), (1, 0))
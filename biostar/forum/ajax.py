@@ -20,7 +20,7 @@ from django.views.decorators.csrf import ensure_csrf_cookie
 from whoosh.searching import Results
 
 from biostar.accounts.models import Profile, User
-from . import auth, util, forms, tasks, search, views, const, moderate
+from . import auth, util, forms, tasks, search, views, const, moderate, awards
 from .models import Post, Vote, Subscription, delete_post_cache, SharedLink, Diff
 
 
@@ -149,6 +149,11 @@ def ajax_vote(request):
     # Expire post cache upon vote.
     delete_post_cache(post)
 
+    # New votes may earn awards to the author and the voter.
+    if change > 0:
+        tasks.award_event.spool(event=awards.VOTE, user_id=post.author_id, post_id=post.pk)
+        tasks.award_event.spool(event=awards.VOTED, user_id=user.pk, post_id=None)
+
     return ajax_success(msg=msg, change=change)
 
 
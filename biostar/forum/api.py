@@ -1,8 +1,6 @@
 
 import json
-import os
 import logging
-from os.path import join, normpath
 from django.core.cache import cache
 from django.conf import settings
 from datetime import datetime, timedelta
@@ -11,7 +9,8 @@ from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from biostar.accounts.models import Profile, User
 from . import util
-from .models import Post, Vote, Subscription, PostView
+from .models import Post, Vote, Subscription, PostView, DailyStats
+from .stats import rollup, first_day
 
 
 logger = logging.getLogger("engine")
@@ -21,87 +20,23 @@ def api_error(msg="Api Error"):
     return {'error': msg}
 
 
-def stat_file(date, data=None, load=False, dump=False):
-
-    os.makedirs(settings.STATS_DIR, exist_ok=True)
-    file_name = f'{date.year}-{date.month}-{date.day}.json'
-    file_path = normpath(join(settings.STATS_DIR, file_name))
-
-    def load_file():
-        # This will be FileNotFoundError in Python3.
-        if not os.path.isfile(file_path):
-            raise IOError
-        with open(file_path, 'r') as fin:
-            return json.loads(fin.read())
-
-    def dump_into_file():
-        with open(file_path, 'w') as fout:
-            fout.write(json.dumps(data))
-
-    if load:
-        return load_file()
-
-    if dump:
-        return dump_into_file()
-
-
-def get_counts(end):
-    questions = Post.objects.filter(type=Post.QUESTION, creation_date__lt=end).count()
-    answers = Post.objects.filter(type=Post.ANSWER, creation_date__lt=end).count()
-    toplevel = Post.objects.filter(type__in=Post.TOP_LEVEL, creation_date__lt=end).exclude(type=Post.BLOG).count()
-    comments = Post.objects.filter(type=Post.COMMENT, creation_date__lt=end).count()
-    votes = Vote.objects.filter(date__lt=end).count()
-    users = User.objects.filter(profile__date_joined__lt=end).count()
-
-    data = {
-        'questions': questions,
-        'answers': answers,
-        'toplevel': toplevel,
-        'comments': comments,
-        'votes': votes,
-        'users': users,
-    }
-    return data
-
-
 def compute_stats(date):
     """
     Statistics about this website for the given date.
-    Statistics are stored to a json file for caching purpose.
+    A day missing from the rollup table is computed, it is stored only from the first post on.
 
     Parameters:
     date -- a `datetime`.
     """
+    day = date.date()
 
-    start = date.date()
-    end = start + timedelta(days=1)
+    stats = DailyStats.objects.filter(date=day).first()
+    if not stats:
+        logger.info(f'No stats for {day}.')
+        first = first_day()
+        stats = rollup(day, save=bool(first and day >= first))
 
-    try:
-        return stat_file(date=start, load=True)
-    except Exception as exc:  # This will be FileNotFoundError in Python3.
-        logger.info('No stats file for {}.'.format(start))
-
-    new_users = Profile.objects.filter(date_joined__gte=start,
-                                       date_joined__lt=end).values_list("uid", flat=True)
-    new_posts = Post.objects.filter(creation_date__gte=start,
-                                    creation_date__lt=end).values_list("uid", flat=True)
-    new_votes = Vote.objects.filter(date__gte=start,
-                                    date__lt=end).values_list("id", flat=True)
-
-    data = {
-        'date': util.datetime_to_iso(start),
-        'timestamp': util.datetime_to_unix(start),
-        'new_users': list(new_users),
-        'new_posts': list(new_posts),
-        'new_votes': list(new_votes),
-    }
-
-    data.update(get_counts(end=end))
-
-    if not settings.DEBUG:
-        stat_file(dump=True, date=start, data=data)
-
-    return data
+    return stats.json_data()
 
 
 def json_response(f):
@@ -174,6 +109,28 @@ def daily_stats_on_date(request, year, month, day):
     return compute_stats(date)
 
 
+@json_response
+def daily_stats_range(request, start, end):
+    """
+    Statistics about this website for each day in a range, as rolled up by the nightly stats command.
+
+    Parameters:
+    start -- First date, as YYYY-MM-DD.
+    end -- Last date, as YYYY-MM-DD, included.
+    """
+    start = datetime.strptime(start, "%Y-%m-%d").date()
+    end = datetime.strptime(end, "%Y-%m-%d").date()
+
+    # We don't provide stats for today or the future.
+    end = min(end, datetime.today().date() - timedelta(days=1))
+    if (end - start).days >= settings.STATS_RANGE_DAYS:
+        return api_error(f"Range is longer than {settings.STATS_RANGE_DAYS} days.")
+
+    rows = DailyStats.objects.filter(date__gte=start, date__lte=end).order_by('date')
+
+    return [stats.json_data() for stats in rows]
+
+
 @json_response
 def traffic(request):
     """
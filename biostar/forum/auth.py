@@ -1,6 +1,5 @@
 import hashlib
 import logging
-import re
 import urllib.parse as urlparse
 from datetime import timedelta
 from difflib import Differ, SequenceMatcher, HtmlDiff, unified_diff
@@ -16,11 +15,12 @@ from django.conf import settings
 
 from biostar.accounts.const import MESSAGE_COUNT
 from biostar.accounts.models import Message
+from biostar.accounts.auth import deliver_broadcasts
 from biostar.planet.models import BlogPost, Blog
 # Needed for historical reasons.
 from biostar.accounts.models import Profile
 from biostar.utils.helpers import get_ip
-from . import util, awards
+from . import util, awards, similar, tasks
 from .const import *
 from .models import Post, Vote, Subscription, Badge, delete_post_cache, Log, SharedLink, Diff
 
@@ -214,14 +214,13 @@ def create_post(author, title, content, request=None, root=None, parent=None, pt
                 nodups=True):
 
 
-    # Check if a post with this exact content already exists.
-    post = Post.objects.filter(content=content, author=author).order_by('-creation_date').first()
-
     # How many seconds since the last post should we disallow duplicates.
     frame = 60
-    delta = (util.now() - post.creation_date).seconds if post else frame
 
-    if nodups and delta < frame:
+    # Check if a post with this exact content already exists, looked up by signature.
+    post = similar.find_exact(content=content, author=author, seconds=frame) if nodups else None
+
+    if post:
         if request:
             messages.warning(request, "Post with this content was created recently.")
         return post
@@ -233,36 +232,99 @@ def create_post(author, title, content, request=None, root=None, parent=None, pt
     return post
 
 
-def diff_ratio(text1, text2):
+def line_hashes(text):
+    """
+    Returns stable digests of the lines, trailing spaces are not compared.
+    """
+    return [hashlib.blake2b(line.rstrip().encode("utf-8"), digest_size=8).digest() for line in text.splitlines()]
+
+
+def diff_ratio(text1, text2, cutoff=None):
+    """
+    Line level similarity of two texts, between 0 and 1.
+
+    Texts less similar than the cutoff return 0, the cheaper upper bounds
+    of the ratio tell that without computing it.
+    Texts over the size limit are only compared for equality.
+    """
+    lines1, lines2 = line_hashes(text1), line_hashes(text2)
+
+    if lines1 == lines2:
+        return 1
+
+    if len(text1) + len(text2) > settings.DIFF_MAX_SIZE:
+        return 0
+
+    s = SequenceMatcher(None, lines1, lines2, autojunk=False)
+
+    if cutoff is not None:
+        for bound in (s.real_quick_ratio, s.quick_ratio):
+            if bound() < cutoff:
+                return 0
 
-    # Do not match on spaces
-    s = SequenceMatcher(lambda char: re.match(r'\w+', char), text1, text2)
     return round(s.ratio(), 5)
 
 
+def replace_diff(old_lines, new_lines):
+    """
+    A unified diff that replaces all the lines, built without matching them.
+    """
+    head = ["--- \n", "+++ \n", f"@@ -1,{len(old_lines)} +1,{len(new_lines)} @@\n"]
+    return head + [f"-{line}" for line in old_lines] + [f"+{line}" for line in new_lines]
+
+
+def size_diff(old, new):
+    """
+    Marks an edit of texts too large to compare, the texts are not stored.
+    """
+    head = ["--- \n", "+++ \n"]
+    return head + [f"@@ text of {len(old)} characters changed to {len(new)} characters, too large to compare @@"]
+
+
+def compute_diff(old, new, cutoff=None):
+    """
+    Returns the unified diff between two texts, empty when the lines are the same.
+    Edits that only change trailing spaces are not recorded.
+    """
+    cutoff = settings.DIFF_CUTOFF if cutoff is None else cutoff
+
+    ratio = diff_ratio(old, new, cutoff=cutoff)
+    if ratio == 1:
+        return ''
+
+    old_lines, new_lines = old.splitlines(), new.splitlines()
+
+    # Rewrites are stored whole, matching their lines is not worth it.
+    if len(old) + len(new) > settings.DIFF_MAX_SIZE:
+        diff = size_diff(old, new)
+    elif ratio < cutoff:
+        diff = replace_diff(old_lines, new_lines)
+    else:
+        diff = unified_diff(old_lines, new_lines)
+
+    diff = [f"{line}\n" if not line.endswith('\n') else line for line in diff]
+    diff = ''.join(diff)
+
+    return diff
+
+
 def create_diff(text, post, user):
     """
     Compute and return Diff object for diff between text and post.content
+    The edit itself is logged by the forms.
     """
 
     # Skip on post creation
     if not post:
         return
 
-    ratio = diff_ratio(text1=text, text2=post.content)
+    # Compute diff between text and post.
+    diff = compute_diff(old=post.content, new=text)
 
     # Skip no changes detected
-    if ratio == 1:
+    if not diff:
         return
 
-    # Compute diff between text and post.
-    content = post.content.splitlines()
-    text = text.splitlines()
-
-    diff = unified_diff(content, text)
-    diff = [f"{line}\n" if not line.endswith('\n') else line for line in diff]
-    diff = ''.join(diff)
-
     # See if a diff has been made by this user in the past 10 minutes
     dobj = Diff.objects.filter(post=post, author=post.author).first()
 
@@ -275,9 +337,6 @@ def create_diff(text, post, user):
         # Create diff object for this user.
         dobj = Diff.objects.create(diff=diff, post=post, author=user)
         post.has_diff = True
-        # Only log when anyone but the author commits changes.
-        if user != post.author:
-            db_logger(user=user, action=Log.EDIT, text=f'edited post', target=post.author, post=post)
 
     Post.objects.filter(pk=post.pk).update(has_diff=post.has_diff)
 
@@ -340,6 +399,9 @@ def create_subscription(post, user, sub_type=None, update=False):
     # Update root subscription counts.
     Post.objects.filter(pk=post.root.pk).update(subs_count=subs_count)
 
+    # More followers may earn the author an award.
+    tasks.award_event.spool(event=awards.FOLLOW, user_id=post.root.author_id, post_id=post.root.pk)
+
     # Delete following cache
     delete_cache(FOLLOWING, user)
 
@@ -408,29 +470,36 @@ def post_tree(user, root):
     return root, comment_tree, answers, thread
 
 
-def valid_awards(user):
+def valid_awards(user, rules=None, post=None):
     """
-    Return list of valid awards for a given user
+    Return list of valid awards for a given user.
+    The rules default to all awards, a post limits the post awards to that post.
     """
+    rules = awards.ALL_AWARDS if rules is None else rules
+    badges = Badge.objects.filter(name__in=[award.name for award in rules])
+    badges = {badge.name: badge for badge in badges}
 
     valid = []
     # Randomly go from one badge to the other
-    for award in awards.ALL_AWARDS:
+    for award in rules:
 
         # Valid award targets the user has earned
-        targets = award.get_awards(user)
+        targets = award.get_awards(user, post=post)
 
         for target in targets:
-            post = target if isinstance(target, Post) else None
-            date = post.lastedit_date if post else user.profile.last_login
-            badge = Badge.objects.filter(name=award.name).first()
+            target_post = target if isinstance(target, Post) else None
+            date = target_post.lastedit_date if target_post else user.profile.last_login
+            badge = badges.get(award.name)
 
-            valid.append((user, badge, date, post))
+            valid.append((user, badge, date, target_post))
 
     return valid
 
 
 def get_counts(user):
+    # Deliver the broadcasts sent since the last delivery.
+    deliver_broadcasts(user=user)
+
     # The number of new messages since last visit.
     message_count = Message.objects.filter(recipient=user, unread=True)[:1000].count()
 
@@ -471,6 +540,10 @@ def apply_vote(post, user, vote_type):
     if not post.author == user:
         Profile.objects.filter(user=post.author).update(score=F('score') + change)
 
+    # Update the activity counters of the award rules.
+    awards.add_counts(post.author, votes=change)
+    awards.add_counts(user, voted=change)
+
     # Calculate counts for the current post
     votes = list(Vote.objects.filter(post=post))
     vote_count = len(votes)
@@ -2,13 +2,20 @@ import logging
 
 from django.utils.timezone import utc
 from datetime import datetime, timedelta
-from django.db.models import Count
+from django.db.models import Count, F, OuterRef, Subquery
 from django.db.models import Q
+from django.db.models.functions import Coalesce, Length
 from biostar.accounts.models import User
-from biostar.forum.models import Post, Vote, Badge, Award
+from biostar.forum.models import Post, Vote, Badge, Award, Counter
 
 logger = logging.getLogger("engine")
 
+# The events that trigger the award rules.
+POST, VOTE, VOTED, VIEW, FOLLOW, PROFILE = "post", "vote", "voted", "view", "follow", "profile"
+
+# Crossing these view counts triggers the view awards.
+VIEW_MILESTONES = [1000, 5000, 10000]
+
 
 def now():
     return datetime.utcnow().replace(tzinfo=utc)
@@ -19,23 +26,74 @@ def wrap_qs(cond, klass, pk):
     return klass.objects.filter(pk=pk) if cond else klass.objects.none()
 
 
+def get_counter(user):
+    """
+    Returns the activity counter of the user, counted from the database the first time.
+    """
+    counter, created = Counter.objects.get_or_create(user=user)
+    if created:
+        # Counted once the row exists, the changes added meanwhile are not lost.
+        recount(Counter.objects.filter(pk=counter.pk))
+        counter.refresh_from_db()
+    return counter
+
+
+def count_by_user(model, field):
+    rows = model.objects.filter(**{field: OuterRef('user')}).order_by().values(field)
+    rows = rows.annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(rows), 0)
+
+
+def recount(counters=None):
+    """
+    Counts the totals of the counters again from the database, returns the number of counters.
+    """
+    counters = Counter.objects.all() if counters is None else counters
+    return counters.update(posts=count_by_user(Post, 'author'),
+                           votes=count_by_user(Vote, 'post__author'),
+                           voted=count_by_user(Vote, 'author'))
+
+
+def add_counts(user, **changes):
+    """
+    Adds the changes to the counter of the user, missing counters get counted when first needed.
+    """
+    changes = {name: F(name) + value for name, value in changes.items()}
+    Counter.objects.filter(user=user).update(**changes)
+
+
+def crossed(before, after):
+    """
+    True when the views went over a milestone.
+    """
+    return any(before <= value < after for value in VIEW_MILESTONES)
+
+
 class AwardDef(object):
-    def __init__(self, name, desc, func, icon, max=None, type=Badge.BRONZE):
+    def __init__(self, name, desc, func, icon, max=None, type=Badge.BRONZE, events=(), query=None):
         self.name = name
         self.desc = desc
         self.fun = func
+        # Returns the posts or users of all users that earn the award, used in batch mode.
+        self.query = query
         self.icon = icon
         self.template = ""
         self.type = type
         # Max number of times this award can be given by a user.
         # No limit if left empty.
         self.max = max
+        # The events that may earn this award.
+        self.events = events
 
-    def get_awards(self, user):
+    def get_awards(self, user, post=None):
 
         try:
             value = self.fun(user).order_by("pk")
 
+            # Only the post of the event may earn a post award.
+            if post and value.model == Post:
+                value = value.filter(pk=post.pk)
+
             # Only return the ones that have one
         except Exception as exc:
             logger.error("validator error %s" % exc)
@@ -59,6 +117,35 @@ class AwardDef(object):
 
         return value
 
+    def get_targets(self):
+        """
+        Yields the (user id, post id, date) of every target lacking the award, in one query.
+        """
+        value = self.query()
+
+        # Users that already have the award as many times as allowed.
+        awarded = Award.objects.filter(badge__name=self.name)
+        full = awarded.values('user').annotate(count=Count('pk')).filter(count__gte=self.max or 1).values('user')
+
+        if value.model == Post:
+            # Each post gets the award once.
+            value = value.exclude(award__badge__name=self.name)
+
+            # Limited awards go to the first post of each user.
+            if self.max:
+                value = value.exclude(author__in=full)
+                first = value.filter(author=OuterRef('author')).order_by('pk').values('pk')[:1]
+                value = value.filter(pk=Subquery(first))
+
+            rows = value.order_by('pk').values_list('author_id', 'pk', 'lastedit_date')
+            for user_id, post_id, date in rows.iterator():
+                yield user_id, post_id, date
+            return
+
+        rows = value.exclude(pk__in=full).order_by('pk').values_list('pk', 'profile__last_login')
+        for user_id, date in rows.iterator():
+            yield user_id, None, date
+
     def __hash__(self):
         return hash(self.name)
 
@@ -71,8 +158,10 @@ AUTOBIO = AwardDef(
     name="Autobiographer",
     desc="has more than 80 characters in the information field of the user's profile",
     func=lambda user: wrap_qs(len(user.profile.text) > 80 and user.profile.score > 1, User, user.id),
+    query=lambda: User.objects.annotate(size=Length('profile__text')).filter(size__gt=80, profile__score__gt=1),
     max=1,
-    icon="bullhorn icon"
+    icon="bullhorn icon",
+    events=(PROFILE, VOTE),
 )
 
 
@@ -81,7 +170,8 @@ CURATOR = AwardDef(
     desc="accepted atleast once",
     func=lambda user: wrap_qs(len(user.profile.text) > 80 and user.profile.score > 1, User, user.id),
     max=1,
-    icon="bullhorn icon"
+    icon="bullhorn icon",
+    events=(PROFILE, VOTE),
 )
 
 COLLECTOR = AwardDef(
@@ -89,7 +179,8 @@ COLLECTOR = AwardDef(
     desc="submitted five or more herald stories ",
     func=lambda user: wrap_qs(len(user.profile.text) > 80 and user.profile.score > 1, User, user.id),
     max=1,
-    icon="bullhorn icon"
+    icon="bullhorn icon",
+    events=(PROFILE, VOTE),
 )
 
 EDITOR = AwardDef(
@@ -97,7 +188,8 @@ EDITOR = AwardDef(
     desc="published links ",
     func=lambda user: wrap_qs(len(user.profile.text) > 80 and user.profile.score > 1, User, user.id),
     max=1,
-    icon="bullhorn icon"
+    icon="bullhorn icon",
+    events=(PROFILE, VOTE),
 )
 
 
@@ -105,161 +197,202 @@ GOOD_QUESTION = AwardDef(
     name="Good Question",
     desc="asked a question that was upvoted at least 5 times",
     func=lambda user: Post.objects.filter(vote_count__gte=5, author=user, type=Post.QUESTION),
+    query=lambda: Post.objects.filter(vote_count__gte=5, type=Post.QUESTION),
     max=1,
-    icon="question circle icon"
+    icon="question circle icon",
+    events=(VOTE,),
 )
 
 GOOD_ANSWER = AwardDef(
     name="Good Answer",
     desc="created an answer that was upvoted at least 5 times",
     func=lambda user: Post.objects.filter(vote_count__gt=5, author=user, type=Post.ANSWER),
+    query=lambda: Post.objects.filter(vote_count__gt=5, type=Post.ANSWER),
     max=1,
-    icon="book icon"
+    icon="book icon",
+    events=(VOTE,),
 )
 
 STUDENT = AwardDef(
     name="Student",
     desc="asked a question with at least 3 up-votes",
     func=lambda user: Post.objects.filter(vote_count__gt=2, author=user, type=Post.QUESTION),
+    query=lambda: Post.objects.filter(vote_count__gt=2, type=Post.QUESTION),
     max=1,
-    icon="graduation cap icon"
+    icon="graduation cap icon",
+    events=(VOTE,),
 )
 
 TEACHER = AwardDef(
     name="Teacher",
     desc="created an answer with at least 3 up-votes",
     func=lambda user: Post.objects.filter(vote_count__gt=2, author=user, type=Post.ANSWER),
+    query=lambda: Post.objects.filter(vote_count__gt=2, type=Post.ANSWER),
     max=1,
-    icon="smile icon"
+    icon="smile icon",
+    events=(VOTE,),
 )
 
 COMMENTATOR = AwardDef(
     name="Commentator",
     desc="created a comment with at least 3 up-votes",
     func=lambda user: Post.objects.filter(vote_count__gt=2, author=user, type=Post.COMMENT),
+    query=lambda: Post.objects.filter(vote_count__gt=2, type=Post.COMMENT),
     max=1,
-    icon="mycomment icon"
+    icon="mycomment icon",
+    events=(VOTE,),
 )
 
 CENTURION = AwardDef(
     name="Centurion",
     desc="created 100 posts",
-    func=lambda user: wrap_qs(Post.objects.filter(author=user).count() > 100, User, user.id),
+    func=lambda user: wrap_qs(get_counter(user).posts > 100, User, user.id),
+    query=lambda: User.objects.annotate(count=Count('post')).filter(count__gt=100),
     max=1,
     icon="bolt icon",
     type=Badge.SILVER,
+    events=(POST,),
 )
 
 EPIC_QUESTION = AwardDef(
     name="Epic Question",
     desc="created a question with more than 10,000 views",
     func=lambda user: Post.objects.filter(author=user, view_count__gt=10000),
+    query=lambda: Post.objects.filter(view_count__gt=10000),
     max=1,
     icon="bullseye icon",
     type=Badge.GOLD,
+    events=(VIEW,),
 )
 
 POPULAR = AwardDef(
     name="Popular Question",
     desc="created a question with more than 1,000 views",
     func=lambda user: Post.objects.filter(author=user, view_count__gt=1000),
+    query=lambda: Post.objects.filter(view_count__gt=1000),
     max=1,
     icon="eye icon",
     type=Badge.GOLD,
+    events=(VIEW,),
 )
 
 ORACLE = AwardDef(
     name="Oracle",
     desc="created more than 1,000 posts (questions + answers + comments)",
-    func=lambda user: wrap_qs(Post.objects.filter(author=user).count() > 1000, User, user.id),
+    func=lambda user: wrap_qs(get_counter(user).posts > 1000, User, user.id),
+    query=lambda: User.objects.annotate(count=Count('post')).filter(count__gt=1000),
     max=1,
     icon="sun icon",
     type=Badge.GOLD,
+    events=(POST,),
 )
 
 PUNDIT = AwardDef(
     name="Pundit",
     desc="created a comment with more than 10 votes",
     func=lambda user: Post.objects.filter(author=user, type=Post.COMMENT, vote_count__gt=10),
+    query=lambda: Post.objects.filter(type=Post.COMMENT, vote_count__gt=10),
     max=1,
     icon="comments icon",
     type=Badge.SILVER,
+    events=(VOTE,),
 )
 
 GURU = AwardDef(
     name="Guru",
     desc="received more than 100 upvotes",
-    func=lambda user: wrap_qs(Vote.objects.filter(post__author=user).count() > 100, User, user.id),
+    func=lambda user: wrap_qs(get_counter(user).votes > 100, User, user.id),
+    query=lambda: User.objects.annotate(count=Count('post__votes')).filter(count__gt=100),
     max=1,
     icon="beer icon",
     type=Badge.SILVER,
+    events=(VOTE,),
 )
 
 CYLON = AwardDef(
     name="Cylon",
     desc="received 1,000 up votes",
-    func=lambda user: wrap_qs(Vote.objects.filter(post__author=user).count() > 1000, User, user.id),
+    func=lambda user: wrap_qs(get_counter(user).votes > 1000, User, user.id),
+    query=lambda: User.objects.annotate(count=Count('post__votes')).filter(count__gt=1000),
     max=1,
     icon="rocket icon",
     type=Badge.GOLD,
+    events=(VOTE,),
 )
 
 VOTER = AwardDef(
     name="Voter",
     desc="voted more than 100 times",
-    func=lambda user: wrap_qs(Vote.objects.filter(author=user).count() > 100, User, user.id),
+    func=lambda user: wrap_qs(get_counter(user).voted > 100, User, user.id),
+    query=lambda: User.objects.annotate(count=Count('vote')).filter(count__gt=100),
     max=1,
-    icon="thumbs up outline icon"
+    icon="thumbs up outline icon",
+    events=(VOTED,),
 )
 
 SUPPORTER = AwardDef(
     name="Supporter",
     desc="voted at least 25 times",
-    func=lambda user: wrap_qs(Vote.objects.filter(author=user).count() > 25, User, user.id),
+    func=lambda user: wrap_qs(get_counter(user).voted > 25, User, user.id),
+    query=lambda: User.objects.annotate(count=Count('vote')).filter(count__gt=25),
     max=1,
     icon="thumbs up icon",
     type=Badge.SILVER,
+    events=(VOTED,),
 )
 
 SCHOLAR = AwardDef(
     name="Scholar",
     desc="created an answer that has been accepted",
     func=lambda user: Post.objects.filter(author=user, type=Post.ANSWER, accept_count__gt=0),
+    query=lambda: Post.objects.filter(type=Post.ANSWER, accept_count__gt=0),
     max=1,
-    icon="university icon"
+    icon="university icon",
+    events=(VOTE,),
 )
 
 PROPHET = AwardDef(
     name="Prophet",
     desc="created a post with more than 20 followers",
     func=lambda user: Post.objects.filter(author=user, type__in=Post.TOP_LEVEL, subs_count__gt=20),
+    query=lambda: Post.objects.filter(type__in=Post.TOP_LEVEL, subs_count__gt=20),
     max=1,
-    icon="leaf icon"
+    icon="leaf icon",
+    events=(FOLLOW,),
 )
 
 LIBRARIAN = AwardDef(
     name="Librarian",
     desc="created a post with more than 10 bookmarks",
     func=lambda user: Post.objects.filter(author=user, type__in=Post.TOP_LEVEL, book_count__gt=10),
+    query=lambda: Post.objects.filter(type__in=Post.TOP_LEVEL, book_count__gt=10),
     max=1,
-    icon="bookmark outline icon"
+    icon="bookmark outline icon",
+    events=(VOTE,),
 )
 
 
 def rising_star(user):
     # The user joined no more than three months ago
     cond = now() < user.profile.date_joined + timedelta(weeks=15)
-    cond = cond and Post.objects.filter(author=user).count() > 50
+    cond = cond and get_counter(user).posts > 50
     return wrap_qs(cond, User, user.id)
 
 
+def rising_stars():
+    since = now() - timedelta(weeks=15)
+    return User.objects.filter(profile__date_joined__gt=since).annotate(count=Count('post')).filter(count__gt=50)
+
+
 RISING_STAR = AwardDef(
     name="Rising Star",
     desc="created 50 posts within first three months of joining",
     func=rising_star,
+    query=rising_stars,
     icon="star icon",
     max=1,
     type=Badge.GOLD,
+    events=(POST,),
 )
 
 
@@ -267,24 +400,30 @@ GREAT_QUESTION = AwardDef(
     name="Great Question",
     desc="created a question with more than 5,000 views",
     func=lambda user: Post.objects.filter(author=user, view_count__gt=5000),
+    query=lambda: Post.objects.filter(view_count__gt=5000),
     icon="fire icon",
     type=Badge.SILVER,
+    events=(VIEW,),
 )
 
 GOLD_STANDARD = AwardDef(
     name="Gold Standard",
     desc="created a post with more than 25 bookmarks",
     func=lambda user: Post.objects.filter(author=user, book_count__gt=25),
+    query=lambda: Post.objects.filter(book_count__gt=25),
     icon="bookmark icon",
     type=Badge.GOLD,
+    events=(VOTE,),
 )
 
 APPRECIATED = AwardDef(
     name="Appreciated",
     desc="created a post with more than 5 votes",
     func=lambda user: Post.objects.filter(author=user, vote_count__gt=5),
+    query=lambda: Post.objects.filter(vote_count__gt=5),
     icon="heart icon",
     type=Badge.SILVER,
+    events=(VOTE,),
 )
 
 
@@ -315,3 +454,10 @@ ALL_AWARDS = [
     GOLD_STANDARD,
     APPRECIATED,
 ]
+
+
+def get_rules(event):
+    """
+    The awards that the event may earn.
+    """
+    return [award for award in ALL_AWARDS if event in award.events]
@@ -0,0 +1,159 @@
+"""
+Resolves remote embeds (tweets) outside of the post save path.
+
+Rendering a post only consults the embed cache. Links that are not yet
+resolved are stored as placeholders that a background task replaces
+once the remote HTML has been fetched.
+"""
+import logging
+import re
+from concurrent import futures
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+
+from biostar.forum import util
+from biostar.forum.models import Post, Embed, delete_post_cache
+
+logger = logging.getLogger("engine")
+
+# Placeholder stored in the post html until the embed is resolved.
+PLACEHOLDER_HTML = '<a href="{url}" rel="nofollow" data-embed="{key}">{url}</a>'
+
+# Matches placeholders in the post html.
+PLACEHOLDER_PATTERN = re.compile(r'<a href="(?P<url>[^"]+)" rel="nofollow" data-embed="(?P<key>[\w:]+)">[^<]*</a>')
+
+# Remote providers by key prefix.
+PROVIDERS = {
+    "twitter": lambda uid: settings.TWITTER_OEMBED_URL.format(uid=uid),
+}
+
+
+def make_key(provider, uid):
+    return f"{provider}:{uid}"
+
+
+def is_fresh(embed):
+    """
+    Valid embeds and failed lookups expire at different rates.
+    """
+    ttl = settings.EMBED_CACHE_TTL if embed.valid else settings.EMBED_NEGATIVE_TTL
+    return embed.date >= util.now() - timedelta(seconds=ttl)
+
+
+def lookup(key):
+    """
+    Returns the cached embed for a key or None when it needs to be fetched.
+    """
+    embed = Embed.objects.filter(key=key).first()
+    if embed and is_fresh(embed):
+        return embed
+    return None
+
+
+def render(provider, uid, url):
+    """
+    Returns the cached html or a placeholder to be resolved later.
+    Never touches the network.
+    """
+    key = make_key(provider, uid)
+    embed = lookup(key)
+
+    # Failed lookups stay plain links.
+    if embed and not embed.valid:
+        return f'<a href="{url}" rel="nofollow">{url}</a>'
+
+    if embed:
+        return embed.html
+
+    return PLACEHOLDER_HTML.format(url=url, key=key)
+
+
+def has_placeholders(html):
+    return bool(PLACEHOLDER_PATTERN.search(html or ''))
+
+
+def fetch(key):
+    """
+    Fetch the html for a key from the remote provider.
+    Returns an empty string on any error.
+    """
+    provider, uid = key.split(":", 1)
+    url = PROVIDERS[provider](uid)
+    try:
+        response = requests.get(url, timeout=settings.EMBED_TIMEOUT)
+        response.raise_for_status()
+        return response.json()['html']
+    except Exception as exc:
+        logger.warning(f"embed error for {key}: {exc}")
+        return ''
+
+
+def fetch_all(keys):
+    """
+    Fetch many keys with a bounded pool of workers.
+    Returns a dictionary keyed by embed key; failures map to an empty string.
+    """
+    results = dict.fromkeys(keys, '')
+    if not keys:
+        return results
+
+    workers = min(settings.EMBED_WORKERS, len(keys))
+    pool = futures.ThreadPoolExecutor(max_workers=workers)
+    jobs = {pool.submit(fetch, key): key for key in keys}
+
+    # Leave room for every request to time out, once per worker slot.
+    deadline = settings.EMBED_TIMEOUT * (len(keys) // workers + 1)
+    try:
+        for job in futures.as_completed(jobs, timeout=deadline):
+            results[jobs[job]] = job.result()
+    except futures.TimeoutError:
+        logger.warning(f"embed lookups timed out after {deadline} seconds")
+    finally:
+        pool.shutdown(wait=False)
+
+    return results
+
+
+def resolve(keys):
+    """
+    Returns the html for each key, fetching the stale or missing ones.
+    """
+    cached = {key: lookup(key) for key in keys}
+    missing = [key for key, embed in cached.items() if embed is None]
+
+    fetched = fetch_all(missing)
+
+    # Store the results, failed lookups are negatively cached.
+    for key, html in fetched.items():
+        Embed.objects.update_or_create(key=key, defaults=dict(html=html, valid=bool(html), date=util.now()))
+
+    found = {key: embed.html for key, embed in cached.items() if embed and embed.valid}
+    found.update((key, html) for key, html in fetched.items() if html)
+
+    return found
+
+
+def resolve_post(uid):
+    """
+    Replaces the embed placeholders in the post html.
+    """
+    post = Post.objects.filter(uid=uid).first()
+    if not post or not has_placeholders(post.html):
+        return
+
+    keys = {m.group("key") for m in PLACEHOLDER_PATTERN.finditer(post.html)}
+    found = resolve(keys)
+
+    def replace(m):
+        url, key = m.group("url"), m.group("key")
+        return found.get(key) or f'<a href="{url}" rel="nofollow">{url}</a>'
+
+    html = PLACEHOLDER_PATTERN.sub(replace, post.html)
+
+    # Update without triggering the save signals, skip if the post was edited in the meantime.
+    Post.objects.filter(pk=post.pk, html=post.html).update(html=html)
+    delete_post_cache(post)
+
+    logger.debug(f"resolved {len(found)} of {len(keys)} embeds for post={uid}")
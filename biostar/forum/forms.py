@@ -1,7 +1,6 @@
 from pagedown.widgets import PagedownWidget
 import os
 import re
-import langdetect
 from django import forms
 from django.utils.safestring import mark_safe
 from django.core.exceptions import ValidationError
@@ -11,6 +10,7 @@ from snowpenguin.django.recaptcha2.fields import ReCaptchaField
 from snowpenguin.django.recaptcha2.widgets import ReCaptchaWidget
 from biostar.accounts.models import User, Profile
 from biostar.accounts.forms import get_tags_widget
+from biostar.utils import language
 from .models import Post, SharedLink
 from biostar.forum import models, auth, util
 
@@ -27,7 +27,10 @@ MAX_TAGS = 5
 MAX_TAG_LEN = 200
 
 
-def log_edits(user, post):
+def log_edits(user, post, content):
+    # Record the changes to the content.
+    auth.create_diff(text=content, post=post, user=user)
+
     if user != post.author:
         auth.db_logger(user=user, text=f'edited post', target=post.author, post=post)
 
@@ -35,10 +38,8 @@ def log_edits(user, post):
 def valid_language(text):
     supported_languages = settings.LANGUAGE_DETECTION
     if supported_languages:
-        try:
-            lang = langdetect.detect(text)
-        except Exception as exc:
-            logger.error(f"Lang detect error: {exc}")
+        lang = language.detect(text)
+        if not lang:
             return
 
         if lang not in supported_languages:
@@ -156,7 +157,7 @@ class PostLongForm(forms.Form):
         self.post.title = data.get('title')
         content = data.get('content', self.post.content)
 
-        log_edits(user=self.user, post=self.post)
+        log_edits(user=self.user, post=self.post, content=content)
         self.post.content = content
 
         self.post.type = data.get('post_type')
@@ -253,7 +254,7 @@ class PostShortForm(forms.Form):
         self.post.lastedit_user = self.user
         self.post.lastedit_date = util.now()
         content = self.cleaned_data.get('content', self.post.content)
-        log_edits(user=self.user, post=self.post)
+        log_edits(user=self.user, post=self.post, content=content)
         self.post.content = content
         self.post.save()
 
@@ -0,0 +1,84 @@
+import logging
+import random
+import re
+import time
+import zlib
+from difflib import SequenceMatcher, unified_diff
+
+from django.core.management.base import BaseCommand
+
+from biostar.forum import auth
+
+logger = logging.getLogger('engine')
+
+WORDS = "the sample reads were aligned to the reference genome with bwa and sorted by samtools".split()
+
+
+def char_diff(old, new):
+    """
+    Reference implementation: character level ratio over the full texts.
+    """
+    s = SequenceMatcher(lambda char: re.match(r'\w+', char), new, old)
+    if round(s.ratio(), 5) == 1:
+        return ''
+    diff = unified_diff(old.splitlines(), new.splitlines())
+    diff = [f"{line}\n" if not line.endswith('\n') else line for line in diff]
+    return ''.join(diff)
+
+
+def make_text(size, rand):
+    """
+    Generates a text of about the given size, in characters.
+    """
+    lines, total = [], 0
+    while total < size:
+        line = " ".join(rand.choice(WORDS) for step in range(rand.randint(5, 15)))
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def make_edit(text, rand):
+    """
+    Changes a few lines of the text.
+    """
+    lines = text.splitlines()
+    for step in range(3):
+        lines[rand.randrange(len(lines))] = " ".join(rand.sample(WORDS, 8))
+    return "\n".join(lines)
+
+
+def bench(count, sizes):
+    """
+    Times the diff computation of an edit over posts of different sizes.
+    """
+    rand = random.Random(0)
+
+    print(f"{'size':>8} {'char':>10} {'line':>10} {'raw':>8} {'stored':>8}")
+    for size in sizes:
+        old = make_text(size, rand)
+        new = make_edit(old, rand)
+
+        timings = []
+        for func in (char_diff, auth.compute_diff):
+            start = time.time()
+            for step in range(count):
+                diff = func(old, new)
+            timings.append((time.time() - start) / count)
+
+        stored = len(zlib.compress(diff.encode("utf-8")))
+        char, line = timings
+        print(f"{size:>8} {char * 1000:>8.2f}ms {line * 1000:>8.2f}ms {len(diff):>8} {stored:>8}")
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the diffs computed on post edits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=3, help="How many times to run each edit.")
+        parser.add_argument('--sizes', type=str, default="1000,5000,10000,50000",
+                            help="Comma separated post sizes, in characters.")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(",") if size.strip()]
+        bench(count=options['count'], sizes=sizes)
@@ -1,20 +1,67 @@
-from datetime import timedelta
 import logging
-from django.template import loader
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from taggit.models import Tag
+
 from biostar.forum.models import Post
-from biostar.emailer.tasks import send_email
+from biostar.emailer import sender, tasks
+from biostar.emailer.recipients import send_batches
 from biostar.accounts import util, models
 
 logger = logging.getLogger('engine')
 
+# The template of the digest emails.
+DIGEST_TEMPLATE = "messages/digest.html"
+
+
+def build_index(posts):
+    """
+    Maps each tag to the positions of the posts carrying it.
+    """
+    index = defaultdict(list)
+    for pos, post in enumerate(posts):
+        for tag in set(post.parse_tags()):
+            index[tag].append(pos)
+    return index
+
+
+def group_users(rows, index):
+    """
+    Groups the emails of the (email, watched tags) rows by the watched tags found in the index.
+    Users watching none of the tags of the posts get the same digest.
+    """
+    groups = defaultdict(list)
+    for email, watched in rows:
+        if not email:
+            continue
+        tags = frozenset(tag.strip().lower() for tag in (watched or "").split(","))
+        groups[tags.intersection(index)].append(email)
+    return groups
+
+
+def select_posts(tags, posts, index):
+    """
+    Returns the posts of a digest, the posts with the most watched tags come first.
+    The other posts follow, the posts are otherwise kept in their order, newest first.
+    """
+    if not tags:
+        return posts
+
+    hits = Counter(pos for tag in tags for pos in index[tag])
+    ranked = sorted(range(len(posts)), key=lambda pos: (-hits[pos], pos))
+    return [posts[pos] for pos in ranked]
+
 
 def send_digests(days=1, subject=""):
     '''
-    Send digest emails to users
+    Send digest emails to users, one digest for each distinct set of watched tags.
     '''
 
+    if not settings.SEND_MAIL:
+        return
+
     mapper = {1: models.Profile.DAILY_DIGEST,
               7: models.Profile.WEEKLY_DIGEST,
               30: models.Profile.MONTHLY_DIGEST}
@@ -23,27 +70,44 @@ def send_digests(days=1, subject=""):
     trange = util.now() - timedelta(days=days)
 
     posts = Post.objects.filter(lastedit_date__gt=trange, is_toplevel=True).order_by('-lastedit_date')
+    posts = list(posts)
 
     if not posts:
         logger.info(f'No new posts found in the last {days} days.')
         return
 
-    # Total number of recipients allowed per batch,
-    # AWS has limit of 50
-    batch_size = 40
-
     # Get users with the appropriate digest preference.
     pref = mapper.get(days, models.Profile.DAILY_DIGEST)
-    context = dict(subject=subject, posts=posts)
     users = models.User.objects.filter(profile__digest_prefs=pref)
-    emails = users.values_list('email', flat=True)
-
-    # Iterate through recipients and send emails in batches.
-    for idx in range(0, len(emails), batch_size):
-        # Get the next set of emails
-        end = idx + batch_size
-        rec_list = emails[idx:end]
-        send_email(template_name="messages/digest.html", extra_context=context, recipient_list=rec_list)
+
+    index = build_index(posts)
+
+    email = sender.get_email_template(DIGEST_TEMPLATE)
+    from_email = tasks.get_sender()
+
+    # Each digest is selected and rendered once per distinct set of watched tags.
+    rendered = {}
+
+    def render(tags):
+        if tags not in rendered:
+            selected = select_posts(tags, posts, index)
+            context = tasks.get_context(subject=subject, extra_context=dict(posts=selected, tags=sorted(tags)))
+            rendered[tags] = context, email.render_shared(context)
+        return rendered[tags]
+
+    def send(rows):
+        # The users of a streamed batch are grouped by their digest.
+        for tags, rec_list in group_users(rows, index).items():
+            context, shared = render(tags)
+            if tasks.send_mass(email, context=context, from_email=from_email, recipient_list=rec_list,
+                               shared=shared) is False:
+                return False
+
+    # Stream the recipients in batches, one digest per day resumes where it stopped.
+    name = f"digest-{days}-{util.now():%Y-%m-%d}"
+    total = send_batches(name=name, query=users, send=send, field=('email', 'profile__watched_tags'))
+
+    logger.info(f"sent {len(rendered)} digests to {total} users")
 
     return
 
@@ -1,5 +1,11 @@
+import json
 import logging
+import os
+import time
+from functools import partial
 
+import bleach
+from bleach.callbacks import nofollow
 from django.core.management.base import BaseCommand
 from biostar.forum import markdown
 
@@ -75,11 +81,64 @@ gist_test = "https://gist.github.com/afrendeiro/6732a46b949e864d6803"
 twitter_test = "https://twitter.com/Linux/status/2311234267"
 
 
+# The corpus used to check the html rendering.
+CORPUS = os.path.join(os.path.dirname(markdown.__file__), 'tests', 'data', 'markdown.json')
+
+
+def two_pass(html):
+    """
+    Reference implementation: separate clean and linkify passes then one replace per embed.
+    """
+    html = bleach.clean(text=html,
+                        tags=markdown.ALLOWED_TAGS,
+                        styles=markdown.ALLOWED_STYLES,
+                        attributes=markdown.ALLOWED_ATTRIBUTES,
+                        protocols=markdown.ALLOWED_PROTOCOLS)
+    embed = []
+    html = bleach.linkify(text=html, callbacks=[partial(markdown.embedder, embed=embed), nofollow],
+                          skip_tags=['pre', 'code'])
+    for source, target in embed:
+        html = html.replace(f'<a href="{source}" rel="nofollow">{source}</a>', target)
+
+    return html
+
+
+def bench(count):
+    """
+    Times the sanitize and linkify step on the corpus.
+    """
+    texts = [item['text'] for item in json.load(open(CORPUS))]
+
+    # Render the markdown once, only the html post-processing is timed.
+    renderer = markdown.BiostarRenderer(escape=False)
+    inline = markdown.BiostarInlineLexer(renderer=renderer)
+    parser = markdown.mistune.Markdown(hard_wrap=True, renderer=renderer, inline=inline)
+    htmls = [parser(text) for text in texts]
+
+    mismatch = sum(two_pass(html) != markdown.clean_and_linkify(html) for html in htmls)
+    print(f"corpus={len(htmls)} mismatches={mismatch}")
+
+    for name, func in [("two pass", two_pass), ("single pass", markdown.clean_and_linkify)]:
+        start = time.time()
+        for step in range(count):
+            for html in htmls:
+                func(html)
+        elapsed = time.time() - start
+        print(f"{name:12}: {elapsed:.2f} seconds, {count * len(htmls) / elapsed:.1f} posts/sec")
+
+
 class Command(BaseCommand):
     help = 'Used to test markdown rendering'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bench', type=int, default=0, help="Benchmark the html pipeline this many times.")
+
     def handle(self, *args, **options):
 
+        if options['bench']:
+            bench(count=options['bench'])
+            return
+
         # import markdown2
         # import bleach
         # html_classes = dict(code="language-bash", pre="pre")
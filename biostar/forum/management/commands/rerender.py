@@ -0,0 +1,176 @@
+import logging
+import os
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections, transaction
+from django.utils.timezone import make_aware
+
+from biostar.forum import markdown, embed, tasks
+from biostar.forum.models import Post
+
+logger = logging.getLogger('engine')
+
+# Keeps the primary key of the last post written back.
+CHECKPOINT = os.path.join(settings.BASE_DIR, 'export', 'rerender.checkpoint')
+
+# Each process opens its own database connection when rendering, keep it small.
+WORKERS = 2
+
+
+def render(row):
+    """
+    Renders the html for one post, runs inside the worker processes.
+    """
+    pk, uid, content = row
+    # The post is not passed to avoid the side effects of parsing (subscribing mentioned users).
+    html = markdown.parse(content, clean=True, escape=False)
+    return pk, uid, html
+
+
+def init_worker():
+    # Database connections may not be shared with the parent process.
+    close_old_connections()
+
+
+def read_checkpoint(fname):
+    if not os.path.isfile(fname):
+        return 0
+    text = open(fname).read().strip()
+    return int(text) if text.isdigit() else 0
+
+
+def write_checkpoint(fname, pk):
+    # Write then rename so that an interrupted write does not corrupt the checkpoint.
+    tmp = f"{fname}.tmp"
+    with open(tmp, 'wt') as fp:
+        fp.write(f"{pk}\n")
+    os.replace(tmp, fname)
+
+
+def get_posts(since=None, ptype=None, pattern=None):
+    """
+    Returns the posts selected by the filters.
+    """
+    query = Post.objects.all()
+
+    if since:
+        query = query.filter(lastedit_date__gte=since)
+    if ptype is not None:
+        query = query.filter(type=ptype)
+    if pattern:
+        query = query.filter(content__contains=pattern)
+
+    return query
+
+
+def stream(query, start, size):
+    """
+    Yields (pk, uid, content) chunks walking the primary key.
+    """
+    last = start
+    while True:
+        rows = list(query.filter(pk__gt=last).order_by('pk').values_list('pk', 'uid', 'content')[:size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield rows
+
+
+def rerender(query, size=1000, workers=1, start=0, checkpoint=None):
+    """
+    Re-renders the html of the posts in the query and writes it back in bulk.
+    Returns the number of posts that were rendered.
+    """
+    if workers > 1:
+        # Children open their own connections.
+        connections.close_all()
+        pool = Pool(processes=workers, initializer=init_worker)
+        mapper = lambda rows: pool.map(render, rows, chunksize=max(1, len(rows) // (4 * workers)))
+    else:
+        pool = None
+        mapper = lambda rows: list(map(render, rows))
+
+    total, begin = 0, time.time()
+    try:
+        for rows in stream(query, start=start, size=size):
+
+            objs = [Post(pk=pk, uid=uid, html=html) for pk, uid, html in mapper(rows)]
+
+            # Does not call Post.save(), no signals are sent.
+            with transaction.atomic():
+                Post.objects.bulk_update(objs, ['html'], batch_size=size)
+
+            # Remote embeds are resolved in the background.
+            for post in objs:
+                if embed.has_placeholders(post.html):
+                    tasks.resolve_embeds.spool(uid=post.uid)
+
+            last = objs[-1].pk
+            if checkpoint:
+                write_checkpoint(checkpoint, last)
+
+            total += len(objs)
+            rate = total / max(time.time() - begin, 0.001)
+            logger.info(f"rendered {total} posts, last pk={last}, {rate:.1f} posts/sec")
+
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Re-renders the html of the posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=str, default='', help="Posts edited since this date (YYYY-MM-DD).")
+        parser.add_argument('--type', type=str, default='', help="Post type, for example: question, answer.")
+        parser.add_argument('--pattern', type=str, default='', help="Only posts with content containing the pattern.")
+        parser.add_argument('--size', type=int, default=1000, help="How many posts to render in one chunk.")
+        parser.add_argument('--workers', type=int, default=WORKERS, help="Number of processes.")
+        parser.add_argument('--checkpoint', type=str, default=CHECKPOINT, help="Checkpoint file.")
+        parser.add_argument('--resume', action='store_true', default=False, help="Resume from the checkpoint.")
+
+    def handle(self, *args, **options):
+
+        since = options['since']
+        ptype = options['type']
+        pattern = options['pattern']
+        checkpoint = options['checkpoint']
+
+        if since:
+            try:
+                since = make_aware(datetime.strptime(since, '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError(f"Invalid date: {since}")
+
+        if ptype:
+            types = {name.lower(): value for value, name in Post.TYPE_CHOICES}
+            if ptype.lower() not in types:
+                raise CommandError(f"Invalid post type: {ptype}, valid options: {', '.join(types)}")
+            ptype = types[ptype.lower()]
+        else:
+            ptype = None
+
+        start = read_checkpoint(checkpoint) if options['resume'] else 0
+        if start:
+            logger.info(f"resuming after pk={start}")
+
+        query = get_posts(since=since, ptype=ptype, pattern=pattern)
+
+        begin = time.time()
+        total = rerender(query=query, size=options['size'], workers=options['workers'], start=start,
+                         checkpoint=checkpoint)
+        elapsed = max(time.time() - begin, 0.001)
+
+        logger.info(f"rendered {total} posts in {elapsed:.1f} seconds, {total / elapsed:.1f} posts/sec")
+
+        # Completed runs start over next time.
+        if os.path.isfile(checkpoint):
+            os.remove(checkpoint)
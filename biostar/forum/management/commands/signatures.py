@@ -0,0 +1,53 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from biostar.forum import similar
+from biostar.forum.models import Post, Signature
+
+logger = logging.getLogger('engine')
+
+
+def stream(query, size):
+    """
+    Yields (pk, content, creation_date) chunks walking the primary key.
+    """
+    last = 0
+    while True:
+        rows = list(query.filter(pk__gt=last).order_by('pk').values_list('pk', 'content', 'creation_date')[:size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield rows
+
+
+def backfill(size=1000, reset=False):
+    """
+    Computes the signatures of the posts that have none, returns their number.
+    """
+    if reset:
+        Signature.objects.all().delete()
+
+    query = Post.objects.filter(signature__isnull=True)
+    total = 0
+    for rows in stream(query, size=size):
+        signs = [similar.make_signature(pk=pk, content=content, date=date) for pk, content, date in rows]
+        Signature.objects.bulk_create(signs, ignore_conflicts=True)
+        total += len(signs)
+        logger.info(f"computed {total} signatures")
+
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Computes the near-duplicate signatures of the posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000, help="Posts per batch (default=%(default)s).")
+        parser.add_argument('--reset', action='store_true', default=False, help="Recompute all signatures.")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = backfill(size=max(1, options['batch']), reset=options['reset'])
+        logger.info(f"computed {count} signatures in {time.time() - start:.1f} seconds")
@@ -0,0 +1,100 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from biostar.accounts import util
+from biostar.forum import tasks
+from biostar.forum.models import Post
+from biostar.utils import spamlib
+
+logger = logging.getLogger('engine')
+
+# Scores that differ less than this are not written.
+TOLERANCE = 1e-4
+
+
+def stream(query, size):
+    """
+    Yields (pk, content, spam_score) chunks walking the primary key.
+    """
+    last = 0
+    while True:
+        rows = list(query.filter(pk__gt=last).order_by('pk').values_list('pk', 'content', 'spam_score')[:size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield rows
+
+
+def rescore(query, model, threshold, size=1000, dry=False):
+    """
+    Scores the posts in batches and writes the changed scores.
+    Returns the number of posts scored, changed and above the threshold, with the pks above the threshold.
+    """
+    total = changed = 0
+    above = []
+    for rows in stream(query, size=size):
+        scores = spamlib.score_content([content for pk, content, old in rows], model=model)
+
+        posts = []
+        for (pk, content, old), score in zip(rows, scores):
+            if score >= threshold:
+                above.append(pk)
+            if abs(score - old) > TOLERANCE:
+                posts.append(Post(pk=pk, spam_score=score))
+
+        if posts and not dry:
+            Post.objects.bulk_update(posts, ['spam_score'])
+
+        total += len(rows)
+        changed += len(posts)
+
+    return total, changed, above
+
+
+class Command(BaseCommand):
+    help = 'Scores posts with the spam model.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rescore', action='store_true', default=False, help="Score the recent posts again.")
+        parser.add_argument('--learn', action='store_true', default=False,
+                            help="Learn the queued moderator decisions.")
+        parser.add_argument('--since', type=int, default=7, help="Score the posts edited in the last days (default=%(default)s).")
+        parser.add_argument('--model', default=settings.SPAM_MODEL, help="The spam model (default=%(default)s).")
+        parser.add_argument('--threshold', type=float, default=settings.SPAM_THRESHOLD,
+                            help="Report the posts scoring above (default=%(default)s).")
+        parser.add_argument('--batch', type=int, default=1000, help="Posts scored at once (default=%(default)s).")
+        parser.add_argument('--dry', action='store_true', default=False, help="Report the scores without writing them.")
+
+    def handle(self, *args, **options):
+
+        if options['learn']:
+            count = tasks.learn_labels()
+            logger.info(f"learned {count} moderator decisions")
+
+        if not options['rescore']:
+            return
+
+        model = options['model']
+        if spamlib.MODELS.get(model) is None:
+            raise CommandError(f"spam model not found: {model}")
+
+        since = util.now() - timedelta(days=options['since'])
+        query = Post.objects.filter(lastedit_date__gte=since)
+
+        start = time.time()
+        total, changed, above = rescore(query, model=model, threshold=options['threshold'],
+                                        size=max(1, options['batch']), dry=options['dry'])
+        elapsed = time.time() - start
+        rate = total / elapsed if elapsed else 0
+
+        verb = "would change" if options['dry'] else "changed"
+        logger.info(f"scored {total} posts in {elapsed:.1f} seconds ({rate:.0f}/s), {verb} {changed}, "
+                    f"{len(above)} above {options['threshold']}")
+
+        if options['dry']:
+            for post in Post.objects.filter(pk__in=above[:100]).only('uid', 'title'):
+                print(f"{post.uid}\t{post.title}")
@@ -0,0 +1,34 @@
+import logging
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from biostar.forum import stats
+from biostar.forum.models import DailyStats
+
+logger = logging.getLogger('engine')
+
+
+def parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date() if text else None
+
+
+class Command(BaseCommand):
+    help = 'Rolls up the daily statistics missing up to yesterday, run nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', default='', help="First date to roll up, YYYY-MM-DD (default: first post).")
+        parser.add_argument('--end', default='', help="Last date to roll up, YYYY-MM-DD (default: yesterday).")
+        parser.add_argument('--reset', action='store_true', default=False, help="Recompute all the days.")
+
+    def handle(self, *args, **options):
+        start, end = parse_date(options['start']), parse_date(options['end'])
+
+        if options['reset']:
+            DailyStats.objects.all().delete()
+
+        # Only the days missing are rolled up, a nightly run adds the day before.
+        begin = time.time()
+        count = stats.fill(start=start, end=end)
+        logger.info(f"rolled up {count} days in {time.time() - begin:.1f} seconds")
@@ -67,12 +67,13 @@ def unbump(uids, **kwargs):
         logger.debug(f'title={p.title} uid={p.uid} unbumped.')
 
 
-def awards(limit=50, **kwargs):
+def awards(limit=0, **kwargs):
     """
-    Give user awards using a batch method.
+    Give user awards using a batch method, also recounts the activity counters of the award events.
+    Schedule it periodically, see scripts/user-awards.sh
     """
 
-    tasks.batch_create_awards(limit=limit)
+    tasks.batch_create_awards(limit=limit or None)
 
     return
 
@@ -85,8 +86,8 @@ class Command(BaseCommand):
         parser.add_argument('--uids', '-u', type=str, required=False, default='', help='List of uids')
         parser.add_argument('--action', '-a', type=str, required=True, choices=CHOICES, default='',
                             help='Action to take.')
-        parser.add_argument('--limit', dest='limit', type=int, default=100,
-                            help='Limit how many users/posts to process.'),
+        parser.add_argument('--limit', dest='limit', type=int, default=0,
+                            help='Limit how many users/posts to process, all when zero.'),
 
     def handle(self, *args, **options):
         action = options['action']
@@ -3,9 +3,9 @@ Markdown parser to render the Biostar style markdown.
 """
 import re
 import inspect, logging
+import secrets
 from functools import partial
 import mistune
-import requests
 from xml.sax.saxutils import unescape
 from django.shortcuts import reverse
 from django.db.models import F
@@ -17,10 +17,11 @@ from django.conf import settings
 from mistune import Renderer, InlineLexer, InlineGrammar
 from mistune import escape as escape_text
 from bleach.sanitizer import Cleaner
-from biostar.forum import auth
+from biostar.forum import auth, embed
 from biostar.forum.models import Post, Subscription
 from biostar.accounts.models import Profile, User
 from bleach.callbacks import nofollow
+from bleach.html5lib_shim import Filter, convert_entity, convert_entities
 
 logger = logging.getLogger('engine')
 
@@ -108,22 +109,16 @@ GIST_HTML = '<script src="https://gist.github.com/%s.js"></script>'
 TWITTER_PATTERN = rec(r"http(s)?://(www)?.?twitter.com/\w+/status(es)?/(?P<uid>([\d]+))(/)?([^\s]+)?")
 
 
-def get_tweet(tweet_id):
+def get_tweet(tweet_id, link):
     """
-    Get the HTML code with the embedded tweet.
-    It requires an API call at https://api.twitter.com/1/statuses/oembed.json as documented here:
-    https://dev.twitter.com/docs/embedded-tweets - section "Embedded Tweets for Developers"
-    https://dev.twitter.com/docs/api/1/get/statuses/oembed
+    Get the HTML code with the embedded tweet from the embed cache.
+    Tweets that are not yet cached render as a placeholder link
+    that is resolved in the background, see biostar.forum.embed.
     Params:
     tweet_id -- a tweet's numeric id like 2311234267 for the tweet at
     https://twitter.com/Linux/status/2311234267
     """
-    try:
-        response = requests.get("https://api.twitter.com/1/statuses/oembed.json?id={}".format(
-            tweet_id))
-        return response.json()['html']
-    except:
-        return ''
+    return embed.render("twitter", tweet_id, url=link)
 
 
 class MonkeyPatch(InlineLexer):
@@ -354,10 +349,10 @@ def embedder(attrs, new, embed=None):
 
     # Try embedding patterns
     targets = [
-        (GIST_PATTERN, lambda x: GIST_HTML % x),
-        (YOUTUBE_PATTERN1, lambda x: YOUTUBE_HTML % x),
-        (YOUTUBE_PATTERN2, lambda x: YOUTUBE_HTML % x),
-        (YOUTUBE_PATTERN3, lambda x: YOUTUBE_HTML % x),
+        (GIST_PATTERN, lambda x, link: GIST_HTML % x),
+        (YOUTUBE_PATTERN1, lambda x, link: YOUTUBE_HTML % x),
+        (YOUTUBE_PATTERN2, lambda x, link: YOUTUBE_HTML % x),
+        (YOUTUBE_PATTERN3, lambda x, link: YOUTUBE_HTML % x),
         (TWITTER_PATTERN, get_tweet),
     ]
 
@@ -365,7 +360,7 @@ def embedder(attrs, new, embed=None):
         patt = regex.search(href)
         if patt:
             uid = patt.group("uid")
-            obj = get_text(uid)
+            obj = get_text(uid, patt.group())
             embed.append((patt.group(), obj))
             attrs['_text'] = patt.group()
             if 'rel' in attrs:
@@ -374,18 +369,169 @@ def embedder(attrs, new, embed=None):
     return attrs
 
 
+class EmbedTargets(list):
+    """
+    The embedded html swapped in for the markers after serializing, by marker index.
+    The markers carry a random nonce of the render, the text of a post cannot forge them.
+    """
+
+    def __init__(self):
+        super(EmbedTargets, self).__init__()
+        nonce = secrets.token_hex(8)
+        self.marker = f"\ue000{nonce}:%d\ue001"
+        self.pattern = rec(f"\ue000{nonce}:(\\d+)\ue001")
+
+# Characters that are escaped when serialized, links containing them are never embedded.
+ESCAPED_CHARS = set('&<>"')
+
+
+class AttributeFilter(Filter):
+    """
+    Converts the entities in attribute values into text, the serializer escapes what it must.
+    Produces the same attributes as parsing the sanitized html a second time.
+    """
+
+    def __iter__(self):
+        for token in self.source:
+            if token["type"] in ("StartTag", "EmptyTag") and token["data"]:
+                token["data"] = {key: convert_entities(value) for key, value in token["data"].items()}
+            yield token
+
+
+class EntityFilter(Filter):
+    """
+    Converts the entities kept by the sanitizer back into text, the serializer escapes what it must.
+    Produces the same output as parsing the sanitized html a second time.
+    """
+
+    def __iter__(self):
+        chars = []
+        for token in self.source:
+            if token["type"] == "Entity":
+                value = convert_entity(token["name"])
+                chars.append(value if value is not None else f"&{token['name']};")
+                continue
+
+            if token["type"] == "Characters":
+                chars.append(token["data"])
+                continue
+
+            if chars:
+                yield {"type": "Characters", "data": "".join(chars)}
+                chars = []
+
+            yield token
+
+        if chars:
+            yield {"type": "Characters", "data": "".join(chars)}
+
+
+class EmbedFilter(Filter):
+    """
+    Replaces the links collected by the embedder with a marker for the embedded html.
+
+    Every anchor of the form <a href="link" rel="nofollow">link</a> is replaced,
+    including anchors that precede the embedded link in the text.
+    """
+
+    def __init__(self, source, embed, targets):
+        super(EmbedFilter, self).__init__(source)
+        self.embed = embed
+        self.targets = targets
+
+    def match(self, tokens, idx, sources):
+        """
+        Returns the link when the tokens at idx form an embeddable anchor.
+        """
+        start, text, end = tokens[idx:idx + 3]
+        if start["type"] != "StartTag" or start["name"] != "a":
+            return None
+        if text["type"] != "Characters" or end["type"] != "EndTag" or end["name"] != "a":
+            return None
+
+        link = text["data"]
+        attrs = [((None, "href"), link), ((None, "rel"), "nofollow")]
+        if link in sources and list(start["data"].items()) == attrs:
+            return link
+        return None
+
+    def __iter__(self):
+        # The embedder fills the list while the source is consumed.
+        tokens = list(self.source)
+
+        sources = {}
+        for source, target in self.embed:
+            sources.setdefault(source, target)
+        sources = {source: target for source, target in sources.items() if not ESCAPED_CHARS & set(source)}
+
+        idx, size = 0, len(tokens)
+        while idx < size:
+            link = self.match(tokens, idx, sources) if (sources and idx + 2 < size) else None
+            if link:
+                self.targets.append(sources[link])
+                yield {"type": "Characters", "data": self.targets.marker % (len(self.targets) - 1)}
+                idx += 3
+            else:
+                yield tokens[idx]
+                idx += 1
+
+
+def insert_embeds(html, targets):
+    """
+    Substitutes the embedded html for the markers in a single pass.
+    """
+    if not targets:
+        return html
+
+    def replace(m):
+        idx = int(m.group(1))
+        return targets[idx] if idx < len(targets) else m.group(0)
+
+    return targets.pattern.sub(replace, html)
+
+
+def link_filters(embed, targets, entities=False):
+    """
+    The filters that linkify and embed links.
+    """
+    linkifier = partial(LinkifyFilter, callbacks=[partial(embedder, embed=embed), nofollow], skip_tags=['pre', 'code'])
+    embedding = partial(EmbedFilter, embed=embed, targets=targets)
+
+    if entities:
+        return [AttributeFilter, linkifier, EntityFilter, embedding]
+
+    return [linkifier, embedding]
+
+
 def linkify(text):
-    # List of links to embed
-    embed = []
-    html = bleach.linkify(text=text, callbacks=[partial(embedder, embed=embed), nofollow], skip_tags=['pre', 'code'])
+    """
+    Linkifies and embeds links without sanitizing the html.
+    """
+    embed, targets = [], EmbedTargets()
 
-    # Embed links into html.
-    for em in embed:
-        source, target = em
-        emb = f'<a href="{source}" rel="nofollow">{source}</a>'
-        html = html.replace(emb, target)
+    linker = Linker()
+    filtered = linker.walker(linker.parser.parseFragment(text))
+    for filter_class in link_filters(embed=embed, targets=targets):
+        filtered = filter_class(source=filtered)
 
-    return html
+    html = linker.serializer.render(filtered)
+    return insert_embeds(html, targets)
+
+
+def clean_and_linkify(text):
+    """
+    Sanitizes, linkifies and embeds links while tokenizing the html only once.
+    """
+    embed, targets = [], EmbedTargets()
+
+    cleaner = Cleaner(tags=ALLOWED_TAGS,
+                      styles=ALLOWED_STYLES,
+                      attributes=ALLOWED_ATTRIBUTES,
+                      protocols=ALLOWED_PROTOCOLS,
+                      filters=link_filters(embed=embed, targets=targets, entities=True))
+
+    html = cleaner.clean(text)
+    return insert_embeds(html, targets)
 
 
 def safe(f):
@@ -428,15 +574,12 @@ def parse(text, post=None, clean=True, escape=True, allow_rewrite=False):
     markdown = mistune.Markdown(hard_wrap=True, renderer=renderer, inline=inline)
 
     output = markdown(text=text)
-    # Bleach clean the html.
+
+    # Bleach clean the html and embed sensitive links in one pass.
     if clean:
-        output = bleach.clean(text=output,
-                            tags=ALLOWED_TAGS,
-                            styles=ALLOWED_STYLES,
-                            attributes=ALLOWED_ATTRIBUTES,
-                            protocols=ALLOWED_PROTOCOLS)
-    # Embed sensitive links into html
-    output = linkify(text=output)
+        output = clean_and_linkify(text=output)
+    else:
+        output = linkify(text=output)
 
     return output
 
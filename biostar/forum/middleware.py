@@ -104,9 +104,6 @@ def user_tasks(get_response):
             # Set the session.
             request.session[settings.SESSION_COUNT_KEY] = counts
 
-            # Trigger award generation.
-            tasks.create_user_awards.spool(user_id=user.id)
-
         # Can process response here after its been handled by the view
         response = get_response(request)
 
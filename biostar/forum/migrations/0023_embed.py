@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0022_post_has_diff'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Embed',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=256, unique=True)),
+                ('html', models.TextField(default='')),
+                ('valid', models.BooleanField(default=True)),
+                ('date', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:19
+
+from django.db import migrations, models
+
+import zlib
+
+
+def compress_diffs(apps, schema_editor):
+
+    Diff = apps.get_model('forum', 'Diff')
+    diffs = Diff.objects.all()
+    for dobj in diffs.iterator():
+        # Store the existing diffs compressed.
+        dobj.data = zlib.compress(dobj.diff.encode("utf-8"))
+        dobj.save(update_fields=['data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0023_embed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diff',
+            name='data',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(compress_diffs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='diff',
+            name='diff',
+        ),
+    ]
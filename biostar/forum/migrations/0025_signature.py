@@ -0,0 +1,31 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0024_diff_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Signature',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('simhash', models.BigIntegerField(default=0)),
+                ('band0', models.IntegerField(db_index=True, default=0)),
+                ('band1', models.IntegerField(db_index=True, default=0)),
+                ('band2', models.IntegerField(db_index=True, default=0)),
+                ('band3', models.IntegerField(db_index=True, default=0)),
+                ('band4', models.IntegerField(db_index=True, default=0)),
+                ('band5', models.IntegerField(db_index=True, default=0)),
+                ('band6', models.IntegerField(db_index=True, default=0)),
+                ('band7', models.IntegerField(db_index=True, default=0)),
+                ('date', models.DateTimeField(db_index=True)),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='signature', to='forum.post')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('forum', '0025_signature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posts', models.IntegerField(default=0)),
+                ('votes', models.IntegerField(default=0)),
+                ('voted', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='counter', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0026_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('new_users', models.IntegerField(default=0)),
+                ('new_posts', models.IntegerField(default=0)),
+                ('new_votes', models.IntegerField(default=0)),
+                ('questions', models.IntegerField(default=0)),
+                ('answers', models.IntegerField(default=0)),
+                ('toplevel', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('votes', models.IntegerField(default=0)),
+                ('users', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.15 on 2026-10-19 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0027_dailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamLabel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField(default='')),
+                ('spam', models.BooleanField(default=False)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-19 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0028_spamlabel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spamlabel',
+            name='claim',
+            field=models.CharField(db_index=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='spamlabel',
+            name='claimed',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.15 on 2026-10-19 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0029_spamlabel_claim'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='signature',
+            name='band0',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='band1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='band2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='band3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='band4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='band5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='band6',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='band7',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band0', 'date'], name='forum_sign_band0_date'),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band1', 'date'], name='forum_sign_band1_date'),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band2', 'date'], name='forum_sign_band2_date'),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band3', 'date'], name='forum_sign_band3_date'),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band4', 'date'], name='forum_sign_band4_date'),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band5', 'date'], name='forum_sign_band5_date'),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band6', 'date'], name='forum_sign_band6_date'),
+        ),
+        migrations.AddIndex(
+            model_name='signature',
+            index=models.Index(fields=['band7', 'date'], name='forum_sign_band7_date'),
+        ),
+    ]
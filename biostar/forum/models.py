@@ -1,4 +1,5 @@
 import logging
+import zlib
 from datetime import timedelta
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -637,8 +638,8 @@ class Award(models.Model):
 
 class Diff(models.Model):
 
-    # Initial content state
-    diff = models.TextField(default='')
+    # Initial content state, stored compressed.
+    data = models.BinaryField(default=b'')
 
     # Date this change was made.
     created = models.DateTimeField(auto_now_add=True)
@@ -655,6 +656,14 @@ class Diff(models.Model):
 
         super(Diff, self).save(*args, **kwargs)
 
+    @property
+    def diff(self):
+        return zlib.decompress(self.data).decode("utf-8") if self.data else ''
+
+    @diff.setter
+    def diff(self, text):
+        self.data = zlib.compress(text.encode("utf-8"))
+
     @property
     def breakline(self):
         diff = self.diff
@@ -662,6 +671,62 @@ class Diff(models.Model):
         return diff
 
 
+class Embed(models.Model):
+    """
+    Caches the HTML of remote embeds (tweets) shared by all posts.
+    Failed lookups are cached as well to avoid hitting a failing host.
+    """
+
+    # The provider and the remote id, for example: twitter:2311234267
+    key = models.CharField(max_length=MAX_NAME_LEN, unique=True)
+
+    # The HTML returned by the provider.
+    html = models.TextField(default='')
+
+    # False when the lookup failed (negative cache).
+    valid = models.BooleanField(default=True)
+
+    # Date of the last lookup.
+    date = models.DateTimeField(db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.date = self.date or util.now()
+        super(Embed, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return self.key
+
+
+class Signature(models.Model):
+    """
+    SimHash of the post content, split into bands to find near-duplicates.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name="signature")
+
+    # The 64 bit hash, stored signed.
+    simhash = models.BigIntegerField(default=0)
+
+    # Texts differing in a few bits share at least one band.
+    band0 = models.IntegerField(default=0)
+    band1 = models.IntegerField(default=0)
+    band2 = models.IntegerField(default=0)
+    band3 = models.IntegerField(default=0)
+    band4 = models.IntegerField(default=0)
+    band5 = models.IntegerField(default=0)
+    band6 = models.IntegerField(default=0)
+    band7 = models.IntegerField(default=0)
+
+    # Creation date of the post.
+    date = models.DateTimeField(db_index=True)
+
+    class Meta:
+        # Band values repeat often, the lookups only scan the recent ones.
+        indexes = [models.Index(fields=[f"band{i}", "date"], name=f"forum_sign_band{i}_date") for i in range(8)]
+
+    def __str__(self):
+        return f"{self.post_id} | {self.simhash}"
+
+
 class Log(models.Model):
     """
     Represents moderation actions
@@ -703,3 +768,79 @@ class Log(models.Model):
         self.date = self.date or util.now()
         super(Log, self).save(*args, **kwargs)
 
+
+
+class Counter(models.Model):
+    """
+    Running totals of the user activity checked by the award rules.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="counter")
+
+    # Posts created by the user.
+    posts = models.IntegerField(default=0)
+
+    # Votes received on the posts of the user.
+    votes = models.IntegerField(default=0)
+
+    # Votes cast by the user.
+    voted = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} | posts={self.posts} votes={self.votes} voted={self.voted}"
+
+
+class SpamLabel(models.Model):
+    """
+    A moderator decision on a post, kept until the spam model learns it.
+    """
+    # The content of the post when it was moderated.
+    content = models.TextField(default='')
+
+    spam = models.BooleanField(default=False)
+
+    date = models.DateTimeField(auto_now_add=True)
+
+    # The checkpoint learning the decision and when it claimed it.
+    claim = models.CharField(max_length=32, default='', db_index=True)
+    claimed = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.pk} | spam={self.spam}"
+
+
+class DailyStats(models.Model):
+    """
+    Statistics of a day, the totals are counted at the end of the day.
+    """
+    date = models.DateField(primary_key=True)
+
+    # Items created during the day.
+    new_users = models.IntegerField(default=0)
+    new_posts = models.IntegerField(default=0)
+    new_votes = models.IntegerField(default=0)
+
+    # Totals at the end of the day.
+    questions = models.IntegerField(default=0)
+    answers = models.IntegerField(default=0)
+    toplevel = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    votes = models.IntegerField(default=0)
+    users = models.IntegerField(default=0)
+
+    def json_data(self):
+        return {
+            'date': util.datetime_to_iso(self.date),
+            'timestamp': util.datetime_to_unix(self.date),
+            'new_users': self.new_users,
+            'new_posts': self.new_posts,
+            'new_votes': self.new_votes,
+            'questions': self.questions,
+            'answers': self.answers,
+            'toplevel': self.toplevel,
+            'comments': self.comments,
+            'votes': self.votes,
+            'users': self.users,
+        }
+
+    def __str__(self):
+        return f"{self.date} | posts={self.new_posts} users={self.new_users} votes={self.new_votes}"
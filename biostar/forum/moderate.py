@@ -17,7 +17,7 @@ from biostar.accounts.views import user_moderate as account_moderate
 from biostar.accounts.models import Profile, User
 from biostar.utils.decorators import check_params
 from biostar.forum.models import Post, delete_post_cache, Log
-from biostar.forum import auth, const, util
+from biostar.forum import auth, const, util, tasks, similar
 
 
 logger = logging.getLogger('engine')
@@ -117,7 +117,11 @@ def post_moderate(request, uid):
     else:
         form = PostModForm(post=post, user=user, request=request)
 
-    context = dict(form=form, post=post, user=user, ALLOW_POST_CLOSING=settings.ALLOW_POST_CLOSING)
+    # Recent posts with nearly the same content.
+    similar_posts = similar.similar_posts(post)[:10]
+
+    context = dict(form=form, post=post, user=user, similar_posts=similar_posts,
+                   ALLOW_POST_CLOSING=settings.ALLOW_POST_CLOSING)
     return render(request, "forms/form_moderate.html", context)
 
 
@@ -294,6 +298,9 @@ def toggle_spam(request, post, **kwargs):
     # Submit the log into the database.
     auth.db_logger(user=user, action=Log.MODERATE, target=post.author, text=text, post=post)
 
+    # The spam model learns from the decision.
+    tasks.spam_learn.spool(uid=post.uid)
+
     url = post.get_absolute_url()
 
     return url
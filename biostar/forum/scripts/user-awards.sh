@@ -19,4 +19,5 @@ LIMIT=100
 # Set the configuration module.
 export DJANGO_SETTINGS_MODULE=conf.run.site_settings
 
+# Gives the awards and recounts the activity counters of the award events, run it daily.
 python manage.py tasks --action award --limit ${LIMIT}
\ No newline at end of file
@@ -21,7 +21,8 @@ MESSAGES_PER_PAGE = 100
 TAGS_PER_PAGE = 50
 AWARDS_PER_PAGE = 50
 
-STATS_DIR = os.path.join(BASE_DIR, "export", "stats")
+# The most days returned by the stats range api.
+STATS_RANGE_DAYS = 366
 
 
 # Enable image upload
@@ -38,7 +39,7 @@ REQUIRED_TAGS = ''
 REQUIRED_TAGS_URL = "/"
 
 # How to run tasks in the background.
-# Valid options; block, disable, threaded, uwsgi, celery.
+# Valid options; block, disable, threaded, pool, dbqueue, uwsgi, celery.
 TASK_RUNNER = 'threaded'
 
 # Threshold to classify spam
@@ -50,6 +51,19 @@ ALLOW_POST_CLOSING = False
 # Classify posts and assign a spam score on creation.
 CLASSIFY_SPAM = True
 
+# Posts whose signatures differ in at most this many bits are near-duplicates, at most 7.
+SIMHASH_DISTANCE = 7
+
+# Days of posts searched for near-duplicates.
+SIMHASH_DAYS = 30
+
+# Moderator spam decisions learned at once, and the seconds between the checkpoints learning the rest.
+SPAM_LEARN_BATCH = 20
+SPAM_LEARN_SECS = 300
+
+# Seconds after which the decisions claimed by an unfinished checkpoint are learned again.
+SPAM_CLAIM_SECS = 3600
+
 # Log the time for each request
 TIME_REQUESTS = True
 
@@ -80,7 +94,7 @@ SIMILAR_FEED_COUNT = 30
 
 SESSION_UPDATE_SECONDS = 10
 
-# Maximum number of awards every SESSION_UPDATE_SECONDS.
+# Maximum number of awards given at once by a full award check.
 MAX_AWARDS = 2
 
 # How many stories to show
@@ -161,6 +175,27 @@ CACHES = {
     }
 }
 
+# Remote embeds (tweets) are resolved in the background and cached.
+TWITTER_OEMBED_URL = "https://api.twitter.com/1/statuses/oembed.json?id={uid}"
+
+# Seconds to wait on a remote embed provider.
+EMBED_TIMEOUT = 3
+
+# Maximum number of concurrent embed lookups.
+EMBED_WORKERS = 4
+
+# How long to keep resolved embeds, in seconds.
+EMBED_CACHE_TTL = 7 * 24 * 3600
+
+# How long to wait before retrying a failed embed, in seconds.
+EMBED_NEGATIVE_TTL = 3600
+
+# Edits to texts larger than this (in characters) are not compared, the diff only notes the sizes.
+DIFF_MAX_SIZE = 100000
+
+# Edits less similar than this replace all the lines in the diff.
+DIFF_CUTOFF = 0.3
+
 # Strict rules applied to post tags
 STRICT_TAGS = True
 
@@ -1,11 +1,12 @@
 import logging
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
 from django.dispatch import receiver
-from taggit.models import Tag
-from django.db.models import F, Q
+from biostar.utils.tags import set_tags
+from django.db.models import F, Q, Count
 from biostar.accounts.models import Profile, Message, User
-from biostar.forum.models import Post, Award, Subscription, SharedLink, Diff
-from biostar.forum import tasks, auth, util
+from biostar.accounts.signals import profile_edited
+from biostar.forum.models import Post, Vote, Award, Subscription, SharedLink, Diff
+from biostar.forum import tasks, auth, util, embed, similar, awards
 
 
 logger = logging.getLogger("engine")
@@ -76,6 +77,31 @@ def ban_user(sender, instance, created, **kwargs):
         Post.objects.filter(author=instance.user).update(spam=Post.SPAM)
 
 
+@receiver(profile_edited)
+def profile_awards(sender, profile, **kwargs):
+    # Profile edits may earn an award.
+    if profile.is_valid:
+        tasks.award_event.spool(event=awards.PROFILE, user_id=profile.user_id, post_id=None)
+
+
+@receiver(pre_delete, sender=Post)
+def uncount_votes(sender, instance, **kwargs):
+    # The votes of the post are deleted with it.
+    voters = Vote.objects.filter(post=instance).values('author').annotate(count=Count('pk'))
+    total = 0
+    for row in voters:
+        awards.add_counts(row['author'], voted=-row['count'])
+        total += row['count']
+
+    if total:
+        awards.add_counts(instance.author_id, votes=-total)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    awards.add_counts(instance.author_id, posts=-1)
+
+
 @receiver(post_save, sender=Post)
 def finalize_post(sender, instance, created, **kwargs):
 
@@ -136,11 +162,16 @@ def finalize_post(sender, instance, created, **kwargs):
         # Send out mailing list when post is created.
         tasks.mailing_list.spool(uid=instance.uid, extra_context=extra_context)
 
-    # Set the tags on the instance.
+        # Count the post, more posts may earn the author an award.
+        awards.add_counts(instance.author, posts=1)
+        tasks.award_event.spool(event=awards.POST, user_id=instance.author_id, post_id=instance.pk)
+
+    # Set the tags on the instance, only the changes are written.
     if instance.is_toplevel:
-        tags = [Tag.objects.get_or_create(name=name)[0] for name in instance.parse_tags()]
-        instance.tags.clear()
-        instance.tags.add(*tags)
+        set_tags(instance, instance.parse_tags())
+
+    # The signature used to find near-duplicates.
+    similar.store(instance)
 
     # Ensure spam posts get closed status
     if instance.is_spam:
@@ -171,6 +202,13 @@ def check_spam(sender, instance, created, **kwargs):
     # Classify post as spam/ham.
     tasks.spam_check.spool(uid=instance.uid)
 
+@receiver(post_save, sender=Post)
+def post_embeds(sender, instance, created, **kwargs):
+    # Resolve remote embeds outside of the request.
+    if instance.uid and embed.has_placeholders(instance.html):
+        tasks.resolve_embeds.spool(uid=instance.uid)
+
+
 @receiver(post_save, sender=SharedLink)
 def link_title(sender, instance, created, **kwargs):
     # Set the title of each link upon creation
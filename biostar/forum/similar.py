@@ -0,0 +1,170 @@
+"""
+Finds near-duplicate posts through SimHash signatures.
+
+The signature of a text is a 64 bit SimHash of its words weighted by their
+counts, similar texts get signatures that differ in a few bits. The
+signature is stored in eight 8 bit bands, two signatures within seven bits
+of each other share at least one band. A lookup selects the recent posts
+matching any band through the (band, date) indices, then keeps the ones
+within SIMHASH_DISTANCE bits.
+"""
+import hashlib
+import logging
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+
+from biostar.forum import util
+from biostar.forum.models import Post, Signature
+
+logger = logging.getLogger('engine')
+
+BITS = 64
+BANDS = 8
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# The positions of the set bits of each byte value.
+BYTE_BITS = [[bit for bit in range(8) if value >> bit & 1] for value in range(256)]
+
+word_regx = re.compile(r"\w+")
+
+
+def features(text):
+    """
+    The words of the text, short posts vary too much in longer word sequences.
+    """
+    return word_regx.findall(text.lower())
+
+
+def get_digest(feature):
+    return hashlib.blake2b(feature.encode("utf-8"), digest_size=BITS // 8).digest()
+
+
+def get_hash(feature):
+    return int.from_bytes(get_digest(feature), "big")
+
+
+def simhash(text):
+    """
+    Returns the 64 bit signature of the text, zero for texts without words.
+    """
+    counts = Counter(features(text))
+    if not counts:
+        return 0
+
+    # The digest of each feature is repeated by its weight, the weights are then
+    # counted per value of each byte and spread over the set bits of the value.
+    data = b"".join(get_digest(feature) * weight for feature, weight in counts.items())
+    sums = [Counter(data[pos::BITS // 8]) for pos in range(BITS // 8)]
+
+    weights = [0] * BITS
+    for pos, values in enumerate(sums):
+        # The digest is big endian, the first byte holds the highest bits.
+        shift = BITS - 8 * (pos + 1)
+        for byte, weight in values.items():
+            for bit in BYTE_BITS[byte]:
+                weights[shift + bit] += weight
+
+    # A bit is set when the features having it outweigh the ones that do not.
+    total = sum(counts.values())
+    sig = 0
+    for bit, weight in enumerate(weights):
+        if weight * 2 > total:
+            sig |= 1 << bit
+
+    return sig
+
+
+def bands(sig):
+    return [(sig >> (BAND_BITS * i)) & BAND_MASK for i in range(BANDS)]
+
+
+def to_signed(sig):
+    return sig - (1 << BITS) if sig >= (1 << (BITS - 1)) else sig
+
+
+def to_unsigned(value):
+    return value & ((1 << BITS) - 1)
+
+
+def distance(sig1, sig2):
+    return bin(sig1 ^ sig2).count("1")
+
+
+def make_signature(pk, content, date):
+    sig = simhash(content)
+    fields = {f"band{i}": band for i, band in enumerate(bands(sig))}
+    return Signature(post_id=pk, simhash=to_signed(sig), date=date, **fields)
+
+
+def store(post):
+    """
+    Computes and saves the signature of the post.
+    """
+    sign = make_signature(pk=post.pk, content=post.content, date=post.creation_date)
+    fields = ['simhash', 'date'] + [f"band{i}" for i in range(BANDS)]
+    Signature.objects.update_or_create(post=post, defaults={name: getattr(sign, name) for name in fields})
+
+
+def candidates(sig, since):
+    """
+    Recent signatures sharing a band with the signature.
+    """
+    cond = Q()
+    for i, band in enumerate(bands(sig)):
+        cond |= Q(**{f"band{i}": band})
+    return Signature.objects.filter(cond, date__gte=since)
+
+
+def find(text, days=None, limit=None, exclude=None):
+    """
+    Returns the (post id, distance) of the recent near-duplicates of the text, closest first.
+    """
+    days = settings.SIMHASH_DAYS if days is None else days
+    limit = settings.SIMHASH_DISTANCE if limit is None else limit
+
+    sig = simhash(text)
+    if not sig:
+        return []
+
+    since = util.now() - timedelta(days=days)
+    rows = candidates(sig, since=since)
+    if exclude:
+        rows = rows.exclude(post_id=exclude)
+
+    found = [(pk, distance(sig, to_unsigned(value))) for pk, value in rows.values_list('post_id', 'simhash')]
+    found = [(pk, dist) for pk, dist in found if dist <= limit]
+    found.sort(key=lambda item: (item[1], item[0]))
+
+    return found
+
+
+def find_exact(content, author, seconds):
+    """
+    Returns the latest post of the author with the same content within the seconds.
+    """
+    sig = simhash(content)
+    since = util.now() - timedelta(seconds=seconds)
+    rows = Signature.objects.filter(band0=bands(sig)[0], simhash=to_signed(sig), date__gte=since,
+                                    post__author=author)
+    posts = Post.objects.filter(pk__in=rows.values('post_id')).order_by('-creation_date')
+
+    for post in posts:
+        if post.content == content:
+            return post
+
+    return None
+
+
+def similar_posts(post, days=None):
+    """
+    Returns the recent near-duplicates of the post, closest first.
+    """
+    found = find(post.content, days=days, exclude=post.pk)
+    posts = Post.objects.filter(pk__in=[pk for pk, dist in found]).select_related('author__profile')
+    posts = {p.pk: p for p in posts}
+    return [posts[pk] for pk, dist in found if pk in posts]
@@ -0,0 +1,110 @@
+"""
+Daily statistics of the site, rolled up one day at a time.
+
+Each DailyStats row holds the new users, posts and votes of a day along with
+the running totals at the end of that day. The totals of a day are the totals
+of the previous day plus the new items, only the first day of a run is
+counted over the whole tables.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Count, Q
+
+from biostar.accounts.models import Profile, User
+from biostar.forum import util
+from biostar.forum.models import Post, Vote, DailyStats
+
+logger = logging.getLogger("engine")
+
+# The running totals kept for each day.
+TOTALS = ['questions', 'answers', 'toplevel', 'comments', 'votes', 'users']
+
+
+def count_posts(**cond):
+    toplevel = Q(type__in=Post.TOP_LEVEL) & ~Q(type=Post.BLOG)
+    return Post.objects.filter(**cond).aggregate(
+        posts=Count('pk'),
+        questions=Count('pk', filter=Q(type=Post.QUESTION)),
+        answers=Count('pk', filter=Q(type=Post.ANSWER)),
+        toplevel=Count('pk', filter=toplevel),
+        comments=Count('pk', filter=Q(type=Post.COMMENT)),
+    )
+
+
+def get_counts(end):
+    """
+    The totals of the site before the end date.
+    """
+    data = count_posts(creation_date__lt=end)
+    data.pop('posts')
+    data['votes'] = Vote.objects.filter(date__lt=end).count()
+    data['users'] = User.objects.filter(profile__date_joined__lt=end).count()
+    return data
+
+
+def day_start(day):
+    """
+    Days begin at midnight UTC.
+    """
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def rollup(day, save=True):
+    """
+    Computes and stores the statistics of the day, returns the DailyStats.
+    """
+    start = day_start(day)
+    end = start + timedelta(days=1)
+
+    posts = count_posts(creation_date__gte=start, creation_date__lt=end)
+    new_votes = Vote.objects.filter(date__gte=start, date__lt=end).count()
+    new_users = Profile.objects.filter(date_joined__gte=start, date_joined__lt=end).count()
+
+    prev = DailyStats.objects.filter(date=day - timedelta(days=1)).first()
+    if prev:
+        # Add the new items to the totals of the previous day.
+        new = dict(posts, votes=new_votes, users=new_users)
+        totals = {name: getattr(prev, name) + new[name] for name in TOTALS}
+    else:
+        totals = get_counts(end=end)
+
+    values = dict(totals, new_posts=posts['posts'], new_votes=new_votes, new_users=new_users)
+    if not save:
+        return DailyStats(date=day, **values)
+
+    stats, created = DailyStats.objects.update_or_create(date=day, defaults=values)
+
+    return stats
+
+
+def first_day():
+    post = Post.objects.order_by('creation_date').only('creation_date').first()
+    return post.creation_date.date() if post else None
+
+
+def fill(start=None, end=None):
+    """
+    Rolls up the days missing between start and end, both included, in order.
+    Returns the number of days added. Defaults to the first post up to yesterday,
+    the days before the first post are never added.
+    """
+    first = first_day()
+    start = max(start, first) if start and first else first
+    end = end or util.now().date() - timedelta(days=1)
+    if not start or start > end:
+        return 0
+
+    found = set(DailyStats.objects.filter(date__gte=start, date__lte=end).values_list('date', flat=True))
+
+    count = 0
+    day = start
+    while day <= end:
+        if day not in found:
+            rollup(day)
+            count += 1
+        day += timedelta(days=1)
+
+    logger.info(f"rolled up {count} days of statistics")
+
+    return count
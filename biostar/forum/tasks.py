@@ -1,5 +1,8 @@
 import functools
+import itertools
 import random, logging, os
+import uuid
+from datetime import timedelta
 from biostar.accounts.tasks import create_messages
 from biostar.emailer.tasks import send_email
 from django.conf import settings
@@ -25,7 +28,7 @@ def notify_watched_tags(uid, extra_context):
     """
     Notify users watching a given tag found in post.
     """
-    from biostar.accounts.models import User
+    from biostar.accounts.models import get_watchers
     from biostar.forum.models import Post
     from django.conf import settings
 
@@ -34,11 +37,11 @@ def notify_watched_tags(uid, extra_context):
     # Update template context with post
     extra_context.update(dict(post=post))
 
-    users = [User.objects.filter(profile__watched__name__iexact=tag.name).distinct()
-             for tag in post.root.tags.all()]
+    # All watchers of the post tags in one query.
+    watchers = get_watchers(post.root.parse_tags())
 
-    # Flatten nested users queryset and get email.
-    emails = set(u.email for o in users for u in o)
+    # Flatten the watchers and get email.
+    emails = set(email for rows in watchers.values() for user_id, email, prefs in rows)
 
     from_email = settings.DEFAULT_NOREPLY_EMAIL
     if emails:
@@ -108,22 +111,8 @@ def created_post(pid):
 # Do this with celery.
 # @shared_task
 # @task
-@task
-def create_user_awards(user_id, limit=None):
-    from biostar.accounts.models import User
-    from biostar.forum.models import Award, Badge, Post
-    from biostar.forum.awards import ALL_AWARDS
-    from biostar.forum import util, auth
-    from django.conf import settings
-
-    limit = limit or settings.MAX_AWARDS
-
-    user = User.objects.filter(id=user_id).first()
-    # debugging
-    # Award.objects.all().delete()
-
-    # Collect valid targets
-    valid = auth.valid_awards(user=user)
+def give_awards(valid, limit):
+    from biostar.forum.models import Award
 
     # Pick random awards to give to user
     random.shuffle(valid)
@@ -142,31 +131,82 @@ def create_user_awards(user_id, limit=None):
         message(f"award {badge.name} created for {user.email}")
 
 
-def batch_create_awards(limit=100):
+@task(key="{user_id}")
+def create_user_awards(user_id, limit=None):
+    """
+    Checks every award for the user.
+    """
     from biostar.accounts.models import User
-    from biostar.forum import auth, models, util
+    from biostar.forum import auth
+    from django.conf import settings
 
-    # Randomly order awards
-    users = User.objects.order_by('?')[:limit]
+    limit = limit or settings.MAX_AWARDS
 
-    # Aggregate target awards into flat list
-    targets = []
-    for u in users:
-        valid = auth.valid_awards(user=u)
-        targets.extend(valid)
+    user = User.objects.filter(id=user_id).first()
 
-    def batch():
-        for target in targets:
-            if not target:
-                continue
-            user, badge, date, post = target
-            award = models.Award(user=user, badge=badge, date=date, post=post)
-            logger.debug(f"awarded {award.badge.name} to {user}")
+    # Collect valid targets
+    valid = auth.valid_awards(user=user)
 
-            yield award
+    give_awards(valid, limit=limit)
 
-    models.Award.objects.bulk_create(objs=batch(), batch_size=limit)
-    logger.info(f"{len(targets)} awards given to {len(users)} users")
+
+@task(key="{event}-{user_id}-{post_id}")
+def award_event(event, user_id, post_id=None, limit=None):
+    """
+    Checks the awards that depend on the event, for the user and the post of the event.
+    """
+    from biostar.forum.models import Post, User
+    from biostar.forum import auth, awards
+
+    user = User.objects.filter(id=user_id).first()
+    post = Post.objects.filter(id=post_id).first() if post_id else None
+    if not user:
+        return
+
+    valid = auth.valid_awards(user=user, rules=awards.get_rules(event), post=post)
+
+    # Events earn all their awards at once.
+    give_awards(valid, limit=limit)
+
+
+def batch_create_awards(limit=None, size=1000):
+    """
+    Gives every user the awards they earned, one query per badge.
+    The limit caps the awards given for each badge.
+
+    The activity counters kept for the award events are counted again first,
+    this is the pass that corrects their drift and should run periodically.
+    """
+    from itertools import islice
+    from biostar.forum import awards, models, util
+
+    count = awards.recount()
+    logger.info(f"{count} activity counters recounted")
+
+    badges = {badge.name: badge for badge in models.Badge.objects.all()}
+
+    total = 0
+    for award in awards.ALL_AWARDS:
+        badge = badges.get(award.name)
+        if not badge or not award.query:
+            continue
+
+        targets = islice(award.get_targets(), limit)
+        count = 0
+        while True:
+            chunk = [models.Award(user_id=user_id, badge=badge, post_id=post_id, date=date or util.now())
+                     for user_id, post_id, date in islice(targets, size)]
+            if not chunk:
+                break
+            models.Award.objects.bulk_create(chunk, batch_size=size)
+            count += len(chunk)
+
+        logger.info(f"{count} {badge.name} awards given")
+        total += count
+
+    logger.info(f"{total} awards given")
+
+    return total
 
 
 def high_trust(user, minscore=50):
@@ -182,6 +222,16 @@ def low_trust(user, minscore=50):
     return not high_trust(user, minscore=minscore)
 
 
+@task(key="{uid}")
+def resolve_embeds(uid):
+    """
+    Fetches the remote embeds of a post and patches its html.
+    """
+    from biostar.forum import embed
+
+    embed.resolve_post(uid=uid)
+
+
 @task
 def set_link_title(pk):
     """
@@ -213,7 +263,7 @@ def set_link_title(pk):
         logger.warning(exc)
 
 
-@task
+@task(key="{uid}")
 def spam_check(uid):
     from biostar.forum.models import Post, Log, delete_post_cache
     from biostar.accounts.models import User, Profile
@@ -238,9 +288,12 @@ def spam_check(uid):
 
     try:
         from biostar.utils import spamlib
+        from biostar.forum import similar
 
+        # Build the model in the background, the post is not classified meanwhile.
         if not os.path.isfile(settings.SPAM_MODEL):
-            spamlib.build_model(fname=settings.SPAM_DATA, model=settings.SPAM_MODEL)
+            spamlib.build_async(fname=settings.SPAM_DATA, model=settings.SPAM_MODEL)
+            return
 
         # Short posts do not get classified too many false positives
         if len(post.content) < 150:
@@ -259,6 +312,11 @@ def spam_check(uid):
         for word in spam_words:
             flag = flag or (word in post.title)
 
+        # Near-duplicates of spam are spam, whoever posts them.
+        if not flag:
+            found = [pk for pk, dist in similar.find(post.content, exclude=post.pk)]
+            flag = Post.objects.filter(pk__in=found, spam=Post.SPAM).exists()
+
         # Handle the spam.
         if flag:
 
@@ -288,39 +346,102 @@ def spam_check(uid):
     return False
 
 
+# The decisions queued by this process, every batch of them is learned.
+QUEUED = itertools.count(1)
+
+
+@task
+def spam_learn(uid):
+    """
+    Queues the moderator decision on a post, the spam model learns the decisions in batches.
+    The blocking runner does not learn in the request, the decisions wait for the spam command.
+    """
+    from biostar.forum.models import Post, SpamLabel
+
+    if not settings.CLASSIFY_SPAM:
+        return
+
+    post = Post.objects.filter(uid=uid).first()
+    if not post or post.spam == Post.DEFAULT:
+        return
+
+    SpamLabel.objects.create(content=post.content, spam=post.is_spam)
+
+    if next(QUEUED) % settings.SPAM_LEARN_BATCH == 0 and settings.TASK_RUNNER != 'block':
+        learn_labels()
+
+
+def learn_labels(size=1000):
+    """
+    Feeds the queued moderator decisions to the spam model, returns the number learned.
+    The decisions stay queued when the model cannot be updated.
+    """
+    from django.utils import timezone
+    from biostar.forum.models import SpamLabel
+    from biostar.utils import spamlib
+
+    # Claims of checkpoints that did not finish expire.
+    now = timezone.now()
+    free = Q(claim='') | Q(claimed__lt=now - timedelta(seconds=settings.SPAM_CLAIM_SECS))
+
+    # Claim the rows, the rows claimed meanwhile by another checkpoint are skipped.
+    token = uuid.uuid4().hex
+    pks = list(SpamLabel.objects.filter(free).order_by('pk').values_list('pk', flat=True)[:size])
+    SpamLabel.objects.filter(free, pk__in=pks).update(claim=token, claimed=now)
+
+    # The model learns outside of any database transaction.
+    labels = SpamLabel.objects.filter(claim=token)
+    decisions = list(labels.order_by('pk').values_list('content', 'spam'))
+    count = spamlib.learn(decisions, model=settings.SPAM_MODEL)
+
+    if count:
+        labels.delete()
+    else:
+        labels.update(claim='', claimed=None)
+
+    return count
+
+
+@timer(settings.SPAM_LEARN_SECS)
+def spam_checkpoint(*args, **kwargs):
+    """
+    Learns the moderator decisions that did not fill a batch.
+    The blocking runner calls timers at import, the spam command learns the decisions instead.
+    """
+    if not settings.CLASSIFY_SPAM or settings.TASK_RUNNER == 'block':
+        return
+
+    try:
+        learn_labels()
+    except Exception as exc:
+        logger.error(exc)
+
+
 @task
 def herald_emails(uid):
     """
     Send emails to herald subscribers
     """
     from biostar.emailer.models import EmailSubscription, EmailGroup
+    from biostar.emailer.recipients import send_batches
+    from biostar.emailer.tasks import mass_sender
     from biostar.forum.models import Post
     post = Post.objects.filter(uid=uid).first()
     group = EmailGroup.objects.filter(uid='herald').first()
     # Get active subscriptions to herald.
     subs = EmailSubscription.objects.filter(group=group, state=EmailSubscription.ACTIVE)
 
-    if not subs:
-        return
-
-    emails = subs.values_list('email', flat=True)
     context = dict(post=post)
     # Prepare the templates and emails
     email_template = "herald/herald_email.html"
     author = post.author.profile.name
     from_email = settings.DEFAULT_NOREPLY_EMAIL
 
-    # Total number of recipients allowed per open connection,
-    # Amazon SES has limit of 50
-    batch_size = 40
+    # The shared parts of the email are rendered once for all batches.
+    send = mass_sender(template_name=email_template, extra_context=context, name=author, from_email=from_email)
 
-    # Iterate through recipients and send emails in batches.
-    for idx in range(0, len(emails), batch_size):
-        # Get the next set of emails
-        end = idx + batch_size
-        rec_list = emails[idx:end]
-        send_email(template_name=email_template, extra_context=context, name=author,
-        from_email=from_email,recipient_list=rec_list, mass=True)
+    # Send in batches sized for the email provider, resumes where an earlier run stopped.
+    send_batches(name=f"herald-{uid}", query=subs, send=send)
 
     return
 
@@ -333,13 +454,13 @@ def mailing_list(uid, extra_context={}):
     from django.conf import settings
     from biostar.forum.models import Post
     from biostar.accounts.models import User, Profile
+    from biostar.emailer.recipients import send_batches
+    from biostar.emailer.tasks import mass_sender
 
     # Get the post and users that have this enabled.
     post = Post.objects.filter(uid=uid).first()
     users = User.objects.filter(profile__digest_prefs=Profile.ALL_MESSAGES)
 
-    emails = [user.email for user in users]
-
     # Update template context with post
     extra_context.update(dict(post=post))
 
@@ -347,16 +468,16 @@ def mailing_list(uid, extra_context={}):
     email_template = "messages/mailing_list.html"
     author = post.author.profile.name
     from_email = settings.DEFAULT_NOREPLY_EMAIL
-    if emails:
-        send_email(template_name=email_template,
-                   extra_context=extra_context,
-                   name=author,
-                   from_email=from_email,
-                   recipient_list=emails,
-                   mass=True)
 
+    # The shared parts of the email are rendered once for all batches.
+    send = mass_sender(template_name=email_template, extra_context=extra_context, name=author,
+                       from_email=from_email)
 
-@task
+    # Stream the users in batches, resumes where an earlier run stopped.
+    send_batches(name=f"mailing-{uid}", query=users, send=send)
+
+
+@task(key="{uid}", merge=["sub_ids"])
 def notify_followers(sub_ids, author_id, uid, extra_context={}):
     """
     Generate notification to users subscribed to a post, excluding author, a message/email.
@@ -2,6 +2,7 @@ import logging
 import os
 import shutil
 import datetime
+import json
 from django.core import management
 from django.urls import reverse
 from django.test import TestCase, override_settings
@@ -59,4 +60,41 @@ class PostAPITest(TestCase):
         self.assertEqual(response.status_code, 200)
         #self.process_response(response=response)
 
+    def test_stats(self):
+        """Test the daily statistics rollup"""
+        from biostar.forum import stats
+
+        day = self.post.creation_date.date() - datetime.timedelta(days=1)
+        models.Post.objects.filter(pk=self.post.pk).update(creation_date=self.post.creation_date - datetime.timedelta(days=1))
+        models.Post.objects.create(title="Test", author=self.owner, content="Test", type=models.Post.QUESTION,
+                                   creation_date=self.post.creation_date - datetime.timedelta(days=3))
+
+        # Fills in every day from the first post once, the totals carry over from the previous day.
+        self.assertEqual(stats.fill(start=day - datetime.timedelta(days=3), end=day), 3)
+        self.assertEqual(stats.fill(start=day - datetime.timedelta(days=3), end=day), 0)
+
+        rows = models.DailyStats.objects.order_by('date')
+        self.assertEqual([row.questions for row in rows], [1, 1, 2])
+        self.assertEqual([row.new_posts for row in rows], [1, 0, 1])
+        self.assertEqual(rows.last().questions, stats.get_counts(end=stats.day_start(day) + datetime.timedelta(days=1))['questions'])
+
+        start, end = day - datetime.timedelta(days=3), day
+        url = reverse("api_stats_range", kwargs=dict(start=f"{start}", end=f"{end}"))
+        request = fake_request(url=url, data={}, user=self.owner)
+        response = api.daily_stats_range(request=request, start=f"{start}", end=f"{end}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 3)
+
+        # The days before the first post are not rolled up.
+        self.assertEqual(stats.fill(start=datetime.date(1900, 1, 1), end=day), 0)
+
+        # Days before the first post are computed but not stored.
+        self.assertEqual(api.compute_stats(datetime.datetime(1900, 1, 1))['questions'], 0)
+        self.assertFalse(models.DailyStats.objects.filter(date=datetime.date(1900, 1, 1)).exists())
+
+        # Ranges only list the days already rolled up.
+        models.DailyStats.objects.filter(date=day).delete()
+        response = api.daily_stats_range(request=request, start=f"{start}", end=f"{end}")
+        self.assertEqual(len(json.loads(response.content)), 2)
+        self.assertFalse(models.DailyStats.objects.filter(date=day).exists())
 
@@ -1,8 +1,11 @@
+import json
 import logging
 import os
-from django.test import TestCase
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from django.test import TestCase, override_settings
 from django.conf import settings
-from biostar.forum import models, markdown
+from biostar.forum import models, markdown, embed
 from biostar.accounts.models import User
 
 logger = logging.getLogger('engine')
@@ -23,8 +26,8 @@ TEST_CASES = [
     # User profile url pattern
     (f"{settings.PROTOCOL}://{SITE_URL}/u/5 ", f'<p><a href="{settings.PROTOCOL}://{SITE_URL}/u/5" rel="nofollow">tested2</a></p>'),
 
-    # Twitter link
-    ("https://twitter.com/Linux/status/2311234267", '<p><blockquote class="twitter-tweet"><p lang="en" dir="ltr">w00t! 10,000 followers!</p>&mdash; Linux (@Linux) <a href="https://twitter.com/Linux/status/2311234267?ref_src=twsrc%5Etfw">June 24, 2009</a></blockquote><script async src="https://platform.twitter.com/widgets.js" charset="utf-8"></script></p>'),
+    # Twitter link, resolved in the background.
+    ("https://twitter.com/Linux/status/2311234267", '<p><a href="https://twitter.com/Linux/status/2311234267" rel="nofollow" data-embed="twitter:2311234267">https://twitter.com/Linux/status/2311234267</a></p>'),
 
     # Youtube link
     ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", '<p><iframe width="420" height="315" src="//www.youtube.com/embed/dQw4w9WgXcQ" frameborder="0" allowfullscreen></iframe></p>'),
@@ -111,3 +114,106 @@ class MarkdownTest(TestCase):
 
         # Catch all errors at once.
         self.assertTrue(error_count == 0)
+
+    def test_forged_marker(self):
+        """
+        Markers typed in the post are not replaced by the embedded html.
+        """
+        text = "\ue0000\ue001 https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+        html = markdown.parse(text, clean=True, escape=False)
+        self.assertEqual(html.count("<iframe"), 1)
+        self.assertIn("\ue0000\ue001", html)
+
+    def test_golden(self):
+        """
+        The rendered html matches the output recorded on a corpus of posts.
+        """
+        fname = os.path.join(os.path.dirname(__file__), 'data', 'markdown.json')
+        corpus = json.load(open(fname))
+
+        for item in corpus:
+            text = item['text']
+            self.assertEqual(markdown.parse(text, clean=True, escape=False), item['html'], text)
+            self.assertEqual(markdown.parse(text, clean=True, escape=True), item['escaped'], text)
+            self.assertEqual(markdown.parse(text, clean=False, escape=False), item['raw'], text)
+
+
+TWEET_HTML = '<blockquote class="twitter-tweet"><p>w00t! 10,000 followers!</p></blockquote>'
+
+
+class TweetHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the oembed endpoint, fails on the tweet id 0.
+    """
+    calls = []
+
+    def do_GET(self):
+        TweetHandler.calls.append(self.path)
+        if self.path.endswith("=0"):
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps(dict(html=TWEET_HTML)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class EmbedTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(("127.0.0.1", 0), TweetHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/oembed?id={{uid}}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        logger.setLevel(logging.WARNING)
+        TweetHandler.calls = []
+        self.owner = User.objects.create(username="test", email="tested2@tested.com", password="tested")
+
+    def create_post(self, content):
+        with override_settings(TWITTER_OEMBED_URL=self.url):
+            post = models.Post.objects.create(title="Test", author=self.owner, content=content,
+                                              type=models.Post.QUESTION)
+        return models.Post.objects.filter(pk=post.pk).first()
+
+    def test_resolve_tweet(self):
+        """
+        Tweets are patched into the post html and cached.
+        """
+        post = self.create_post("https://twitter.com/Linux/status/2311234267")
+
+        self.assertIn(TWEET_HTML, post.html)
+        self.assertTrue(models.Embed.objects.filter(key="twitter:2311234267", valid=True).exists())
+
+        # A second post is rendered from the cache.
+        calls = len(TweetHandler.calls)
+        post = self.create_post("Again https://twitter.com/Linux/status/2311234267")
+        self.assertIn(TWEET_HTML, post.html)
+        self.assertEqual(calls, len(TweetHandler.calls))
+
+    def test_failed_tweet(self):
+        """
+        Failed lookups fall back to links and are not retried.
+        """
+        post = self.create_post("https://twitter.com/Linux/status/0")
+
+        self.assertFalse(embed.has_placeholders(post.html))
+        self.assertIn('<a href="https://twitter.com/Linux/status/0" rel="nofollow">', post.html)
+        self.assertTrue(models.Embed.objects.filter(key="twitter:0", valid=False).exists())
+
+        calls = len(TweetHandler.calls)
+        self.create_post("Again https://twitter.com/Linux/status/0")
+        self.assertEqual(calls, len(TweetHandler.calls))
@@ -19,6 +19,10 @@ TEST_INDEX_DIR = TEST_ROOT
 TEST_INDEX_NAME = "index"
 
 
+def detect_fr(text):
+    return "fr"
+
+
 class PostTest(TestCase):
 
     def setUp(self):
@@ -61,6 +65,85 @@ class PostTest(TestCase):
         tasks.create_user_awards(self.owner.id)
 
 
+    def test_award_event(self):
+        """
+        Test awards given on events against the counters
+        """
+        from biostar.forum import auth, awards
+
+        # The counter is filled in the first time and maintained after.
+        self.assertEqual(awards.get_counter(self.owner).posts, 1)
+        models.Post.objects.create(title="Test", author=self.owner, content="Test", type=models.Post.QUESTION)
+        self.assertEqual(awards.get_counter(self.owner).posts, 2)
+
+        for step in range(6):
+            voter = User.objects.create(username=f"voter{step}", email=f"voter{step}@tested.com")
+            auth.apply_vote(post=self.post, user=voter, vote_type=models.Vote.UP)
+
+        self.assertEqual(awards.get_counter(self.owner).votes, 6)
+        self.assertEqual(awards.get_counter(voter).voted, 1)
+
+        # Only the rules of the event are checked.
+        self.assertFalse(models.Award.objects.filter(post=self.post).exists())
+        tasks.award_event(event=awards.VIEW, user_id=self.owner.id, post_id=self.post.id)
+        self.assertFalse(models.Award.objects.filter(post=self.post).exists())
+
+        tasks.award_event(event=awards.VOTE, user_id=self.owner.id, post_id=self.post.id)
+        names = models.Award.objects.filter(post=self.post).values_list('badge__name', flat=True)
+        self.assertIn("Appreciated", names)
+
+        # Deleting a post takes its votes off the counters.
+        self.post.delete()
+        self.assertEqual(awards.get_counter(self.owner).posts, 1)
+        self.assertEqual(awards.get_counter(self.owner).votes, 0)
+        self.assertEqual(awards.get_counter(voter).voted, 0)
+
+        # Drifted counters are counted again.
+        models.Counter.objects.filter(user=self.owner).update(posts=10)
+        self.assertEqual(awards.recount(), models.Counter.objects.count())
+        self.assertEqual(awards.get_counter(self.owner).posts, 1)
+
+        self.assertTrue(awards.crossed(1000, 1001))
+        self.assertFalse(awards.crossed(1001, 1002))
+
+    def test_profile_award(self):
+        """
+        Test the profile awards are checked when the profile is edited
+        """
+        from biostar.accounts.forms import EditProfile
+        from biostar.accounts.models import Profile
+
+        Profile.objects.filter(user=self.owner).update(score=10)
+        data = {"email": self.owner.email, "name": "Test", "handle": "test", "text": "TESTING " * 20,
+                "digest_prefs": Profile.DAILY_DIGEST, "message_prefs": Profile.LOCAL_MESSAGE}
+
+        form = EditProfile(data=data, user=User.objects.get(pk=self.owner.pk))
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.assertTrue(models.Award.objects.filter(user=self.owner, badge__name="Autobiographer").exists())
+
+    def test_batch_awards(self):
+        """
+        Test giving the awards of all users in batch mode
+        """
+        second = models.Post.objects.create(title="Test", author=self.owner, content="Test",
+                                            type=models.Post.QUESTION)
+        models.Post.objects.filter(pk__in=[self.post.pk, second.pk]).update(vote_count=6, view_count=6000)
+
+        tasks.batch_create_awards()
+        awards = models.Award.objects.filter(user=self.owner)
+
+        # Limited awards are given once, the others once per post.
+        self.assertEqual(awards.filter(badge__name="Student").count(), 1)
+        self.assertEqual(awards.filter(badge__name="Great Question").count(), 2)
+        self.assertEqual(awards.filter(badge__name="Popular Question").first().post, self.post)
+
+        # Nothing is given twice.
+        count = awards.count()
+        self.assertEqual(tasks.batch_create_awards(), 0)
+        self.assertEqual(awards.count(), count)
+
     def test_comment_traversal(self):
         """Test comment rendering pages"""
 
@@ -116,6 +199,206 @@ class PostTest(TestCase):
 
         management.call_command('populate', n_users=10, n_messages=10, n_votes=10, n_posts=10)
 
+    def test_rerender(self):
+        "Test the bulk re-rendering of posts"
+
+        models.Post.objects.filter(pk=self.post.pk).update(html='')
+        checkpoint = os.path.join(TEST_ROOT, 'rerender.checkpoint')
+        os.makedirs(TEST_ROOT, exist_ok=True)
+
+        management.call_command('rerender', workers=1, type='question', since='2000-01-01',
+                                checkpoint=checkpoint)
+
+        post = models.Post.objects.filter(pk=self.post.pk).first()
+        self.assertEqual(post.html.strip(), '<p>Test</p>')
+        self.assertFalse(os.path.isfile(checkpoint))
+
+        # Several processes render the chunks.
+        posts = [models.Post.objects.create(title=f"Test {n}", author=self.owner, content=f"Text {n}",
+                                            type=models.Post.QUESTION) for n in range(5)]
+        models.Post.objects.update(html='')
+
+        management.call_command('rerender', workers=2, size=2, checkpoint=checkpoint)
+
+        for n, post in enumerate(posts):
+            post.refresh_from_db()
+            self.assertEqual(post.html.strip(), f'<p>Text {n}</p>')
+
+    def test_tags(self):
+        "Test that only the changed tags are written"
+        from biostar.utils.tags import set_tags, batch_set_tags
+
+        self.post.tag_val = "foo,bar"
+        self.post.save()
+        self.assertEqual(set(self.post.tags.names()), {"foo", "bar"})
+
+        # Unchanged tags are not written.
+        with self.assertNumQueries(1):
+            self.assertFalse(set_tags(self.post, ["bar", "foo"]))
+
+        self.post.tag_val = "bar,baz"
+        self.post.save()
+        self.assertEqual(set(self.post.tags.names()), {"bar", "baz"})
+
+        # Tag many posts at once.
+        posts = [models.Post.objects.create(title=f"Test {n}", author=self.owner, content="Test",
+                                            type=models.Post.QUESTION) for n in range(3)]
+        count = batch_set_tags([(post, ["foo", f"tag{n}"]) for n, post in enumerate(posts)], size=2)
+        self.assertEqual(count, 3)
+        for n, post in enumerate(posts):
+            self.assertEqual(set(post.tags.names()), {"foo", f"tag{n}"})
+
+    def test_watchers(self):
+        "Test the watched tag index"
+        from biostar.accounts.models import Profile, get_watchers
+
+        profile = self.owner.profile
+        Profile.objects.filter(pk=profile.pk).update(watched_tags="Foo,bar")
+        Profile.objects.get(pk=profile.pk).add_watched()
+
+        watchers = get_watchers(["foo", "BAR", "baz"])
+        self.assertEqual(watchers["foo"], [(self.owner.pk, self.owner.email, profile.message_prefs)])
+        self.assertEqual(watchers["baz"], [])
+
+        # Changes invalidate the cached watchers.
+        Profile.objects.filter(pk=profile.pk).update(watched_tags="baz")
+        Profile.objects.get(pk=profile.pk).add_watched()
+        watchers = get_watchers(["foo", "baz"])
+        self.assertEqual((len(watchers["foo"]), len(watchers["baz"])), (0, 1))
+
+        # The post notification goes through the index.
+        post = models.Post.objects.create(title="Test", author=self.staff_user, content="Test", tag_val="baz",
+                                          type=models.Post.QUESTION)
+        tasks.notify_watched_tags(uid=post.uid, extra_context={})
+
+    def test_diff(self):
+        "Test the diffs created on edits"
+        from biostar.forum import auth
+
+        # Trailing spaces are not a change.
+        self.assertIsNone(auth.create_diff(text="Test  ", post=self.post, user=self.staff_user))
+        self.assertEqual(auth.diff_ratio("foo\nbar", "foo\nbar \n"), 1)
+
+        dobj = auth.create_diff(text="Test\nmore", post=self.post, user=self.staff_user)
+        dobj = models.Diff.objects.get(pk=dobj.pk)
+        self.assertIn("+more", dobj.diff)
+
+        # The upper bounds stop below the cutoff.
+        self.assertEqual(auth.diff_ratio("a\nb", "c\nd\ne\nf\ng", cutoff=0.5), 0)
+        self.assertEqual(auth.diff_ratio("a\nb\nc", "a\nb\nd"), round(2 / 3, 5))
+
+        with override_settings(DIFF_MAX_SIZE=5):
+            self.assertEqual(auth.diff_ratio("a\nb\nc", "a\nb\nd"), 0)
+            # Large edits only note the sizes.
+            diff = auth.compute_diff("a\nb\nc", "a\nb\nd")
+            self.assertIn("5 characters changed to 5 characters", diff)
+            self.assertNotIn("-a", diff)
+
+        # Rewrites below the cutoff are not matched either.
+        self.assertIn("-a\n-b\n", auth.compute_diff("a\nb", "c\nd\ne\nf\ng", cutoff=0.5))
+        self.assertEqual(auth.diff_ratio("a\nb\nc\nd", "a\nx\ny\nz", cutoff=0.5), 0)
+
+        # Edits through the forms record the diff.
+        from biostar.forum.forms import PostShortForm
+        answer = models.Post.objects.create(title="Test", author=self.owner, content="Some answer text",
+                                            type=models.Post.ANSWER, parent=self.post)
+        form = PostShortForm(post=answer, user=self.owner, data=dict(content="Some answer text\nand more"))
+        self.assertTrue(form.is_valid(), form.errors)
+        form.edit()
+        self.assertIn("+and more", models.Diff.objects.filter(post=answer).first().diff)
+        self.assertNotIn("-a\n", auth.compute_diff("a\nb\nc", "a\nb\nd", cutoff=0.5))
+
+    @override_settings(SEND_MAIL=True)
+    def test_digest(self):
+        "Test digests are built once per distinct set of watched tags"
+        from django.core import mail
+        from biostar.accounts.models import Profile
+        from biostar.forum.management.commands import digest
+
+        models.Post.objects.create(title="Foo post", author=self.owner, content="Test", tag_val="foo",
+                                   type=models.Post.QUESTION)
+        models.Post.objects.create(title="Bar post", author=self.owner, content="Test", tag_val="bar",
+                                   type=models.Post.QUESTION)
+
+        watched = dict(a="foo", b="Foo,unknown", c="unknown", d="")
+        for name, tags in watched.items():
+            user = User.objects.create(username=name, email=f"{name}@lvh.me")
+            Profile.objects.filter(user=user).update(digest_prefs=Profile.DAILY_DIGEST, watched_tags=tags)
+
+        posts = list(models.Post.objects.filter(is_toplevel=True).order_by('-lastedit_date'))
+        index = digest.build_index(posts)
+        users = User.objects.filter(profile__digest_prefs=Profile.DAILY_DIGEST)
+        groups = digest.group_users(users.values_list('email', 'profile__watched_tags'), index)
+        self.assertEqual(len(groups), 2)
+        # Posts with watched tags come first, the others follow newest first.
+        selected = [post.title for post in digest.select_posts({"foo"}, posts, index)]
+        self.assertEqual(selected, ["Foo post", "Bar post", "Test"])
+
+        digest.send_digests(days=1, subject="Daily digest")
+        bodies = {msg.to[0]: msg.body for msg in mail.outbox}
+        self.assertEqual(set(bodies), {"a@lvh.me", "b@lvh.me", "c@lvh.me", "d@lvh.me"})
+        self.assertLess(bodies["a@lvh.me"].index("Foo post"), bodies["a@lvh.me"].index("Bar post"))
+        self.assertLess(bodies["c@lvh.me"].index("Bar post"), bodies["c@lvh.me"].index("Foo post"))
+
+    def test_similar(self):
+        "Test near-duplicates are found regardless of the author"
+        from biostar.forum import similar, auth
+
+        text = "Buy cheap watches online today, the best replica watches with free shipping to every country."
+        spam = models.Post.objects.create(title="Watches", author=self.owner, content=text,
+                                          type=models.Post.QUESTION)
+        other = models.Post.objects.create(title="Watches", author=self.staff_user, content=text + " Hurry!",
+                                           type=models.Post.QUESTION)
+
+        sig1, sig2 = similar.simhash(text), similar.simhash(text + " Hurry!")
+        self.assertLessEqual(similar.distance(sig1, sig2), 7)
+
+        # The signature sets the bits carried by most of the words.
+        words = similar.features(text + " watches watches")
+        hashes = [similar.get_hash(word) for word in words]
+        expected = sum(1 << bit for bit in range(64) if sum(value >> bit & 1 for value in hashes) * 2 > len(words))
+        self.assertEqual(similar.simhash(text + " watches watches"), expected)
+
+        found = [pk for pk, dist in similar.find(text + " Hurry!", exclude=other.pk)]
+        self.assertEqual(found, [spam.pk])
+        self.assertEqual(similar.similar_posts(spam), [other])
+        self.assertEqual(similar.find("A completely different question about aligners and reads"), [])
+
+        # Exact duplicates of the same author are not created again.
+        post = auth.create_post(author=self.owner, title="Watches", content=text)
+        self.assertEqual(post, spam)
+
+        # Signatures of the existing posts.
+        models.Signature.objects.all().delete()
+        management.call_command('signatures', batch=2)
+        self.assertEqual(models.Signature.objects.count(), models.Post.objects.count())
+        self.assertEqual(similar.similar_posts(spam), [other])
+
+    def test_language(self):
+        "Test language detection on a sample of the content"
+        from django.core.exceptions import ValidationError
+        from biostar.forum.forms import valid_language
+        from biostar.utils import language
+
+        text = "This is a question about aligning sequencing reads to the reference genome. " * 200
+        sample = language.sample(text + "\n```\nsamtools view -b file.sam\n```\n")
+        self.assertLessEqual(len(sample), settings.LANGUAGE_SAMPLE + 2)
+        self.assertNotIn("samtools", sample)
+
+        self.assertEqual(language.detect(text), "en")
+        valid_language(text)
+
+        with self.assertRaises(ValidationError):
+            valid_language("Esta es una pregunta sobre el alineamiento de lecturas contra el genoma de referencia.")
+
+        # Prose wrapped in a code block is still checked.
+        with self.assertRaises(ValidationError):
+            valid_language("```\nEsta es una pregunta sobre el alineamiento de lecturas contra el genoma de referencia.\n```")
+
+        # The detector is part of the cache key.
+        with self.settings(LANGUAGE_DETECTOR="biostar.forum.tests.test_post.detect_fr"):
+            self.assertEqual(language.detect(text), "fr")
+
     def test_markdown(self):
         "Test the markdown rendering"
         from django.core import management
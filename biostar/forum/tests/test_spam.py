@@ -1,10 +1,12 @@
 import logging
+import itertools
 import os
 import shutil
 from django.core import management
 from django.urls import reverse
 from django.test import TestCase, override_settings
 from django.conf import settings
+from django.utils import timezone
 from biostar.forum import models, views
 from biostar.utils.helpers import fake_request
 from biostar.accounts.models import User
@@ -12,6 +14,27 @@ from biostar.utils import spamlib
 
 logger = logging.getLogger('engine')
 
+
+class WordModel(object):
+    """
+    Stands in for the fitted pipeline.
+    """
+
+    def __init__(self, word):
+        self.word = word
+        self.learned = []
+
+    def partial_fit(self, X, y, classes=None):
+        self.learned.extend(y)
+
+    classes_ = [0, 1]
+
+    def predict(self, X):
+        return [int(self.word in text) for text in X]
+
+    def predict_proba(self, X):
+        return [[1 - y, y] for y in self.predict(X)]
+
 TEST_SPAM_ROOT = os.path.abspath(os.path.join(settings.BASE_DIR, 'export', 'test', 'test_spammers'))
 TEST_SPAM_DIR = TEST_SPAM_ROOT
 TEST_SPAM_INDEX_NAME = "test_spam"
@@ -35,6 +58,93 @@ class TestSpam(TestCase):
 
         #spam.build_spam_index()
 
+    def test_model_cache(self):
+        """
+        Test the spam model is loaded once and reloaded when the file changes
+        """
+        os.makedirs(TEST_SPAM_ROOT, exist_ok=True)
+        path = os.path.join(TEST_SPAM_ROOT, "test.model")
+        spamlib.dump(WordModel("spam"), path)
+
+        holder = spamlib.ModelHolder()
+        model = holder.get(path)
+        self.assertIs(holder.get(path), model)
+        self.assertEqual(model.predict(["this is spam"]), [1])
+
+        mtime = os.path.getmtime(path)
+        spamlib.dump(WordModel("ham"), path)
+        os.utime(path, (mtime + 10, mtime + 10))
+        self.assertEqual(holder.get(path).word, "ham")
+
+        os.remove(path)
+        self.assertIsNone(holder.get(path))
+
+    def test_rescore(self):
+        """
+        Test scoring posts in batches
+        """
+        os.makedirs(TEST_SPAM_ROOT, exist_ok=True)
+        path = os.path.join(TEST_SPAM_ROOT, "rescore.model")
+        spamlib.dump(WordModel("spam"), path)
+        ham = models.Post.objects.create(title=f"Test", author=self.owner, content="hello",
+                                         type=models.Post.QUESTION)
+
+        management.call_command('spam', rescore=True, since=1, model=path, dry=True)
+        self.assertEqual(models.Post.objects.filter(spam_score=1).count(), 0)
+
+        management.call_command('spam', rescore=True, since=1, model=path, batch=3)
+        self.assertEqual(models.Post.objects.filter(spam_score=1).count(), 10)
+        self.assertEqual(models.Post.objects.get(pk=ham.pk).spam_score, 0)
+        os.remove(path)
+
+    def test_learn(self):
+        """
+        Test the spam model learns from the moderator decisions
+        """
+        from biostar.forum import tasks
+
+        os.makedirs(TEST_SPAM_ROOT, exist_ok=True)
+        path = os.path.join(TEST_SPAM_ROOT, "learn.model")
+        spamlib.dump(WordModel("spam"), path)
+
+        ham = models.Post.objects.create(title=f"Test", author=self.owner, content="hello",
+                                         type=models.Post.QUESTION, spam=models.Post.NOT_SPAM)
+
+        with override_settings(SPAM_MODEL=path, SPAM_LEARN_BATCH=2):
+            # The blocking runner leaves the decisions queued.
+            tasks.spam_learn(uid=self.spam.uid)
+            tasks.spam_learn(uid=ham.uid)
+            self.assertEqual(spamlib.load_model(path).learned, [])
+            self.assertEqual(models.SpamLabel.objects.count(), 2)
+
+            # The decisions are learned as one batch by the command.
+            management.call_command("spam", learn=True)
+            self.assertEqual(spamlib.load_model(path).learned, [1, 0])
+            self.assertFalse(models.SpamLabel.objects.exists())
+
+            # Other runners learn each batch.
+            tasks.QUEUED = itertools.count(1)
+            with override_settings(TASK_RUNNER="threaded"):
+                tasks.spam_learn(uid=self.spam.uid)
+                self.assertEqual(models.SpamLabel.objects.count(), 1)
+                tasks.spam_learn(uid=ham.uid)
+            self.assertEqual(spamlib.load_model(path).learned, [1, 0, 1, 0])
+            self.assertFalse(models.SpamLabel.objects.exists())
+
+            # Decisions claimed by another checkpoint are skipped until the claim expires.
+            tasks.spam_learn(uid=self.spam.uid)
+            models.SpamLabel.objects.update(claim="other", claimed=timezone.now())
+            self.assertEqual(tasks.learn_labels(), 0)
+            self.assertEqual(models.SpamLabel.objects.count(), 1)
+
+            with override_settings(SPAM_CLAIM_SECS=-1):
+                self.assertEqual(tasks.learn_labels(), 1)
+            self.assertEqual(spamlib.load_model(path).learned, [1, 0, 1, 0, 1])
+            self.assertFalse(models.SpamLabel.objects.exists())
+
+        os.remove(path)
+        os.remove(f"{path}.lock")
+
     def Xtest_score(self):
         """
         Test spam scoring
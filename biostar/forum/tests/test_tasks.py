@@ -0,0 +1,337 @@
+import logging
+import threading
+
+from django.core import management
+from django.test import TestCase, override_settings
+
+from biostar.accounts.models import Task, TaskStat, TimerLease
+from biostar.utils import pool, dbqueue, decorators, taskstats, scheduler
+
+logger = logging.getLogger('engine')
+
+# Collects the values seen by the queued tasks.
+RESULTS = []
+
+
+def record(value, extra=None):
+    RESULTS.append((value, extra))
+
+
+def fail():
+    raise ValueError("failing task")
+
+
+# Holds the slow task until released.
+GATE = threading.Event()
+
+
+def slow():
+    GATE.wait(timeout=10)
+
+
+class PoolTest(TestCase):
+
+    def setUp(self):
+        logger.setLevel(logging.WARNING)
+        # Keeps the workers busy until released.
+        self.gate = threading.Event()
+        self.done = []
+
+    def job(self, value):
+        self.gate.wait(timeout=10)
+        self.done.append(value)
+
+    def test_pool(self):
+        "Test tasks run in the pool and the pool drains"
+
+        tpool = pool.TaskPool(workers=2, limit=10)
+        for value in range(5):
+            tpool.submit(self.job, value)
+
+        stats = tpool.stats()
+        self.assertEqual(stats['pending'] + stats['active'], 5)
+
+        self.gate.set()
+        self.assertTrue(tpool.shutdown(timeout=10))
+        self.assertEqual(sorted(self.done), list(range(5)))
+        self.assertEqual(tpool.stats()['done'], 5)
+
+    def test_overflow(self):
+        "Test the overflow policies of a full pool"
+
+        tpool = pool.TaskPool(workers=1, limit=1, overflow=pool.DROP)
+        for value in range(3):
+            tpool.submit(self.job, value)
+        self.assertEqual(tpool.stats()['dropped'], 1)
+
+        self.gate.set()
+        self.assertTrue(tpool.shutdown(timeout=10))
+        self.assertEqual(sorted(self.done), [0, 1])
+
+        # Full pools may run the task in the caller.
+        self.gate.clear()
+        tpool = pool.TaskPool(workers=1, limit=1, overflow=pool.INLINE)
+        for value in range(2):
+            tpool.submit(self.job, value)
+        tpool.submit(self.done.append, 'inline')
+        self.assertEqual(self.done[-1], 'inline')
+
+        self.gate.set()
+        self.assertTrue(tpool.shutdown(timeout=10))
+        self.assertEqual(tpool.stats()['inline'], 1)
+
+    def test_shutdown(self):
+        "Test the shutdown waits at most the timeout for running tasks"
+
+        tpool = pool.TaskPool(workers=1, limit=1)
+        tpool.submit(self.job, 0)
+        self.assertFalse(tpool.shutdown(timeout=0.1))
+
+        # Tasks spooled after the shutdown run in the caller.
+        tpool.submit(self.done.append, 'late')
+        self.assertEqual(self.done, ['late'])
+
+        self.gate.set()
+        self.assertTrue(tpool.drain(timeout=10))
+        self.assertEqual(self.done, ['late', 0])
+
+    def test_failure(self):
+        "Test failed tasks are counted"
+
+        tpool = pool.TaskPool(workers=1, limit=1)
+        tpool.submit(lambda: 1 / 0)
+        self.assertTrue(tpool.shutdown(timeout=10))
+        self.assertEqual(tpool.stats()['failed'], 1)
+
+
+@override_settings(TASK_QUEUE_TIMEOUT=0, TASK_QUEUE_BACKOFF=0, TASK_QUEUE_RETRIES=2)
+class QueueTest(TestCase):
+
+    def setUp(self):
+        logger.setLevel(logging.CRITICAL)
+        RESULTS.clear()
+
+    def test_queue(self):
+        "Test queued tasks are run by the worker"
+
+        dbqueue.enqueue(record, 1, extra=dict(a=1))
+        dbqueue.enqueue(record, 2)
+        self.assertEqual(Task.objects.count(), 2)
+
+        management.call_command('worker', once=True)
+
+        self.assertEqual(RESULTS, [(1, dict(a=1)), (2, None)])
+        self.assertFalse(Task.objects.exists())
+
+    def test_retry(self):
+        "Test failing tasks are retried then marked dead"
+
+        dbqueue.enqueue(fail)
+
+        tasks = dbqueue.claim(limit=10)
+        self.assertEqual(len(tasks), 1)
+        self.assertFalse(dbqueue.claim(limit=10))
+
+        dbqueue.process(tasks[0])
+        task = Task.objects.get()
+        self.assertEqual((task.state, task.attempts), (Task.QUEUED, 1))
+
+        management.call_command('worker', once=True)
+        task = Task.objects.get()
+        self.assertEqual((task.state, task.attempts), (Task.DEAD, 2))
+        self.assertIn("failing task", task.error)
+
+        management.call_command('worker', requeue=True)
+        self.assertEqual(Task.objects.get().state, Task.QUEUED)
+
+
+    def test_timeout(self):
+        "Test tasks that time out hold the worker until they end, then fail"
+
+        GATE.clear()
+        dbqueue.enqueue(slow)
+        Task.objects.update(timeout=1)
+
+        task = dbqueue.claim(limit=10)[0]
+        timer = threading.Timer(2, GATE.set)
+        timer.start()
+        dbqueue.process(task)
+
+        # The task ended after the timeout, it is failed even though it finished.
+        self.assertFalse(timer.is_alive())
+        task = Task.objects.get()
+        self.assertEqual((task.state, task.attempts), (Task.QUEUED, 1))
+        self.assertIn("timed out", task.error)
+
+    def test_enqueue_error(self):
+        "Test calls with arguments that can not be stored are not queued"
+
+        with self.assertRaises(TypeError):
+            dbqueue.enqueue(record, object())
+        self.assertFalse(RESULTS)
+        self.assertFalse(Task.objects.exists())
+
+
+class CoalesceTest(TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        def worker(*args, **kwargs):
+            self.calls.append((args, kwargs))
+
+        worker.spool = worker
+        self.worker = worker
+
+    def func(self, uid, extra=None):
+        pass
+
+    @override_settings(TASK_RUNNER="threaded")
+    def test_coalesce(self):
+        "Test repeated calls with the same key run once"
+
+        wrapped = decorators.coalesce(self.worker, self.func, key="{uid}", debounce=60)
+        wrapped.spool(uid="a", extra=1)
+        wrapped.spool("a", extra=2)
+        wrapped.spool(uid="b")
+        self.assertFalse(self.calls)
+
+        wrapped.coalescer.flush()
+        self.assertEqual(self.calls, [(("a",), dict(extra=2)), ((), dict(uid="b"))])
+
+    @override_settings(TASK_RUNNER="threaded")
+    def test_merge(self):
+        "Test merged arguments are joined across the calls"
+
+        def notify(uid, sub_ids, extra={}):
+            pass
+
+        wrapped = decorators.coalesce(self.worker, notify, key="{uid}-{extra}", debounce=60, merge=["sub_ids"])
+        wrapped.spool("a", sub_ids=[1, 2])
+        wrapped.spool(uid="a", sub_ids=[2, 3])
+
+        wrapped.coalescer.flush()
+        self.assertEqual(self.calls, [((), dict(uid="a", sub_ids=[1, 2, 3], extra={}))])
+
+    @override_settings(TASK_RUNNER="dbqueue")
+    def test_queued(self):
+        "Test calls with the same key share one queued row"
+        import json
+
+        RESULTS.clear()
+        worker = decorators.q_worker()(record)
+        wrapped = decorators.coalesce(worker, record, key="{value}", debounce=60, merge=["extra"])
+        wrapped.spool(1, extra=[1, 2])
+        wrapped.spool(value=1, extra=[2, 3])
+        wrapped.spool(value=2)
+
+        self.assertEqual(Task.objects.count(), 2)
+        task = Task.objects.get(key="1")
+        self.assertEqual(json.loads(task.data)['kwargs']['extra'], [1, 2, 3])
+
+        # The rows wait for the debounce window.
+        self.assertFalse(dbqueue.claim(limit=10))
+
+        Task.objects.update(run_at=task.created)
+        management.call_command('worker', once=True)
+        self.assertEqual(sorted(RESULTS, key=str), [(1, [1, 2, 3]), (2, None)])
+
+    @override_settings(TASK_RUNNER="uwsgi")
+    def test_spooler(self):
+        "Test the calls are not held in the process for external runners"
+
+        wrapped = decorators.coalesce(self.worker, self.func, key="{uid}", debounce=60)
+        self.assertIs(wrapped, self.worker)
+
+    @override_settings(TASK_RUNNER="threaded")
+    def test_batch(self):
+        "Test batch tasks receive the accumulated keys"
+
+        wrapped = decorators.coalesce(self.worker, self.func, key="{uid}", debounce=60, batch=True)
+        for uid in ["a", "b", "a"]:
+            wrapped.spool(uid=uid)
+
+        wrapped.coalescer.flush()
+        self.assertEqual(self.calls, [((), dict(keys=["a", "b"]))])
+
+
+class StatsTest(TestCase):
+
+    def test_stats(self):
+        "Test task runs are recorded and flushed"
+
+        taskstats.flush()
+
+        wrapped = taskstats.instrument(record)
+        wrapped(1, _queued=0)
+        with self.assertRaises(ValueError):
+            taskstats.instrument(fail)()
+
+        self.assertEqual(taskstats.flush(), 2)
+        stats = {stat.name: stat for stat in TaskStat.objects.all()}
+        self.assertEqual(stats[dbqueue.get_name(record)].count, 1)
+        self.assertEqual(stats[dbqueue.get_name(fail)].failed, 1)
+
+        management.call_command('taskstats', sort='failed')
+
+    @override_settings(TASK_STATS_FLUSH=60)
+    def test_due(self):
+        "Test the flush is due once the interval passed"
+
+        taskstats.flush()
+        self.assertFalse(taskstats.due())
+
+        taskstats.RECORDS.append(("name", 0, 0, False))
+        self.assertFalse(taskstats.due())
+
+        taskstats.LAST_FLUSH[0] -= 120
+        self.assertTrue(taskstats.due())
+        self.assertEqual(taskstats.flush(), 1)
+        self.assertFalse(taskstats.due())
+
+        # Runs never write the statistics themselves.
+        taskstats.LAST_FLUSH[0] -= 120
+        taskstats.instrument(record)(1)
+        self.assertFalse(TaskStat.objects.filter(name=dbqueue.get_name(record)).exists())
+        taskstats.flush_due()
+        self.assertTrue(TaskStat.objects.filter(name=dbqueue.get_name(record)).exists())
+
+    def test_missing_table(self):
+        "Test the statistics are kept while the table does not exist"
+        from unittest import mock
+        from django.db import connection
+
+        taskstats.flush()
+        taskstats.RECORDS.append(("name", 0, 0, False))
+        taskstats.TABLE_READY.clear()
+        with mock.patch.object(connection.introspection, 'table_names', return_value=[]):
+            self.assertEqual(taskstats.flush(), 0)
+        self.assertEqual(len(taskstats.RECORDS), 1)
+        self.assertEqual(taskstats.flush(), 1)
+
+
+class SchedulerTest(TestCase):
+
+    def setUp(self):
+        logger.setLevel(logging.CRITICAL)
+        RESULTS.clear()
+
+    def test_lease(self):
+        "Test a timer runs once per interval across processes"
+
+        name = dbqueue.get_name(record)
+        self.assertTrue(scheduler.tick(name, 60, record, 1))
+
+        # Another process ticking within the interval skips.
+        self.assertFalse(scheduler.acquire(name, 60, owner="other"))
+
+        # A run that is still going is not started again.
+        TimerLease.objects.filter(name=name).update(last_start=None)
+        self.assertTrue(scheduler.acquire(name, 60, owner="first"))
+        TimerLease.objects.filter(name=name).update(last_start=None)
+        self.assertFalse(scheduler.acquire(name, 60, owner="second"))
+
+        scheduler.release(name, owner="first", error="failed")
+        lease = TimerLease.objects.get(name=name)
+        self.assertEqual((lease.runs, lease.failures), (2, 1))
+        self.assertEqual(RESULTS, [(1, None)])
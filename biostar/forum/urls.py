@@ -75,6 +75,7 @@ forum_patterns = [
     path(r'api/stats/day/<int:day>/', api.daily_stats_on_day, name='api_stats_on_day'),
     path(r'api/stats/date/<int:year>/<int:month>/<int:day>/', api.daily_stats_on_date,
          name='api_stats_on_date'),
+    path(r'api/stats/range/<str:start>/<str:end>/', api.daily_stats_range, name='api_stats_range'),
 
     # Log view
     path(r'view/logs/', views.view_logs, name='view_logs'),
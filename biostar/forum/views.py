@@ -16,7 +16,7 @@ from django.views.decorators.csrf import ensure_csrf_cookie
 from taggit.models import Tag
 from biostar.planet.models import Blog, BlogPost
 from biostar.accounts.models import Profile
-from biostar.forum import forms, auth, tasks, util, search, models, moderate
+from biostar.forum import forms, auth, tasks, util, search, models, moderate, awards
 from biostar.forum.const import *
 
 from biostar.forum.models import Post, Vote, Badge, Subscription, Log
@@ -267,6 +267,9 @@ def release_quar(request, uid):
 
     Post.objects.filter(uid=uid).update(spam=Post.NOT_SPAM)
 
+    # The spam model learns from the decision.
+    tasks.spam_learn.spool(uid=uid)
+
     return redirect('/')
 
 
@@ -548,7 +551,12 @@ def post_view(request, uid):
     root, comment_tree, answers, thread = auth.post_tree(user=request.user, root=post.root)
 
     # Bump post views.
-    models.update_post_views(post=post, request=request, timeout=settings.POST_VIEW_TIMEOUT)
+    before = post.view_count
+    if models.update_post_views(post=post, request=request, timeout=settings.POST_VIEW_TIMEOUT):
+        # Going over a view milestone may earn the author an award.
+        after = Post.objects.filter(pk=post.pk).values_list('view_count', flat=True).first() or before
+        if awards.crossed(before, after):
+            tasks.award_event.spool(event=awards.VIEW, user_id=post.author_id, post_id=post.pk)
 
     context = dict(post=root, tree=comment_tree, form=form, answers=answers)
 
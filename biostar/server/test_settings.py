@@ -12,6 +12,9 @@ CLASSIFY_SPAM = False
 # Turn the emailing tasks off for tests
 SEND_MAIL = False
 
+# Keep the task statistics in memory, the test database is gone at exit.
+TASK_STATS_FLUSH = 0
+
 # Default cache
 CACHES = {
     'default': {
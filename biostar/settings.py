@@ -18,6 +18,16 @@ PAGEDOWN_IMAGE_UPLOAD_ENABLED = False
 
 LANGUAGE_DETECTION = ["en"]
 
+# The language detector, a function that takes a text and returns the language code.
+LANGUAGE_DETECTOR = "biostar.utils.language.langdetect_backend"
+
+# Characters of a post classified, and the seed of the detector.
+LANGUAGE_SAMPLE = 1000
+LANGUAGE_SEED = 0
+
+# Seconds the detected languages are cached.
+LANGUAGE_CACHE_TTL = 7 * 24 * 3600
+
 # Set the home page to the engine or forum
 INTERNAL_IPS = ['127.0.0.1']
 
@@ -213,9 +223,52 @@ STATICFILES_FINDERS = [
 # Apply default logger setting.
 LOGGER_NAME = "biostar"
 
-# Valid options; block, disabled, threaded, uwsgi, celery.
+# Valid options; block, disabled, threaded, pool, dbqueue, uwsgi, celery.
 TASK_RUNNER = 'block'
 
+# Number of threads running tasks with the pool runner.
+TASK_POOL_WORKERS = 4
+
+# Maximum number of tasks waiting for a thread in the pool.
+TASK_POOL_LIMIT = 1000
+
+# What to do with new tasks when the pool queue is full; block, drop, inline.
+TASK_POOL_OVERFLOW = 'block'
+
+# Seconds to wait for the queued tasks to finish at shutdown.
+TASK_POOL_DRAIN = 30
+
+# Seconds to collect repeated calls of a task with the same key before running it once,
+# with the threaded, pool and dbqueue runners.
+TASK_DEBOUNCE = 5
+
+# Timers wait up to this fraction of their interval longer, spreads the ticks of the processes.
+TIMER_JITTER = 0.1
+
+# Seconds before the claim of a timer run that did not finish expires (at least the interval).
+TIMER_LEASE = 600
+
+# Seconds between writes of the task run statistics, zero keeps them in memory.
+TASK_STATS_FLUSH = 60
+
+# Seconds a task from the database queue may run, zero runs without a limit.
+TASK_QUEUE_TIMEOUT = 600
+
+# Timeouts for specific tasks, keyed by the dotted path of the task function.
+TASK_QUEUE_TIMEOUTS = {}
+
+# Extra seconds before a task claimed by a worker that went away is run again.
+TASK_QUEUE_LEASE = 60
+
+# How many times a failing task is tried before it is marked as dead.
+TASK_QUEUE_RETRIES = 5
+
+# Seconds to wait before the first retry, doubled on every attempt.
+TASK_QUEUE_BACKOFF = 30
+
+# Seconds the worker waits before checking the queue again.
+TASK_QUEUE_POLL = 1
+
 TASK_MODULES = []
 
 # The email delivery engine.
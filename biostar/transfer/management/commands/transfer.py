@@ -13,6 +13,7 @@ from taggit.models import Tag
 
 from biostar.accounts.models import User, Profile
 from biostar.forum import util, markdown
+from biostar.utils.tags import batch_set_tags
 from biostar.forum.models import Post, Vote, Subscription, Badge, Award
 from biostar.transfer.models import UsersUser, PostsPost, PostsVote, PostsSubscription, BadgesAward, UsersProfile
 
@@ -172,11 +173,10 @@ def add_tags(delete=False):
         # Delete tags before going forward.
         Tag.objects.all().delete()
 
-    for post in Post.objects.iterator():
-        tags = [t.strip() for t in post.parse_tags()]
-        tags = [Tag.objects.get_or_create(name=name)[0] for name in tags]
-        post.tags.remove(*tags)
-        post.tags.add(*tags)
+    # Thousands of posts are tagged in each transaction.
+    posts = Post.objects.only("id", "tag_val").iterator()
+    total = batch_set_tags(((post, post.parse_tags()) for post in posts), size=5000)
+    logger.info(f"Tagged {total} posts")
 
 
 def bulk_copy_posts(limit):
@@ -0,0 +1,243 @@
+"""
+A task queue stored in the database.
+
+Spooling a task inserts a row, the worker command claims the rows that
+are due and runs them. Failed tasks are retried with an exponential
+backoff, tasks that keep failing are kept as dead for inspection.
+
+Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED where the
+database supports it. Elsewhere (SQLite) each row is claimed with a
+conditional update that only one worker can win.
+
+Calls with a key wait in a single queued row, later calls with the same
+key update the row instead of adding one.
+
+Threads can not be stopped, a task that times out keeps its worker busy
+until its thread ends and is then failed, whatever its outcome.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Q
+
+from biostar.accounts import util
+from biostar.accounts.models import Task
+
+logger = logging.getLogger('engine')
+
+
+def get_name(func):
+    return f"{func.__module__}.{func.__name__}"
+
+
+def get_func(name):
+    """
+    Returns the task function from its dotted path.
+    """
+    module, fname = name.rsplit(".", 1)
+    func = getattr(import_module(module), fname)
+    # Unwrap the task decorator.
+    return getattr(func, '__wrapped__', func)
+
+
+def get_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def encode(name, args, kwargs):
+    try:
+        return json.dumps(dict(args=args, kwargs=kwargs), cls=DjangoJSONEncoder)
+    except TypeError as exc:
+        logger.error(f"task {name} not queued, arguments can not be stored: {exc}")
+        raise
+
+
+def update_queued(name, key, args, kwargs, merge=()):
+    """
+    Puts the latest arguments in the queued row of the key, joins the lists named in merge.
+    Returns the task, None when no row of the key is queued.
+    """
+    with transaction.atomic():
+        task = Task.objects.filter(name=name, key=key, state=Task.QUEUED).select_for_update().first()
+        if not task:
+            return None
+
+        prev = json.loads(task.data)['kwargs']
+        for field in merge:
+            items = list(prev.get(field) or [])
+            kwargs[field] = items + [item for item in kwargs.get(field) or [] if item not in items]
+
+        task.data = encode(name, args, kwargs)
+        # A worker may have claimed the row meanwhile.
+        if Task.objects.filter(pk=task.pk, state=Task.QUEUED).update(data=task.data):
+            return task
+
+    return None
+
+
+def enqueue(func, *args, _key='', _merge=(), _delay=0, **kwargs):
+    """
+    Stores a task call in the queue, the arguments must be JSON serializable.
+    Note that the task receives tuples as lists and dates as ISO 8601 strings.
+
+    Calls with a key run after delay seconds, the calls with the same key made
+    meanwhile update the queued row. The lists named in merge are joined.
+    """
+    name = get_name(func)
+    data = encode(name, args, kwargs)
+    timeout = settings.TASK_QUEUE_TIMEOUTS.get(name, settings.TASK_QUEUE_TIMEOUT)
+
+    if not _key:
+        return Task.objects.create(name=name, data=data, timeout=timeout)
+
+    run_at = util.now() + timedelta(seconds=_delay)
+    while True:
+        task = update_queued(name, key=_key, args=args, kwargs=kwargs, merge=_merge)
+        if task:
+            return task
+        try:
+            with transaction.atomic():
+                return Task.objects.create(name=name, key=_key, data=data, timeout=timeout, run_at=run_at)
+        except IntegrityError:
+            # Queued by another process meanwhile.
+            continue
+
+
+def ready(now):
+    """
+    Tasks that are due, including the ones whose worker went away.
+    """
+    cond = Q(state=Task.QUEUED, run_at__lte=now) | Q(state=Task.RUNNING, lease__lt=now)
+    return Task.objects.filter(cond).order_by('run_at', 'pk')
+
+
+def get_lease(task, now):
+    # The lease outlasts the timeout, expired leases are claimed again.
+    return now + timedelta(seconds=(task.timeout or settings.TASK_QUEUE_TIMEOUT) + settings.TASK_QUEUE_LEASE)
+
+
+def claim(limit, owner=None):
+    """
+    Claims up to limit tasks that are due and returns them.
+    """
+    owner = owner or get_owner()
+    now = util.now()
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            tasks = list(ready(now).select_for_update(skip_locked=True)[:limit])
+            for task in tasks:
+                task.state, task.owner, task.lease = Task.RUNNING, owner, get_lease(task, now)
+            Task.objects.bulk_update(tasks, ['state', 'owner', 'lease'])
+        return tasks
+
+    # Conditional updates, a row changed by another worker does not match anymore.
+    tasks = []
+    for task in ready(now)[:limit * 2]:
+        claimed = Task.objects.filter(pk=task.pk, state=task.state, lease=task.lease)
+        lease = get_lease(task, now)
+        if claimed.update(state=Task.RUNNING, owner=owner, lease=lease):
+            task.state, task.owner, task.lease = Task.RUNNING, owner, lease
+            tasks.append(task)
+        if len(tasks) >= limit:
+            break
+
+    return tasks
+
+
+def call(task):
+    """
+    Runs the task function, returns the error message or an empty string.
+    """
+    try:
+        data = json.loads(task.data)
+        func = get_func(task.name)
+        func(*data['args'], **data['kwargs'])
+        return ''
+    except Exception as exc:
+        logger.error(f"task {task.name} failed: {exc}")
+        return traceback.format_exc()
+
+
+def execute(task):
+    """
+    Runs a claimed task, in a separate thread when it has a timeout.
+    Returns the error message, tasks that time out fail once their thread ends.
+    """
+    if not task.timeout:
+        return call(task)
+
+    result = []
+
+    def target():
+        try:
+            result.append(call(task))
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=task.timeout)
+
+    if thread.is_alive():
+        logger.error(f"task {task.name} timed out after {task.timeout} seconds")
+        wait(task, thread=thread)
+        return f"timed out after {task.timeout} seconds"
+
+    return result[0]
+
+
+def wait(task, thread):
+    """
+    Waits for the thread of a task that timed out, the task keeps its lease meanwhile.
+    It is not claimed again while it is still running.
+    """
+    claimed = Task.objects.filter(pk=task.pk, owner=task.owner, state=Task.RUNNING)
+    while thread.is_alive():
+        claimed.update(lease=util.now() + timedelta(seconds=settings.TASK_QUEUE_LEASE))
+        thread.join(timeout=settings.TASK_QUEUE_LEASE / 2)
+
+
+def finish(task, error):
+    """
+    Removes a successful task, retries or buries a failed one.
+    """
+    claimed = Task.objects.filter(pk=task.pk, owner=task.owner, state=Task.RUNNING)
+
+    if not error:
+        claimed.delete()
+        return
+
+    attempts = task.attempts + 1
+    if attempts >= settings.TASK_QUEUE_RETRIES:
+        logger.error(f"task {task.name} failed {attempts} times, giving up")
+        claimed.update(state=Task.DEAD, attempts=attempts, error=error, lease=None)
+        return
+
+    delay = settings.TASK_QUEUE_BACKOFF * 2 ** (attempts - 1)
+    run_at = util.now() + timedelta(seconds=delay)
+    claimed.update(state=Task.QUEUED, attempts=attempts, error=error, run_at=run_at, lease=None)
+
+
+def process(task):
+    """
+    Executes and finishes a claimed task.
+    """
+    error = execute(task)
+    finish(task, error=error)
+
+
+def requeue():
+    """
+    Puts the dead tasks back in the queue.
+    """
+    return Task.objects.filter(state=Task.DEAD).update(state=Task.QUEUED, attempts=0, run_at=util.now())
@@ -1,4 +1,4 @@
-import logging, functools, time, os
+import logging, functools, time, os, atexit, inspect
 from functools import wraps
 from functools import partial
 from ratelimit.decorators import ratelimit
@@ -6,6 +6,7 @@ from django.conf import settings
 from django.http import Http404
 from django.shortcuts import redirect
 from django.contrib import messages
+from biostar.utils import taskstats
 import sys
 
 logger = logging.getLogger('engine')
@@ -214,11 +215,11 @@ def t_timer():
             self.secs = secs
 
         def __call__(self, func, *args, **kwargs):
-            # The loop repeats the timer.
+            # The loop repeats the timer, only one process runs each tick.
             def loop():
-                ticker = threading.Event()
-                while not ticker.wait(self.secs):
-                    func(*args, **kwargs)
+                # The scheduler needs the models, import on first use.
+                from biostar.utils import scheduler
+                scheduler.loop(self.secs, func, *args, **kwargs)
 
             # Run process in separate thread, once.
             logger.info(f"new time thread for function f{func} {args} {kwargs}")
@@ -288,6 +289,42 @@ def thread(*args, **kwargs):
     return outer
 
 
+def p_worker():
+    """
+    Return a worker that runs the function in a bounded thread pool.
+    """
+    from biostar.utils import pool
+
+    def outer(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            pool.get_pool().submit(func, *args, **kwargs)
+
+        inner.spool = inner
+        inner.delay = inner
+        return inner
+
+    return outer
+
+
+def q_worker():
+    """
+    Return a worker that stores the function call in the database task queue.
+    """
+    def outer(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            # The queue needs the models, import on first use.
+            from biostar.utils import dbqueue
+            dbqueue.enqueue(func, *args, **kwargs)
+
+        inner.spool = inner
+        inner.delay = inner
+        return inner
+
+    return outer
+
+
 def u_worker():
     """
     Return a uwsgi spooler compatible with celery interface
@@ -402,6 +439,8 @@ def select_runner(name):
         'uwsgi': {'worker': u_worker, 'timer': u_timer},
         'celery': {'worker': c_worker, 'timer': c_timer},
         'threaded': {'worker': t_worker, 'timer': t_timer},
+        'pool': {'worker': p_worker, 'timer': t_timer},
+        'dbqueue': {'worker': q_worker, 'timer': t_timer},
         'disable': {'worker': d_worker, 'timer': d_timer},
     }
 
@@ -428,15 +467,173 @@ except Exception as exc:
     logger.warning(f'Tasks disabled: {exc}.')
 
 
-def task(f):
+def timestamp(worker, func):
+    """
+    Adds the time of spooling to the call, used to measure the time spent in the queue.
+    """
+
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        return worker(*args, **kwargs)
+
+    def spool(*args, **kwargs):
+        return worker.spool(*args, _queued=time.time(), **kwargs)
+
+    inner.spool = spool
+    inner.delay = spool
+    return inner
+
+
+class Coalescer(object):
+    """
+    Collapses the calls made with the same key within a time window.
+
+    The first call opens the window, when it closes each key runs once with
+    the latest arguments, except the merged lists which are joined across
+    the calls. Batch tasks run once with the list of keys instead.
+    Calls are collected per process, only the runners that keep their tasks
+    in the process use it.
+    """
+
+    def __init__(self, worker, key, debounce, batch=False, merge=()):
+        self.worker = worker
+        self.key = key
+        self.debounce = debounce
+        self.batch = batch
+        self.merge = merge
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ticker = None
+
+    def submit(self, *args, **kwargs):
+        name = self.key(*args, **kwargs)
+        with self.lock:
+            if name in self.pending and self.merge:
+                prev = self.pending[name][1]
+                for field in self.merge:
+                    items = list(prev.get(field) or [])
+                    kwargs[field] = items + [item for item in kwargs.get(field) or [] if item not in items]
+            self.pending[name] = (args, kwargs)
+            if self.ticker is None:
+                self.ticker = threading.Timer(self.debounce, self.flush)
+                self.ticker.daemon = True
+                self.ticker.start()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending, self.ticker = self.pending, {}, None
+
+        if not pending:
+            return
+
+        try:
+            if self.batch:
+                self.worker.spool(keys=list(pending))
+            else:
+                for args, kwargs in pending.values():
+                    self.worker.spool(*args, **kwargs)
+        except Exception as exc:
+            logger.error(f"error spooling {len(pending)} coalesced calls: {exc}")
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                from django.db import connections
+                connections.close_all()
+
+
+def coalesce(worker, func, key, debounce, batch=False, merge=()):
+    """
+    Wraps a worker so that calls with the same key are collapsed.
+    """
+    # Batch tasks take the keys, the key is filled from the arguments of the call.
+    signature = None if batch else inspect.signature(func)
+
+    def bind(*args, **kwargs):
+        # The arguments by name, defaults included.
+        bound = signature.bind_partial(*args, **kwargs)
+        bound.apply_defaults()
+        return bound.arguments
+
+    def keyfunc(*args, **kwargs):
+        if signature:
+            args, kwargs = (), bind(*args, **kwargs)
+        return key.format(*args, **kwargs)
+
+    # The database queue keeps a single row for each key.
+    if settings.TASK_RUNNER == 'dbqueue' and debounce:
+
+        @functools.wraps(func)
+        def queued(*args, **kwargs):
+            if batch:
+                args, kwargs, name, fields = (), dict(keys=[keyfunc(*args, **kwargs)]), "batch", ["keys"]
+            else:
+                name, fields = keyfunc(*args, **kwargs), merge
+                args, kwargs = (), dict(bind(*args, **kwargs))
+            return worker.spool(*args, _key=name, _merge=fields, _delay=debounce, **kwargs)
+
+        queued.spool = queued
+        queued.delay = queued
+        return queued
+
+    # Blocking runners execute right away. The uwsgi spooler and celery workers
+    # do not hold calls in the web processes, that may exit before the window closes.
+    if settings.TASK_RUNNER not in ('threaded', 'pool') or not debounce:
+        if not batch:
+            return worker
+
+        @functools.wraps(func)
+        def direct(*args, **kwargs):
+            return worker.spool(keys=[keyfunc(*args, **kwargs)])
+
+        direct.spool = direct
+        direct.delay = direct
+        return direct
+
+    coalescer = Coalescer(worker=worker, key=keyfunc, debounce=debounce, batch=batch, merge=merge)
+
+    # Run the pending calls when the process exits.
+    atexit.register(coalescer.flush)
+
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        # Merged arguments are combined by name.
+        if merge:
+            args, kwargs = (), dict(bind(*args, **kwargs))
+        coalescer.submit(*args, **kwargs)
+
+    inner.spool = inner
+    inner.delay = inner
+    inner.coalescer = coalescer
+    return inner
+
+
+def task(f=None, key=None, debounce=None, batch=False, merge=()):
     """
     Utility function to access worker decorator.
+
+    Tasks with a key, for example @task(key="{uid}"), run once per key within
+    the debounce window. The list arguments named in merge are joined across
+    the calls. Batch tasks are called with the accumulated keys. Only the
+    threaded, pool and dbqueue runners collapse the calls.
     """
-    return WORKER(f)
+
+    def outer(func):
+        func = taskstats.instrument(func)
+        worker = timestamp(WORKER(func), func)
+        if not key:
+            return worker
+        secs = settings.TASK_DEBOUNCE if debounce is None else debounce
+        return coalesce(worker=worker, func=func, key=key, debounce=secs, batch=batch, merge=merge)
+
+    return outer(f) if f else outer
 
 
 def timer(f):
     """
     Utility function to access timer decorator.
     """
-    return TIMER(f)
+    inner = TIMER(f)
+
+    def outer(func):
+        return inner(taskstats.instrument(func))
+
+    return outer
@@ -0,0 +1,103 @@
+"""
+Detects the language of the posts.
+
+The langdetect profiles are loaded once per process into a detector factory
+with a fixed seed, the same text always gets the same answer. Code blocks
+and links are dropped and only a sample of LANGUAGE_SAMPLE characters taken
+from the start, middle and end of long texts is classified. Texts made only of
+code are classified whole, wrapping prose in a code block does not skip the
+check. The results are cached by the hash of the sample, the detector and the
+seed.
+
+Another detector may be set in LANGUAGE_DETECTOR as the dotted path of a
+function that takes a text and returns a language code.
+"""
+import hashlib
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("engine")
+
+code_regx = re.compile(r"```.*?```", re.DOTALL)
+link_regx = re.compile(r"https?://\S+")
+
+# The detector factory of the process.
+FACTORY = None
+LOCK = threading.Lock()
+
+
+def get_factory():
+    """
+    Loads the language profiles on the first call.
+    """
+    global FACTORY
+    if FACTORY is None:
+        with LOCK:
+            if FACTORY is None:
+                from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+                factory = DetectorFactory()
+                factory.load_profile(PROFILES_DIRECTORY)
+                factory.set_seed(settings.LANGUAGE_SEED)
+                FACTORY = factory
+    return FACTORY
+
+
+def langdetect_backend(text):
+    detector = get_factory().create()
+    detector.append(text)
+    return detector.detect()
+
+
+def sample(text, size=None, code=False):
+    """
+    Returns the prose of the text, long texts are sampled at the start, middle and end.
+    The code blocks are kept when code is True.
+    """
+    size = size or settings.LANGUAGE_SAMPLE
+
+    # Code is not written in a natural language.
+    if not code:
+        text = code_regx.sub(" ", text)
+        lines = [line for line in text.splitlines() if not line.startswith(("    ", "\t"))]
+        text = "\n".join(lines)
+
+    text = link_regx.sub(" ", text)
+    text = " ".join(text.split())
+
+    if len(text) <= size:
+        return text
+
+    part = size // 3
+    mid = (len(text) - part) // 2
+    return " ".join([text[:part], text[mid:mid + part], text[-part:]])
+
+
+def detect(text):
+    """
+    Returns the language code of the text, None when it cannot be detected.
+    """
+    text = sample(text) or sample(text, code=True)
+    if not text:
+        return None
+
+    # Answers of another detector or seed are not reused.
+    ident = f"{settings.LANGUAGE_DETECTOR}:{settings.LANGUAGE_SEED}:{text}"
+    key = "lang-" + hashlib.md5(ident.encode("utf-8")).hexdigest()
+    lang = cache.get(key)
+    if lang is not None:
+        return lang
+
+    try:
+        backend = import_string(settings.LANGUAGE_DETECTOR)
+        lang = backend(text)
+    except Exception as exc:
+        logger.error(f"Lang detect error: {exc}")
+        return None
+
+    cache.set(key, lang, settings.LANGUAGE_CACHE_TTL)
+    return lang
@@ -0,0 +1,204 @@
+"""
+Runs tasks on a bounded pool of threads.
+
+At most TASK_POOL_WORKERS tasks run at the same time and at most
+TASK_POOL_LIMIT tasks wait in the queue. When the queue is full the
+TASK_POOL_OVERFLOW policy decides what happens to a new task:
+
+    block  - the caller waits for a free slot
+    drop   - the task is discarded with a warning
+    inline - the task runs in the calling thread
+
+The workers are daemon threads, at exit the queue is drained for at most
+TASK_POOL_DRAIN seconds and the tasks still running are abandoned.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from biostar.utils import taskstats
+
+logger = logging.getLogger('engine')
+
+BLOCK, DROP, INLINE = "block", "drop", "inline"
+
+POLICIES = (BLOCK, DROP, INLINE)
+
+
+class TaskPool(object):
+
+    def __init__(self, workers=4, limit=1000, overflow=BLOCK):
+
+        if overflow not in POLICIES:
+            raise ValueError(f"Invalid overflow policy: {overflow}, valid options: {POLICIES}")
+
+        self.workers = workers
+        self.limit = limit
+        self.overflow = overflow
+        self.queue = queue.Queue()
+
+        # Marks the worker threads.
+        self.local = threading.local()
+
+        # One slot for each running or waiting task.
+        self.slots = threading.BoundedSemaphore(workers + limit)
+
+        # Guards the counters below.
+        self.cond = threading.Condition()
+        self.closed = False
+        self.pending = 0
+        self.active = 0
+        self.counts = dict(done=0, failed=0, dropped=0, inline=0)
+        self.wait_time = 0.0
+        self.run_time = 0.0
+        self.max_wait = 0.0
+
+        # Daemon threads do not hold up the exit of the interpreter.
+        self.threads = [threading.Thread(target=self.loop, name=f"task-{idx}", daemon=True) for idx in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def loop(self):
+        """
+        Runs the queued tasks until the stop marker.
+        """
+        self.local.worker = True
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.run(*item)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules the function to run in the pool, applies the overflow policy when full.
+        """
+        name = func.__name__
+
+        # Tasks spooled after shutdown run in the caller.
+        if self.closed:
+            return self.inline(func, *args, **kwargs)
+
+        # Tasks spooled from a worker do not wait on the pool, that could deadlock.
+        if self.overflow == BLOCK and not getattr(self.local, 'worker', False):
+            self.slots.acquire()
+        elif not self.slots.acquire(blocking=False):
+            if self.overflow == DROP:
+                with self.cond:
+                    self.counts['dropped'] += 1
+                logger.warning(f"task queue full, dropped {name}")
+                return
+            return self.inline(func, *args, **kwargs)
+
+        with self.cond:
+            self.pending += 1
+
+        self.queue.put((func, time.time(), args, kwargs))
+
+    def inline(self, func, *args, **kwargs):
+        with self.cond:
+            self.counts['inline'] += 1
+        return func(*args, **kwargs)
+
+    def run(self, func, queued, args, kwargs):
+        """
+        Runs one task inside a worker thread.
+        """
+        start = time.time()
+        wait = start - queued
+
+        with self.cond:
+            self.pending -= 1
+            self.active += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        status = 'done'
+        try:
+            func(*args, **kwargs)
+        except Exception as exc:
+            status = 'failed'
+            logger.error(f"task {func.__name__} failed: {exc}")
+        finally:
+            # The workers write the statistics of the runs.
+            taskstats.flush_due()
+
+            # Connections belong to the worker thread, do not keep them open between tasks.
+            connections.close_all()
+
+            with self.cond:
+                self.active -= 1
+                self.counts[status] += 1
+                self.run_time += time.time() - start
+                self.cond.notify_all()
+
+            self.slots.release()
+
+    def stats(self):
+        """
+        Returns the queue depth, the active workers and the task latency.
+        """
+        with self.cond:
+            finished = self.counts['done'] + self.counts['failed']
+            started = finished + self.active
+            return dict(pending=self.pending, active=self.active, workers=self.workers, limit=self.limit,
+                        avg_wait=self.wait_time / started if started else 0,
+                        max_wait=self.max_wait,
+                        avg_run=self.run_time / finished if finished else 0,
+                        **self.counts)
+
+    def drain(self, timeout=None):
+        """
+        Waits for the queued and running tasks to finish.
+        Returns False if the timeout expired first.
+        """
+        with self.cond:
+            return self.cond.wait_for(lambda: self.pending + self.active == 0, timeout=timeout)
+
+    def shutdown(self, timeout=None):
+        """
+        Stops accepting tasks and drains the queue for at most timeout seconds.
+        Returns False if tasks were still queued or running.
+        """
+        self.closed = True
+        drained = self.drain(timeout=timeout)
+        if not drained:
+            logger.warning(f"task pool did not drain in {timeout} seconds: {self.stats()}")
+
+        # The workers stop after the queued tasks.
+        for thread in self.threads:
+            self.queue.put(None)
+
+        return drained
+
+
+POOL = None
+
+POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the task pool of the process, created on first use.
+    """
+    global POOL
+
+    with POOL_LOCK:
+        if POOL is None:
+            POOL = TaskPool(workers=settings.TASK_POOL_WORKERS, limit=settings.TASK_POOL_LIMIT,
+                            overflow=settings.TASK_POOL_OVERFLOW)
+            atexit.register(POOL.shutdown, timeout=settings.TASK_POOL_DRAIN)
+
+    return POOL
+
+
+def stats():
+    """
+    Returns the statistics of the task pool, empty when the pool is not running.
+    """
+    return POOL.stats() if POOL else {}
@@ -0,0 +1,108 @@
+"""
+Runs the periodic timers once per interval across all processes.
+
+Every process ticks each timer, a tick runs the timer only when it can
+claim the lease row of the timer and the last run started at least one
+interval ago. A tick is skipped while another run holds an unexpired
+lease. The ticks are spread with a random jitter.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.db.models import Q, F
+
+from biostar.accounts import util
+from biostar.accounts.models import TimerLease
+from biostar.utils import taskstats
+
+logger = logging.getLogger('engine')
+
+
+def get_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def get_delay(secs):
+    # Wait a random fraction of the interval longer, processes started together do not collide.
+    return secs + random.uniform(0, secs * settings.TIMER_JITTER)
+
+
+def acquire(name, secs, owner):
+    """
+    Claims the timer for one run, returns True if this process should run it.
+    """
+    now = util.now()
+
+    try:
+        TimerLease.objects.get_or_create(name=name)
+    except IntegrityError:
+        # Created by another process at the same time.
+        pass
+
+    # Ticks arriving a little early still count, the jitter shifts them.
+    due = now - timedelta(seconds=secs * (1 - settings.TIMER_JITTER))
+    free = Q(lease__isnull=True) | Q(lease__lt=now)
+    ready = Q(last_start__isnull=True) | Q(last_start__lte=due)
+
+    lease = now + timedelta(seconds=max(secs, settings.TIMER_LEASE))
+    claimed = TimerLease.objects.filter(free, ready, name=name)
+    return bool(claimed.update(owner=owner, lease=lease, last_start=now))
+
+
+def release(name, owner, error=''):
+    """
+    Ends the run and records its outcome.
+    """
+    lease = TimerLease.objects.filter(name=name, owner=owner)
+    lease.update(lease=None, last_end=util.now(), last_error=error, runs=F('runs') + 1,
+                 failures=F('failures') + int(bool(error)))
+
+
+def tick(name, secs, func, *args, **kwargs):
+    """
+    Runs the timer function if this process wins the lease.
+    Returns True when the function was run.
+    """
+    owner = get_owner()
+
+    try:
+        if not acquire(name=name, secs=secs, owner=owner):
+            return False
+    except Exception as exc:
+        logger.error(f"timer {name} could not be scheduled: {exc}")
+        return False
+
+    error = ''
+    try:
+        func(*args, **kwargs)
+    except Exception as exc:
+        logger.error(f"timer {name} failed: {exc}")
+        error = traceback.format_exc()
+    finally:
+        release(name=name, owner=owner, error=error)
+
+    return True
+
+
+def loop(secs, func, *args, **kwargs):
+    """
+    Ticks the timer forever, run inside a separate thread.
+    """
+    name = f"{func.__module__}.{func.__name__}"
+    ticker = threading.Event()
+    while not ticker.wait(get_delay(secs)):
+        try:
+            tick(name, secs, func, *args, **kwargs)
+
+            # Timers also write the statistics of an otherwise idle process.
+            taskstats.flush_due()
+        finally:
+            # Do not hold a connection between ticks.
+            connections.close_all()
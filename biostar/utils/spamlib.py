@@ -16,8 +16,12 @@ Should work on any of the datasets:
 seq 1 6 | parallel -j 1 wget -q -nc http://www.aueb.gr/users/ion/data/enron-spam/preprocessed/enron{}.tar.gz
 
 '''
+import copy
+import fcntl
 import logging
 import sys, os
+import threading
+from contextlib import contextmanager
 
 import plac
 from joblib import dump, load
@@ -25,8 +29,8 @@ from joblib import dump, load
 logger = logging.getLogger("engine")
 
 try:
-    from sklearn.feature_extraction.text import CountVectorizer
-    from sklearn.metrics import classification_report
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.metrics import classification_report, accuracy_score
     from sklearn.model_selection import train_test_split
     from sklearn.naive_bayes import MultinomialNB
     from sklearn.pipeline import make_pipeline
@@ -40,6 +44,74 @@ def load_model(model="spam.model"):
     return nb
 
 
+class ModelHolder(object):
+    """
+    Keeps the loaded models of the process, a model is loaded again when its file changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # The modification time and model by path.
+        self.models = {}
+
+    def get(self, path):
+        """
+        Returns the model stored at the path, None when there is no model file.
+        """
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        entry = self.models.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+
+        # Only one thread loads the model.
+        with self.lock:
+            entry = self.models.get(path)
+            if not entry or entry[0] != mtime:
+                logger.info(f"loading spam model: {path}")
+                entry = (mtime, load_model(path))
+                self.models[path] = entry
+
+        return entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+
+
+# The spam models loaded in this process.
+MODELS = ModelHolder()
+
+# The models being built in the background.
+BUILDING = set()
+BUILD_LOCK = threading.Lock()
+
+
+def build_async(fname, model):
+    """
+    Builds the model in a background thread, returns False if a build is already running.
+    """
+    with BUILD_LOCK:
+        if model in BUILDING:
+            return False
+        BUILDING.add(model)
+
+    def target():
+        try:
+            build_model(fname=fname, model=model)
+        except Exception as exc:
+            logger.error(f"error building spam model: {exc}")
+        finally:
+            with BUILD_LOCK:
+                BUILDING.discard(model)
+
+    threading.Thread(target=target, daemon=True).start()
+    return True
+
+
 def classify_content(content, model):
     """
     Classify content
@@ -48,7 +120,10 @@ def classify_content(content, model):
         return 0
 
     try:
-        nb = load_model(model)
+        nb = MODELS.get(model)
+        if nb is None:
+            logger.warning(f"spam model not found: {model}")
+            return 0
         y_pred = nb.predict([content])
     except Exception as exc:
         logger.error(exc)
@@ -57,40 +132,143 @@ def classify_content(content, model):
     return y_pred[0]
 
 
-def fit_model(X, y):
+def score_content(contents, model):
+    """
+    Returns the spam probability of each content, the batch is scored in one call.
+    """
+    nb = MODELS.get(model)
+    if nb is None:
+        logger.warning(f"spam model not found: {model}")
+        return [0.0] * len(contents)
+
+    if not hasattr(nb, "predict_proba"):
+        return [float(y) for y in nb.predict(contents)]
+
+    classes = list(nb.classes_)
+    if 1 not in classes:
+        return [0.0] * len(contents)
+
+    col = classes.index(1)
+    return [float(row[col]) for row in nb.predict_proba(contents)]
 
+
+# The labels of the model.
+CLASSES = [0, 1]
+
+# Hashed feature count, the model size does not grow with the vocabulary.
+N_FEATURES = 2 ** 18
+
+
+def online_model():
+    """
+    Hashed features need no fitting, the classifier learns from mini-batches.
+    """
     nb = make_pipeline(
 
-        CountVectorizer(),
+        HashingVectorizer(n_features=N_FEATURES, alternate_sign=False),
 
         MultinomialNB(),
 
-        # LinearSVC(),
+    )
+    return nb
 
-        # RandomForestClassifier(),
 
-    )
+def incremental(nb):
+    """
+    True if the model can learn from new examples.
+    """
+    if hasattr(nb, "partial_fit"):
+        return True
+    steps = getattr(nb, "steps", [])
+    return bool(steps) and type(steps[0][1]).__name__ == "HashingVectorizer" and hasattr(steps[-1][1], "partial_fit")
 
-    nb.fit(X, y)
 
+def partial_fit(nb, X, y):
+    """
+    Updates the model with a mini-batch, the cost depends only on the batch.
+    """
+    if hasattr(nb, "partial_fit"):
+        nb.partial_fit(X, y, classes=CLASSES)
+    else:
+        vec, clf = nb.steps[0][1], nb.steps[-1][1]
+        clf.partial_fit(vec.transform(X), y, classes=CLASSES)
     return nb
 
 
+def fit_model(X, y, size=1000):
+
+    nb = online_model()
+
+    # Learn in mini-batches, the same way the moderator decisions are learned later.
+    for start in range(0, len(X), size):
+        partial_fit(nb, X[start:start + size], y[start:start + size])
+
+    return nb
+
+
+def save_model(nb, model):
+    # Replaced at once so that processes do not load a partial file.
+    tmp = f"{model}.{os.getpid()}.tmp"
+    dump(nb, tmp)
+    os.replace(tmp, model)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Serializes the model updates of all processes.
+    """
+    with open(f"{path}.lock", "w") as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
 
-def evaluate_model(fname, model):
+
+def learn(decisions, model):
+    """
+    Learns the (content, label) decisions on the latest saved model and saves it, returns the number learned.
+    """
+    if not decisions:
+        return 0
+
+    try:
+        with file_lock(model):
+            # Another process may have saved its decisions meanwhile.
+            nb = MODELS.get(model)
+            if nb is None and has_sklearn:
+                nb = online_model()
+            if nb is None or not incremental(nb):
+                logger.warning(f"spam model cannot learn, rebuild it: {model}")
+                return 0
+
+            # The loaded model may be classifying in other threads.
+            nb = copy.deepcopy(nb)
+            X, y = zip(*decisions)
+            partial_fit(nb, list(X), [int(label) for label in y])
+            save_model(nb, model)
+    except Exception as exc:
+        logger.error(f"error updating spam model: {exc}")
+        return 0
+
+    logger.info(f"spam model learned {len(decisions)} decisions")
+    return len(decisions)
+
+
+def evaluate_model(fname, holdout=0.25):
 
     X, y = parse_file(fname=fname)
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=holdout)
 
-    if model:
-        nb = load_model(model)
-    else:
-        nb = fit_model(X_train, y_train)
+    # A saved model may have seen the holdout, a new one is fitted on the training split.
+    nb = fit_model(X_train, y_train)
 
     y_pred = nb.predict(X_test)
     rep = classification_report(y_test, y_pred)
 
+    print(f"holdout: {len(y_test)} of {len(y)}, accuracy: {accuracy_score(y_test, y_pred):.3f}")
     print(rep)
 
 
@@ -132,7 +310,7 @@ def build_model(fname, model):
     # Save the model.
     if model:
         logger.info(f"saving model to: {model}")
-        dump(nb, model)
+        save_model(nb, model)
 
     return nb
 
@@ -140,16 +318,17 @@ def build_model(fname, model):
 
 @plac.pos('fname')
 @plac.flg('build')
-@plac.flg('eval_', help="evaluate model ")
+@plac.flg('eval_', help="evaluate a model fitted on the training split")
 @plac.opt('model')
 @plac.flg('classify')
-def main(classify, build, model, eval_, fname):
+@plac.opt('holdout', help="fraction of the data held out for evaluation", type=float)
+def main(classify, build, model, eval_, fname, holdout=0.25):
 
     if build:
         build_model(fname=fname, model=model)
 
     if eval_:
-        evaluate_model(fname=fname, model=model)
+        evaluate_model(fname=fname, holdout=holdout)
 
     if classify:
         content = open(fname, 'rt').read()
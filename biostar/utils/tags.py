@@ -0,0 +1,112 @@
+"""
+Synchronizes taggit tags with bulk queries.
+
+The taggit manager methods (clear, add, remove) run one query per tag,
+these helpers diff the old and new tag sets and only write the changes.
+"""
+import logging
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from taggit.models import Tag
+
+logger = logging.getLogger('engine')
+
+
+def unique(names):
+    """
+    Returns the non-empty names without duplicates, keeping the order.
+    """
+    names = (name.strip() for name in names)
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def get_tags(names):
+    """
+    Returns a dictionary of tags keyed by name, creates the missing tags in bulk.
+    """
+    names = unique(names)
+    if not names:
+        return {}
+
+    found = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = [name for name in names if name not in found]
+
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name, slug=Tag().slugify(name)) for name in missing],
+                                ignore_conflicts=True)
+        found.update((tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+
+    # Different names may map to the same slug, taggit resolves those one by one.
+    for name in missing:
+        if name not in found:
+            found[name] = Tag.objects.get_or_create(name=name)[0]
+
+    return found
+
+
+def bulk_set_tags(items, field="tags"):
+    """
+    Sets the tags on a list of (instance, names) pairs of the same model.
+    Only the tags that changed are inserted or deleted.
+    Returns the number of instances that were changed.
+    """
+    items = [(obj, unique(names)) for obj, names in items]
+    if not items:
+        return 0
+
+    model = type(items[0][0])
+    through = model._meta.get_field(field).through
+    ctype = ContentType.objects.get_for_model(model)
+
+    # The current tags for every instance.
+    current = {}
+    rows = through.objects.filter(content_type=ctype, object_id__in=[obj.pk for obj, names in items])
+    for pk, obj_id, name in rows.values_list("id", "object_id", "tag__name"):
+        current.setdefault(obj_id, {})[name] = pk
+
+    # Only changed instances are updated.
+    changed = [(obj, names) for obj, names in items if set(names) != set(current.get(obj.pk, {}))]
+    if not changed:
+        return 0
+
+    tags = get_tags(name for obj, names in changed for name in names)
+
+    added, removed = [], []
+    for obj, names in changed:
+        existing = current.get(obj.pk, {})
+        added.extend(through(content_type=ctype, object_id=obj.pk, tag=tags[name])
+                     for name in names if name not in existing)
+        removed.extend(pk for name, pk in existing.items() if name not in names)
+
+    with transaction.atomic():
+        through.objects.filter(pk__in=removed).delete()
+        through.objects.bulk_create(added, ignore_conflicts=True)
+
+    return len(changed)
+
+
+def set_tags(obj, names, field="tags"):
+    """
+    Sets the tags of a single instance, does nothing when the tags did not change.
+    Returns True if the tags changed.
+    """
+    return bool(bulk_set_tags([(obj, names)], field=field))
+
+
+def batch_set_tags(stream, field="tags", size=1000):
+    """
+    Sets the tags for a stream of (instance, names) pairs, one transaction per batch.
+    Returns the number of instances that were changed.
+    """
+    stream = iter(stream)
+    total = 0
+    while True:
+        batch = list(islice(stream, size))
+        if not batch:
+            break
+        with transaction.atomic():
+            total += bulk_set_tags(batch, field=field)
+
+    return total
@@ -0,0 +1,163 @@
+"""
+Collects run statistics for the tasks and timers.
+
+Each run appends a record to a bounded deque, appends are thread safe and
+do not take a lock. The records are summarized per task and written to the
+TaskStat table every TASK_STATS_FLUSH seconds by the timers and the task
+workers, never by the runs themselves, and once more when the process exits.
+"""
+import atexit
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger('engine')
+
+# Upper bounds of the duration buckets, in seconds.
+BUCKETS = [0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300]
+
+# The runs not yet flushed: (name, duration, wait, failed)
+RECORDS = deque(maxlen=100000)
+
+# Only one thread flushes at a time.
+FLUSH_LOCK = threading.Lock()
+
+LAST_FLUSH = [time.time()]
+
+# Set once the statistics table is known to exist.
+TABLE_READY = []
+
+
+def instrument(func):
+    """
+    Records the duration, the queue wait and the failures of each run.
+    The wait is measured from the _queued timestamp added when spooling.
+    """
+    name = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def inner(*args, _queued=None, **kwargs):
+        start = time.time()
+        wait = max(start - _queued, 0) if _queued else 0
+        failed = True
+        try:
+            val = func(*args, **kwargs)
+            failed = False
+            return val
+        finally:
+            record(name=name, duration=time.time() - start, wait=wait, failed=failed)
+
+    return inner
+
+
+def record(name, duration, wait=0, failed=False):
+    RECORDS.append((name, duration, wait, failed))
+
+
+def due():
+    """
+    True when there are records older than the flush interval.
+    """
+    interval = settings.TASK_STATS_FLUSH
+    return bool(interval and RECORDS and time.time() - LAST_FLUSH[0] > interval)
+
+
+def flush_due():
+    """
+    Flushes when due, called by the timers and the task workers between runs.
+    """
+    if due():
+        flush()
+
+
+def table_ready(model):
+    """
+    True when the table exists, the process may run before the migrations.
+    """
+    if not TABLE_READY:
+        from django.db import connection
+        if model._meta.db_table in connection.introspection.table_names():
+            TABLE_READY.append(True)
+    return bool(TABLE_READY)
+
+
+def summarize(records):
+    """
+    Returns the statistics of the records keyed by task name.
+    """
+    stats = {}
+    for name, duration, wait, failed in records:
+        item = stats.setdefault(name, dict(count=0, failed=0, total=0, longest=0, wait=0,
+                                           hist=[0] * (len(BUCKETS) + 1)))
+        item['count'] += 1
+        item['failed'] += int(failed)
+        item['total'] += duration
+        item['longest'] = max(item['longest'], duration)
+        item['wait'] += wait
+        item['hist'][bisect.bisect_left(BUCKETS, duration)] += 1
+    return stats
+
+
+def flush():
+    """
+    Writes the collected statistics to the database.
+    Returns the number of runs written.
+    """
+    if not FLUSH_LOCK.acquire(blocking=False):
+        return 0
+
+    try:
+        LAST_FLUSH[0] = time.time()
+
+        if not RECORDS:
+            return 0
+
+        # Imported here, the tasks are decorated before the models are loaded.
+        from biostar.accounts import util
+        from biostar.accounts.models import TaskStat
+
+        if not table_ready(TaskStat):
+            return 0
+
+        records = []
+        while RECORDS:
+            records.append(RECORDS.popleft())
+
+        now = util.now()
+        stats = [TaskStat(name=name, count=item['count'], failed=item['failed'], total=item['total'],
+                          longest=item['longest'], wait=item['wait'], hist=json.dumps(item['hist']), date=now)
+                 for name, item in summarize(records).items()]
+        TaskStat.objects.bulk_create(stats)
+
+        return len(records)
+
+    except Exception as exc:
+        logger.error(f"error flushing task statistics: {exc}")
+        return 0
+
+    finally:
+        FLUSH_LOCK.release()
+
+
+def percentile(hist, fraction):
+    """
+    Returns the upper bound of the bucket that holds the fraction of the runs.
+    """
+    target = sum(hist) * fraction
+    seen = 0
+    for bound, count in zip(BUCKETS + [float('inf')], hist):
+        seen += count
+        if count and seen >= target:
+            return bound
+    return 0
+
+
+# Write the remaining statistics when the process exits.
+if settings.TASK_STATS_FLUSH:
+    atexit.register(flush)